@@ -0,0 +1,192 @@
+import pandas as pd
+from pathlib import Path
+
+from typing import Dict, List
+from tabulate import tabulate
+from helpful_funcs import read_json_file_to_dict
+from helpful_funcs import project_tables_columns_from_documents
+from json_data_parser_funcs import MATCHES_TABLES_SPECS
+
+# pyarrow is only needed by the arrow transform backend, the rest of the ETL works without it
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+# NOTE: this is the arrow counterpart of `parse_and_process_matches_dict`, it projects the same tables (`MATCHES_TABLES_SPECS`)
+# into typed `pyarrow.Table`s instead of dataframes: the integer columns get the exact width of their SQL columns (`int` -> int32),
+# and the repeated strings (team, stadium, referee and manager names) are dictionary encoded, so there are no object columns
+# to downcast after the fact, and the tables can be uploaded without converting them back to python objects (see mysql_db_funcs.py).
+
+# the arrow type of each column of the matches tables (matching the columns in sql_files/database_schema_creation_commands.sql),
+# (column name -> type name), the type names are mapped to arrow types by `get_arrow_type`
+MATCHES_ARROW_COLUMNS_TYPES = {'match_id': 'int32',
+                               'home_score': 'int32',
+                               'away_score': 'int32',
+                               'match_week': 'int32',
+                               'competition_id': 'int32',
+                               'season_id': 'int32',
+                               'home_team_id': 'int32',
+                               'away_team_id': 'int32',
+                               'competition_stage_id': 'int32',
+                               'stadium_id': 'int32',
+                               'referee_id': 'int32',
+                               'match_date': 'string',
+                               'kick_off': 'string',
+                               'competition_stage_name': 'dictionary',
+                               'stadium_name': 'dictionary',
+                               'referee_name': 'dictionary',
+                               'team_id': 'int32',
+                               'team_name': 'dictionary',
+                               'team_gender': 'dictionary',
+                               'manager_id': 'int32',
+                               'manager_name': 'dictionary',
+                               'manager_nickname': 'dictionary',
+                               'manager_dob': 'string',
+                               'country_id': 'int32',
+                               'country_name': 'dictionary'}
+
+
+def get_arrow_type(type_name:str) -> 'pa.DataType':
+    """
+    Maps a type name (as used in `MATCHES_ARROW_COLUMNS_TYPES`) to its arrow type,
+    the strings that repeat a lot (e.g. names) are dictionary encoded.
+    """
+    if pa is None:
+        raise ImportError('the arrow transform backend needs pyarrow, install it with `pip install pyarrow`')
+    arrow_types = {'int32': pa.int32(),
+                   'string': pa.string(),
+                   'dictionary': pa.dictionary(pa.int32(), pa.string())}
+    return arrow_types[type_name]
+
+
+def deduplicate_arrow_table(table:'pa.Table', key_columns:List[str]) -> 'pa.Table':
+    """
+    Drops the rows of an arrow table that have the same key as a previous row (keeping the first row, like `drop_duplicates`),
+    missing keys are considered equal to each other.
+    """
+    table = table.unify_dictionaries()
+    rows_indices = table.select(key_columns).append_column('row_index', pa.array(range(table.num_rows), type=pa.int64()))
+    first_rows_indices = rows_indices.group_by(key_columns, use_threads=False).aggregate([('row_index', 'min')])['row_index_min']
+    return table.take(pc.take(first_rows_indices, pc.sort_indices(first_rows_indices)))
+
+
+def drop_empty_rows_arrow_table(table:'pa.Table') -> 'pa.Table':
+    """
+    Drops the rows of an arrow table where all the values are missing (like `dropna(how='all')`).
+    """
+    if table.num_columns == 0 or table.num_rows == 0:
+        return table
+    has_values = pc.is_valid(table.column(0))
+    for column in table.columns[1:]:
+        has_values = pc.or_(has_values, pc.is_valid(column))
+    return table.filter(has_values)
+
+
+def project_arrow_tables_from_documents(documents:List[dict],
+                                        tables_specs:Dict[str, dict],
+                                        columns_types:Dict[str, str]) -> Dict[str, 'pa.Table']:
+    """
+    The arrow counterpart of `project_tables_from_documents`, it builds mutiple typed arrow tables from a list of (nested) documents,
+    as described by a table spec per table (the `downcast` option is ignored, as the columns are already typed).
+
+    ## Parameters
+    documents: List[dict]
+        Documents to build the tables from
+    tables_specs: Dict[str, dict]
+        Dictionary mapping each output table name to its table spec (see `project_tables_from_documents`)
+    columns_types: Dict[str, str]
+        Dictionary mapping each column name to its type name (see `get_arrow_type`)
+
+    ## Returns
+    Dict[str, pa.Table]
+        Dictionary with an arrow table per table spec (in the same order)
+    """
+    dict_return = {}
+    for table_name, sources_columns in project_tables_columns_from_documents(documents, tables_specs).items():
+        source_tables = []
+        for columns in sources_columns:
+            source_tables.append(pa.table({col_name: pa.array(values, type=get_arrow_type(columns_types[col_name]))
+                                           for col_name, values in columns.items()}))
+        table = pa.concat_tables(source_tables) if len(source_tables) > 1 else source_tables[0]
+        dict_return[table_name] = deduplicate_arrow_table(table, tables_specs[table_name]['key'])
+    return dict_return
+
+
+def extract_countries_lookup_arrow_table(tables_dict:Dict[str, 'pa.Table']) -> 'pa.Table':
+    """
+    The arrow counterpart of `extract_countries_lookup_table`, it collects the (country id, country name) pairs of all the tables
+    into a single deduplicated countries table, and drops the `country_name` column from these tables (in the dictionary).
+    """
+    countries_tables = []
+    for table_name, table in tables_dict.items():
+        if 'country_id' not in table.column_names:
+            continue
+        countries_tables.append(table.select(['country_id', 'country_name']))
+        tables_dict[table_name] = table.drop(['country_name'])
+    if not(countries_tables):
+        return pa.table({'country_id': pa.array([], type=get_arrow_type('int32')),
+                         'country_name': pa.array([], type=get_arrow_type('dictionary'))})
+    return deduplicate_arrow_table(pa.concat_tables(countries_tables), ['country_id', 'country_name'])
+
+
+def parse_and_process_matches_to_arrow(matches_dicts:List[dict]) -> Dict[str, 'pa.Table']:
+    """
+    This function parses and processes a list of matches documents into typed arrow tables,
+    it produces the same tables (and rows) as `parse_and_process_matches_dict`, with these column types:
+    - the integer columns are int32 (the `int` columns in the SQL schema), with missing values instead of floats
+    - the names are dictionary encoded strings
+    - `match_datetime` is a timestamp (in seconds), and `manager_dob` is a date
+
+    ## Parameters
+    - matches_dicts: List[dict]
+        List of dictionaries with the matches data
+
+    ## Returns
+    - Dict[str, pa.Table]: Dictionary with the output arrow tables
+      (`df_matches`, `df_competition_stages`, `df_stadiums`, `df_referees`, `df_team_base_info`,
+      `df_team_managers_matches`, `df_managers_base_data`, `df_countries`)
+    """
+    tables_dict = project_arrow_tables_from_documents(matches_dicts, MATCHES_TABLES_SPECS, MATCHES_ARROW_COLUMNS_TYPES)
+
+    # match_date and kick_off are in different fields, we need to combine them into one column
+    # (the kick off times can have milliseconds, e.g. `20:00:00.000`, which are dropped)
+    matches_table = tables_dict['df_matches']
+    match_datetime = pc.strptime(pc.binary_join_element_wise(matches_table['match_date'],
+                                                              pc.utf8_slice_codeunits(matches_table['kick_off'], 0, 8),
+                                                              ' '),
+                                 format='%Y-%m-%d %H:%M:%S', unit='s')
+    tables_dict['df_matches'] = matches_table.drop(['match_date', 'kick_off']).append_column('match_datetime', match_datetime)
+
+    managers_table = tables_dict['df_managers_base_data']
+    manager_dob = pc.cast(pc.strptime(managers_table['manager_dob'], format='%Y-%m-%d', unit='s'), pa.date32())
+    tables_dict['df_managers_base_data'] = managers_table.set_column(managers_table.column_names.index('manager_dob'),
+                                                                     'manager_dob', manager_dob)
+
+    # generating the countries lookup table
+    tables_dict['df_countries'] = extract_countries_lookup_arrow_table(tables_dict)
+
+    for table_name, table in tables_dict.items():
+        tables_dict[table_name] = drop_empty_rows_arrow_table(table)
+    return tables_dict
+
+
+def arrow_tables_dict_to_dframes_dict(tables_dict:Dict[str, object]) -> Dict[str, pd.DataFrame]:
+    """
+    Converts the arrow tables of a dictionary to dataframes (the dataframes in it are left as is),
+    e.g. to combine the small lookup tables with the ones of the other collections.
+    """
+    return {table_name: (table.to_pandas() if pa is not None and isinstance(table, pa.Table) else table)
+            for table_name, table in tables_dict.items()}
+
+
+if __name__ == "__main__":
+    matches_json_path = Path().cwd().parent / "data" / "matches" / "2" / "44.json"
+    matches_dicts = read_json_file_to_dict(matches_json_path)
+    matches_tables_dict = parse_and_process_matches_to_arrow(matches_dicts)
+    for table_name, table in matches_tables_dict.items():
+        print(table_name)
+        print(table.schema)
+        print(tabulate(table.slice(0, 5).to_pandas(), headers='keys', tablefmt='psql'))
@@ -0,0 +1,475 @@
+import asyncio
+import pandas as pd
+import sqlalchemy
+
+from pathlib import Path
+from tabulate import tabulate
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from helpful_funcs import read_json_file_to_dict
+
+from json_data_parser_funcs import parse_and_process_competitions_dict
+from json_data_parser_funcs import parse_and_process_matches_dict
+from json_data_parser_funcs import normalize_countries_field_df_competitions
+from json_data_parser_funcs import concat_and_deduplicate_dframes_dicts
+from json_data_parser_funcs import MATCHES_FACT_TABLES
+from json_data_parser_funcs import MATCHES_PROJECTION
+
+from events_parser_funcs import parse_and_process_events
+from events_parser_funcs import EVENTS_FACT_TABLES
+from events_parser_funcs import EVENTS_PROJECTION
+
+from lineups_parser_funcs import parse_and_process_lineups
+from lineups_parser_funcs import LINEUPS_FACT_TABLES
+from lineups_parser_funcs import LINEUPS_LOOKUP_TABLES_KEYS
+from lineups_parser_funcs import LINEUPS_PROJECTION
+
+from arrow_parser_funcs import parse_and_process_matches_to_arrow
+from arrow_parser_funcs import arrow_tables_dict_to_dframes_dict
+
+from mysql_db_funcs import read_sql_commands_from_file
+from mysql_db_funcs import run_sql_commands
+from mysql_db_funcs import upload_dataframe_to_sql_table
+
+from pipeline_metrics import measure_stage
+
+# motor (the asyncio mongodb driver) is only needed by the async runner, the rest of the ETL works without it
+try:
+    import motor.motor_asyncio
+except ImportError:
+    motor = None
+
+# SQLAlchemy's async engine needs greenlet (`pip install sqlalchemy[asyncio]`), and an async MySQL driver (see `ASYNC_MYSQL_DRIVERS`)
+try:
+    import sqlalchemy.ext.asyncio as sqlalchemy_asyncio
+except ImportError:
+    sqlalchemy_asyncio = None
+
+# NOTE: the async runner (`--async-io`) runs a full load on a single asyncio event loop, instead of blocking on each cursor
+# round trip and each insert: the collections are streamed with motor cursors (at most `max_cursors` of them in flight at once),
+# and each batch is transformed in a thread (so the event loop keeps serving the cursors and the inserts meanwhile),
+# then its fact tables are inserted over the connections of an async SQLAlchemy engine (at most `max_inserts` of them at once).
+# the inserts are the backpressure: a collection only transforms its next batch once one of the inserts is done,
+# so at most `max_inserts` batches of tables are waiting to be uploaded, whatever the size of the collections.
+# the upload strategies are the same as the sync load (see `upload_dataframe_to_sql_table`), they run inside `run_sync`,
+# where SQLAlchemy awaits the async driver for each statement, so the CPU work of an upload (converting the rows) still holds the loop.
+# the lookup tables are uploaded (deduplicated) once all the collections are streamed, and the foreign keys are created at the end,
+# as in the parallel load mode.
+
+# the async MySQL drivers supported by SQLAlchemy's async engine, the connection string of the mysql creds is switched to one of them
+ASYNC_MYSQL_DRIVERS = ['aiomysql', 'asyncmy']
+
+# the fact tables (uploaded batch by batch) and the projection of each streamed collection, its parse function depends on the run
+STREAMED_COLLECTIONS = {'matches': (MATCHES_FACT_TABLES, MATCHES_PROJECTION),
+                        'events': (EVENTS_FACT_TABLES, EVENTS_PROJECTION),
+                        'lineups': (LINEUPS_FACT_TABLES, LINEUPS_PROJECTION)}
+
+
+def connect_to_mongo_database_async(creds_json_file_path:Path=None) -> 'motor.motor_asyncio.AsyncIOMotorDatabase':
+    """
+    The same as `connect_to_mongo_database`, with a motor client, whose queries are awaited on the event loop.
+
+    ## Parameters
+    creds_json_file_path: Path
+        Path to the json file with the credentials to connect to the mongodb database
+
+    ## Returns
+    motor.motor_asyncio.AsyncIOMotorDatabase
+        Database object to query the mongodb database
+    """
+    if motor is None:
+        raise ImportError('the async runner needs motor, install it with `pip install motor`')
+    if creds_json_file_path is None:
+        creds_json_file_path = Path().cwd() / 'creds' / 'mongodb_creds.json'
+    connection_string = read_json_file_to_dict(creds_json_file_path)['connection_string']
+    client = motor.motor_asyncio.AsyncIOMotorClient(connection_string)
+    return client.statsbomb
+
+
+def create_async_sql_db_engine(creds_file_path:Path=None,
+                               driver:str='aiomysql',
+                               local_infile:bool=False,
+                               pool_size:int=5) -> 'sqlalchemy_asyncio.AsyncEngine':
+    """
+    The same as `create_sql_db_engine`, with an async engine, the driver of the connection string is replaced by an async one
+    (e.g. `mysql+pymysql://...` -> `mysql+aiomysql://...`).
+
+    ## Parameters
+    creds_file_path: Path
+        Path to the json file containing the credentials for the MySQL database
+    driver: str, default='aiomysql'
+        The async driver of the engine (see `ASYNC_MYSQL_DRIVERS`)
+    local_infile: bool, default=False
+        Whether to allow `LOAD DATA LOCAL INFILE` on the connections (needed by the `bulk` upload strategy)
+    pool_size: int, default=5
+        The number of connections kept open in the pool
+
+    ## Returns
+    sqlalchemy.ext.asyncio.AsyncEngine
+        An async engine for the MySQL database
+    """
+    if sqlalchemy_asyncio is None:
+        raise ImportError('the async runner needs greenlet and an async MySQL driver, install them with `pip install sqlalchemy[asyncio] aiomysql`')
+    if creds_file_path is None:
+        creds_file_path = Path().cwd() / 'creds' / 'mysql_creds.json'
+    connection_url = sqlalchemy.engine.make_url(read_json_file_to_dict(creds_file_path)['connection_string'])
+    connection_url = connection_url.set(drivername=f'{connection_url.get_backend_name()}+{driver}')
+    connect_args = {'local_infile': True} if local_infile else {}
+    return sqlalchemy_asyncio.create_async_engine(connection_url, connect_args=connect_args, pool_size=pool_size)
+
+
+async def stream_collection_in_batches_async(collection:'motor.motor_asyncio.AsyncIOMotorCollection',
+                                             docs_per_batch:int=5_000,
+                                             cursor_batch_size:int=1_000,
+                                             projection:dict=None,
+                                             query:dict=None) -> AsyncIterator[List[dict]]:
+    """
+    The same as `stream_collection_in_batches`, with a motor cursor, the event loop runs the other tasks while a batch is fetched.
+
+    ## Parameters
+    collection: motor.motor_asyncio.AsyncIOMotorCollection
+        Collection to download from the mongodb database
+    docs_per_batch: int, default=5_000
+        Number of documents in each yielded batch
+    cursor_batch_size: int, default=1_000
+        Number of documents the cursor fetches from the server per round trip
+    projection: dict, default=None
+        Projection to apply to the documents (default is all the fields except `_id`)
+    query: dict, default=None
+        Filter to apply to the documents (default is all the documents)
+
+    ## Yields
+    List[dict]
+        Batch of (at most `docs_per_batch`) dictionaries with the contents of the collection
+    """
+    if docs_per_batch < 1:
+        raise ValueError('docs_per_batch should be a positive integer')
+    if projection is None:
+        projection = {'_id': False}
+    if query is None:
+        query = {}
+    docs_cursor = collection.find(query, projection, batch_size=cursor_batch_size)
+    try:
+        docs_batch = []
+        async for doc in docs_cursor:
+            docs_batch.append(doc)
+            if len(docs_batch) == docs_per_batch:
+                yield docs_batch
+                docs_batch = []
+        if docs_batch:
+            yield docs_batch
+    finally:
+        await docs_cursor.close()
+
+
+async def upload_dataframe_to_sql_table_async(dframe:pd.DataFrame,
+                                              sql_table_name:str,
+                                              engine:'sqlalchemy_asyncio.AsyncEngine',
+                                              chunksize:int=None,
+                                              strategy:str='to_sql') -> int:
+    """
+    Uploads (and commits) a dataframe in its own transaction, over a connection of the async engine's pool
+    (see `upload_dataframe_to_sql_table`).
+
+    ## Parameters
+    dframe: pd.DataFrame
+        The dataframe (or arrow table) to upload
+    sql_table_name: str
+        The name of the table in the MySQL database
+    engine: sqlalchemy.ext.asyncio.AsyncEngine
+        The async engine of the MySQL database
+    chunksize: int, default=None
+        Passed to `upload_dataframe_to_sql_table`
+    strategy: str, default='to_sql'
+        Passed to `upload_dataframe_to_sql_table`
+
+    ## Returns
+    int
+        The number of uploaded rows
+    """
+    async with engine.begin() as connection:
+        return await connection.run_sync(lambda sync_connection: upload_dataframe_to_sql_table(dframe, sql_table_name, sync_connection,
+                                                                                               chunksize=chunksize, strategy=strategy))
+
+
+class AsyncTablesUploader:
+    """
+    Uploads tables concurrently on the event loop, with at most `max_inserts` uploads in flight,
+    and keeps the timing of each table (summed over its uploads, e.g. the batches of a fact table).
+    """
+    def __init__(self, engine:'sqlalchemy_asyncio.AsyncEngine', max_inserts:int, chunksize:int=None, strategy:str='to_sql'):
+        self.engine = engine
+        self.chunksize = chunksize
+        self.strategy = strategy
+        self.inserts_semaphore = asyncio.Semaphore(max_inserts)
+        self.running_uploads = set()
+        self.tables_timings = {}
+        self.load_start_time = perf_counter()
+
+    async def upload_table(self, dframe:pd.DataFrame, sql_table_name:str) -> None:
+        """
+        Starts uploading a table as soon as fewer than `max_inserts` uploads are running, and returns without waiting for it,
+        the error of an upload that already failed is raised here (or by `wait_for_uploads`), so the collections stop streaming.
+        """
+        for upload_task in [upload_task for upload_task in self.running_uploads if upload_task.done()]:
+            self.running_uploads.discard(upload_task)
+            upload_task.result()
+        await self.inserts_semaphore.acquire()
+        upload_task = asyncio.create_task(self.run_upload(dframe, sql_table_name))
+        self.running_uploads.add(upload_task)
+
+    async def run_upload(self, dframe:pd.DataFrame, sql_table_name:str) -> None:
+        """
+        Uploads a table (the task started by `upload_table`), and adds its timing to the timing of the table.
+        """
+        try:
+            upload_start_time = perf_counter()
+            rows_count = await upload_dataframe_to_sql_table_async(dframe, sql_table_name, self.engine,
+                                                                   chunksize=self.chunksize, strategy=self.strategy)
+            upload_end_time = perf_counter()
+            table_timing = self.tables_timings.setdefault(sql_table_name, {'table': sql_table_name,
+                                                                            'uploads': 0,
+                                                                            'rows': 0,
+                                                                            'started at': round(upload_start_time - self.load_start_time, 3),
+                                                                            'seconds': 0})
+            table_timing['uploads'] += 1
+            table_timing['rows'] += rows_count
+            table_timing['ended at'] = round(upload_end_time - self.load_start_time, 3)
+            table_timing['seconds'] = round(table_timing['seconds'] + upload_end_time - upload_start_time, 3)
+        finally:
+            self.inserts_semaphore.release()
+
+    async def wait_for_uploads(self) -> None:
+        """
+        Waits for the running uploads, and raises the first upload error (if any) once all of them are done.
+        """
+        running_uploads, self.running_uploads = self.running_uploads, set()
+        uploads_results = await asyncio.gather(*running_uploads, return_exceptions=True)
+        for upload_result in uploads_results:
+            if isinstance(upload_result, BaseException):
+                raise upload_result
+
+    def report_tables_timings(self) -> None:
+        """
+        Prints the timing of each table (uploads, rows, start and end offset from the start of the load, and seconds).
+        """
+        print(tabulate(list(self.tables_timings.values()), headers='keys', tablefmt='psql'))
+
+
+def transform_docs_batch(parse_func:Callable[[List[dict]], Dict[str, Any]],
+                         docs_batch:List[dict],
+                         collection_name:str) -> Dict[str, Any]:
+    """
+    Parses a batch of documents (in the thread it's called from), and measures the transform stage.
+    """
+    with measure_stage('transform', collection=collection_name, function=parse_func.__name__) as stage_metrics:
+        batch_tables_dict = parse_func(docs_batch)
+        stage_metrics['rows'] = len(docs_batch)
+    return batch_tables_dict
+
+
+async def stream_transform_and_upload_collection(collection:'motor.motor_asyncio.AsyncIOMotorCollection',
+                                                 parse_func:Callable[[List[dict]], Dict[str, Any]],
+                                                 fact_tables:List[str],
+                                                 projection:dict,
+                                                 tables_uploader:AsyncTablesUploader,
+                                                 cursors_semaphore:asyncio.Semaphore,
+                                                 docs_per_batch:int,
+                                                 cursor_batch_size:int) -> List[Dict[str, Any]]:
+    """
+    Streams a collection in batches (once one of the `max_cursors` cursors is free), parses each batch in a thread,
+    and starts uploading its fact tables (see `AsyncTablesUploader`), the async counterpart of `parse_and_upload_docs_batches`.
+
+    ## Parameters
+    collection: motor.motor_asyncio.AsyncIOMotorCollection
+        Collection to stream from the mongodb database
+    parse_func: Callable[[List[dict]], Dict[str, Any]]
+        Function that parses a batch of documents into a dictionary of tables (e.g. `parse_and_process_matches_dict`)
+    fact_tables: List[str]
+        The tables uploaded batch by batch
+    projection: dict
+        Projection to apply to the documents
+    tables_uploader: AsyncTablesUploader
+        The uploader of the tables
+    cursors_semaphore: asyncio.Semaphore
+        Limits the number of cursors streamed at once
+    docs_per_batch: int
+        Number of documents processed and uploaded at a time
+    cursor_batch_size: int
+        Number of documents the cursor fetches per round trip
+
+    ## Returns
+    List[Dict[str, Any]]
+        The tables that weren't uploaded (the lookup tables), one dictionary per batch
+    """
+    remaining_tables_dicts = []
+    async with cursors_semaphore:
+        docs_batches = stream_collection_in_batches_async(collection,
+                                                          docs_per_batch=docs_per_batch,
+                                                          cursor_batch_size=cursor_batch_size,
+                                                          projection=projection)
+        batch_number = 0
+        while True:
+            # the extract stage of each batch is the time spent waiting for it (the cursor round trips)
+            with measure_stage('extract', collection=collection.name) as stage_metrics:
+                docs_batch = await anext(docs_batches, None)
+                if docs_batch is None:
+                    stage_metrics['discard'] = True
+                else:
+                    stage_metrics['rows'] = len(docs_batch)
+            if docs_batch is None:
+                break
+            batch_number += 1
+            print(f'processing {collection.name} batch {batch_number} ({len(docs_batch)} documents)')
+            batch_tables_dict = await asyncio.to_thread(transform_docs_batch, parse_func, docs_batch, collection.name)
+            for table_name in fact_tables:
+                print(f'uploading batch {batch_number} of table {table_name}')
+                await tables_uploader.upload_table(batch_tables_dict.pop(table_name), table_name.replace('df_', ''))
+            remaining_tables_dicts.append(batch_tables_dict)
+    return remaining_tables_dicts
+
+
+async def run_async_full_load(mongodb_db:'motor.motor_asyncio.AsyncIOMotorDatabase',
+                              mysql_engine:'sqlalchemy_asyncio.AsyncEngine',
+                              include_events:bool=False,
+                              include_lineups:bool=False,
+                              transform_backend:str='pandas',
+                              docs_per_batch:int=5_000,
+                              cursor_batch_size:int=1_000,
+                              upload_chunksize:int=None,
+                              upload_strategy:str='to_sql',
+                              max_cursors:int=4,
+                              max_inserts:int=4) -> Dict[str, pd.DataFrame]:
+    """
+    Runs a full load (drop, create and reload all the tables) on the event loop (see the note at the top of the module).
+
+    ## Parameters
+    mongodb_db: motor.motor_asyncio.AsyncIOMotorDatabase
+        The mongodb database
+    mysql_engine: sqlalchemy.ext.asyncio.AsyncEngine
+        The async engine of the MySQL database, its pool should hold at least `max_inserts` connections
+    include_events: bool, default=False
+        Whether to also extract, transform and load the events collection
+    include_lineups: bool, default=False
+        Whether to also extract, transform and load the lineups collection
+    transform_backend: str, default='pandas'
+        Transform the matches into dataframes (`pandas`) or into arrow tables (`arrow`)
+    docs_per_batch: int, default=5_000
+        Number of documents processed and uploaded at a time
+    cursor_batch_size: int, default=1_000
+        Number of documents each cursor fetches per round trip
+    upload_chunksize: int, default=None
+        Passed to `upload_dataframe_to_sql_table`
+    upload_strategy: str, default='to_sql'
+        Passed to `upload_dataframe_to_sql_table`
+    max_cursors: int, default=4
+        Number of collections streamed at once
+    max_inserts: int, default=4
+        Number of tables (or batches of a fact table) uploaded at once
+
+    ## Returns
+    Dict[str, pd.DataFrame]
+        The uploaded competitions and lookup tables (sql table name -> dataframe), e.g. to rebuild the dimension key index
+    """
+    print('reading database schema creation commands from file')
+    sql_database_config_commands = read_sql_commands_from_file(Path().cwd() / 'sql_files' / 'database_schema_creation_commands.sql')
+    sql_foreign_key_constraints_commands = read_sql_commands_from_file(Path().cwd() / 'sql_files' / 'database_foreign_keys.sql')
+    async with mysql_engine.connect() as mysql_connection:
+        await mysql_connection.run_sync(lambda sync_connection: run_sql_commands(sql_database_config_commands, sync_connection))
+
+    # the competitions are a single small batch, so they're downloaded while the other collections are streamed
+    async def extract_competitions() -> List[dict]:
+        with measure_stage('extract', collection='competitions') as stage_metrics:
+            print('downloading competitions collection from mongodb database')
+            competitions_dict = await mongodb_db.get_collection('competitions').find({}, {'_id': False}).to_list(length=None)
+            stage_metrics['rows'] = len(competitions_dict)
+        return competitions_dict
+
+    collections_parse_funcs = {'matches': parse_and_process_matches_dict if transform_backend == 'pandas' else parse_and_process_matches_to_arrow}
+    if include_events:
+        collections_parse_funcs['events'] = parse_and_process_events
+    if include_lineups:
+        collections_parse_funcs['lineups'] = parse_and_process_lineups
+    tables_uploader = AsyncTablesUploader(mysql_engine, max_inserts=max_inserts, chunksize=upload_chunksize, strategy=upload_strategy)
+    cursors_semaphore = asyncio.Semaphore(max_cursors)
+    print('starting upload of data to mysql database')
+    extract_tasks = [asyncio.create_task(extract_competitions())]
+    for collection_name, parse_func in collections_parse_funcs.items():
+        fact_tables, projection = STREAMED_COLLECTIONS[collection_name]
+        extract_tasks.append(asyncio.create_task(stream_transform_and_upload_collection(mongodb_db.get_collection(collection_name),
+                                                                                        parse_func=parse_func,
+                                                                                        fact_tables=fact_tables,
+                                                                                        projection=projection,
+                                                                                        tables_uploader=tables_uploader,
+                                                                                        cursors_semaphore=cursors_semaphore,
+                                                                                        docs_per_batch=docs_per_batch,
+                                                                                        cursor_batch_size=cursor_batch_size)))
+    try:
+        competitions_dict, matches_lookup_dframes_dicts, *other_lookup_dframes_dicts = await asyncio.gather(*extract_tasks)
+    except BaseException:
+        # a failed collection stops the other ones
+        for extract_task in extract_tasks:
+            extract_task.cancel()
+        raise
+    finally:
+        # the uploads already started are waited for, even when a collection failed, so no transaction is left open
+        await tables_uploader.wait_for_uploads()
+    with measure_stage('transform', collection='competitions', function='parse_and_process_competitions_dict') as stage_metrics:
+        competitions_dframes_dict = parse_and_process_competitions_dict(competitions_dict)
+        stage_metrics['rows'] = len(competitions_dict)
+
+    # the lookup tables shared between the collections (e.g. countries, positions) are combined into a single table
+    # (the arrow tables of the matches are small at this point, as the fact tables were already uploaded batch by batch)
+    lookup_dframes_dicts = [arrow_tables_dict_to_dframes_dict(tables_dict) for tables_dict in matches_lookup_dframes_dicts]
+    lookup_dframes_dicts += [tables_dict for collection_lookup_dframes_dicts in other_lookup_dframes_dicts for tables_dict in collection_lookup_dframes_dicts]
+    lookup_dframes_dict = concat_and_deduplicate_dframes_dicts(lookup_dframes_dicts, tables_key_columns=LINEUPS_LOOKUP_TABLES_KEYS)
+    competitions_dframes_dict['df_competitions'] = normalize_countries_field_df_competitions(competitions_dframes_dict['df_competitions'],
+                                                                                             lookup_dframes_dict['df_countries'])
+    sql_dframes_dict = {table_name.replace('df_', ''): dframe for table_name, dframe in {**competitions_dframes_dict, **lookup_dframes_dict}.items()}
+    for sql_table_name, dframe in sql_dframes_dict.items():
+        print(f'uploading table {sql_table_name}')
+        await tables_uploader.upload_table(dframe, sql_table_name)
+    await tables_uploader.wait_for_uploads()
+    tables_uploader.report_tables_timings()
+
+    print('creating foreign key constraints')
+    async with mysql_engine.connect() as mysql_connection:
+        await mysql_connection.run_sync(lambda sync_connection: run_sql_commands(sql_foreign_key_constraints_commands, sync_connection))
+    return sql_dframes_dict
+
+
+async def run_async_etl(mongodb_creds_file_path:Path=None,
+                        mysql_creds_file_path:Path=None,
+                        mysql_driver:str='aiomysql',
+                        **load_kwargs) -> Dict[str, pd.DataFrame]:
+    """
+    Connects to both databases, runs `run_async_full_load` (with `load_kwargs`), and closes the connections.
+
+    ## Parameters
+    mongodb_creds_file_path: Path, default=None
+        Passed to `connect_to_mongo_database_async`
+    mysql_creds_file_path: Path, default=None
+        Passed to `create_async_sql_db_engine`
+    mysql_driver: str, default='aiomysql'
+        The async MySQL driver (see `ASYNC_MYSQL_DRIVERS`)
+    **load_kwargs
+        Passed to `run_async_full_load`
+
+    ## Returns
+    Dict[str, pd.DataFrame]
+        The uploaded competitions and lookup tables (see `run_async_full_load`)
+    """
+    print('connecting to mongodb database')
+    mongodb_db = connect_to_mongo_database_async(mongodb_creds_file_path)
+    print('connecting to mysql database')
+    mysql_engine = create_async_sql_db_engine(mysql_creds_file_path,
+                                              driver=mysql_driver,
+                                              local_infile=(load_kwargs.get('upload_strategy') == 'bulk'),
+                                              pool_size=load_kwargs.get('max_inserts', 4) + 1)
+    try:
+        return await run_async_full_load(mongodb_db, mysql_engine, **load_kwargs)
+    finally:
+        print('closing mongodb connection')
+        mongodb_db.client.close()
+        await mysql_engine.dispose()
@@ -0,0 +1,306 @@
+# This module benchmarks the whole ETL (extract, transform and load of each collection) on synthetic data at mutiple scales
+# of the sample data (see synthetic_data_generator.py), loading into a local sqlite database (or any SQLAlchemy url, e.g. a local MySQL),
+# and writes a json report of the stages metrics (see pipeline_metrics.py) that can be compared with the report of another commit, e.g.:
+#   python benchmark_etl.py --scales 1 10 --collections matches lineups --report-file ../benchmarks/etl_report.json
+#   python benchmark_etl.py --scales 1 10 --collections matches lineups --baseline-report ../benchmarks/etl_report.json
+# the synthetic data only depends on the seed and the scale, so two reports with the same parameters ran the ETL on the same documents,
+# and the baseline comparison flags the stages whose throughput dropped by more than the threshold (and exits with an error code).
+# the extract stages are the time spent generating the synthetic documents, not reading them from mongodb.
+
+
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+# remove the SettingWithCopyWarning
+pd.options.mode.chained_assignment = None
+import sqlalchemy
+
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+from tabulate import tabulate
+from typing import List
+
+from json_data_parser_funcs import parse_and_process_competitions_dict
+from json_data_parser_funcs import parse_and_process_matches_dict
+from json_data_parser_funcs import normalize_countries_field_df_competitions
+from json_data_parser_funcs import concat_and_deduplicate_dframes_dicts
+from json_data_parser_funcs import MATCHES_FACT_TABLES
+from events_parser_funcs import parse_and_process_events
+from events_parser_funcs import EVENTS_FACT_TABLES
+from lineups_parser_funcs import parse_and_process_lineups
+from lineups_parser_funcs import LINEUPS_FACT_TABLES
+from lineups_parser_funcs import LINEUPS_LOOKUP_TABLES_KEYS
+from arrow_parser_funcs import parse_and_process_matches_to_arrow
+from arrow_parser_funcs import arrow_tables_dict_to_dframes_dict
+from mysql_db_funcs import run_sql_commands_from_file
+from mysql_db_funcs import upload_dataframe_to_sql_table
+from mysql_db_funcs import UPLOAD_STRATEGIES
+from pipeline_metrics import configure_pipeline_metrics
+from pipeline_metrics import measure_stage
+from pipeline_metrics import summarize_stages_metrics
+from synthetic_data_generator import stream_synthetic_collection_in_batches
+from local_file_source import DEFAULT_DATA_DIR
+from main import parse_and_upload_docs_batches
+from main import TRANSFORM_BACKENDS
+
+BENCHMARKED_COLLECTIONS = ['matches', 'lineups', 'events']
+
+SQL_SCHEMA_FILE_PATH = Path().cwd() / 'sql_files' / 'database_schema_creation_commands.sql'
+
+
+def create_benchmark_schema(connection:sqlalchemy.Connection, sql_commands_file_path:Path=SQL_SCHEMA_FILE_PATH) -> None:
+    """
+    (Re)creates the tables of the database schema in the benchmark database, with the schema creation commands as is for MySQL,
+    or without the MySQL specific parts for the other databases (the column comments, and the `SET` and `ALTER TABLE` commands).
+    The foreign keys aren't created, as the tables are loaded in the order of the sequential load mode (foreign keys at the end).
+    """
+    if connection.dialect.name == 'mysql':
+        run_sql_commands_from_file(sql_commands_file_path, connection)
+        return None
+    with open(sql_commands_file_path, 'r') as sql_commands_file:
+        sql_commands = sql_commands_file.read().split(';')[:-1]
+    for sql_command in sql_commands:
+        sql_command = re.sub(r"COMMENT\s*=?\s*'[^']*'", '', sql_command)
+        sql_command = re.sub(r'(?m)^\s*--.*$', '', sql_command)
+        sql_command = re.sub(r'/\*.*?\*/', '', sql_command, flags=re.S).strip()
+        if not(sql_command) or sql_command.upper().startswith(('SET', 'ALTER')):
+            continue
+        connection.execute(sqlalchemy.text(sql_command))
+    connection.commit()
+    return None
+
+
+def run_etl_benchmark(mysql_engine:sqlalchemy.Engine,
+                      scale:int,
+                      seed:int=0,
+                      collections_names:List[str]=None,
+                      data_dir:Path=None,
+                      docs_per_batch:int=5_000,
+                      upload_chunksize:int=10_000,
+                      upload_strategy:str='to_sql',
+                      transform_backend:str='pandas',
+                      pipeline_queue_size:int=0) -> dict:
+    """
+    Runs the ETL of the main script (sequential load mode) on the synthetic documents of the collections at a scale of the sample data,
+    and measures each of its stages.
+
+    ## Parameters
+    mysql_engine: sqlalchemy.Engine
+        The engine of the benchmark database, its tables are recreated
+    scale: int
+        Number of copies of the sample data
+    seed: int, default=0
+        Seed of the synthetic data
+    collections_names: List[str], default=None
+        The collections of `BENCHMARKED_COLLECTIONS` to benchmark (default is all of them), the competitions are always included
+    data_dir: Path, default=None
+        The data directory of the sample data
+    docs_per_batch: int, default=5_000
+        Number of documents transformed and uploaded at a time
+    upload_chunksize: int, default=10_000
+        Passed to `upload_dataframe_to_sql_table`
+    upload_strategy: str, default='to_sql'
+        Passed to `upload_dataframe_to_sql_table`
+    transform_backend: str, default='pandas'
+        The transform backend of the matches (see `TRANSFORM_BACKENDS`)
+    pipeline_queue_size: int, default=0
+        Passed to `parse_and_upload_docs_batches`, 0 runs the stages one after the other
+
+    ## Returns
+    dict
+        The scale, the total seconds of the run, and the metrics of its stages (see `summarize_stages_metrics`)
+    """
+    collections_names = collections_names or BENCHMARKED_COLLECTIONS
+    collections_parse_funcs = {'matches': parse_and_process_matches_dict if transform_backend == 'pandas' else parse_and_process_matches_to_arrow,
+                               'lineups': parse_and_process_lineups,
+                               'events': parse_and_process_events}
+    collections_fact_tables = {'matches': MATCHES_FACT_TABLES, 'lineups': LINEUPS_FACT_TABLES, 'events': EVENTS_FACT_TABLES}
+    configure_pipeline_metrics()
+    start_time = perf_counter()
+    with mysql_engine.connect() as mysql_connection:
+        create_benchmark_schema(mysql_connection)
+        with measure_stage('extract', collection='competitions') as stage_metrics:
+            competitions_dict = [doc for docs_batch in stream_synthetic_collection_in_batches('competitions', scale=scale, seed=seed, data_dir=data_dir)
+                                 for doc in docs_batch]
+            stage_metrics['rows'] = len(competitions_dict)
+        with measure_stage('transform', collection='competitions', function='parse_and_process_competitions_dict') as stage_metrics:
+            competitions_dframes_dict = parse_and_process_competitions_dict(competitions_dict)
+            stage_metrics['rows'] = len(competitions_dict)
+
+        lookup_dframes_dicts = []
+        for collection_name in BENCHMARKED_COLLECTIONS:
+            if collection_name not in collections_names:
+                continue
+            docs_batches = stream_synthetic_collection_in_batches(collection_name, scale=scale, seed=seed, data_dir=data_dir,
+                                                                  docs_per_batch=docs_per_batch)
+            collection_lookup_dframes_dicts = parse_and_upload_docs_batches(docs_batches,
+                                                                            collection_name=collection_name,
+                                                                            parse_func=collections_parse_funcs[collection_name],
+                                                                            fact_tables=collections_fact_tables[collection_name],
+                                                                            mysql_connection=mysql_connection,
+                                                                            upload_chunksize=upload_chunksize,
+                                                                            upload_strategy=upload_strategy,
+                                                                            pipeline_queue_size=pipeline_queue_size)
+            if collection_name == 'matches':
+                collection_lookup_dframes_dicts = [arrow_tables_dict_to_dframes_dict(tables_dict) for tables_dict in collection_lookup_dframes_dicts]
+            lookup_dframes_dicts.extend(collection_lookup_dframes_dicts)
+
+        with measure_stage('transform', function='concat_and_deduplicate_dframes_dicts'):
+            lookup_dframes_dict = concat_and_deduplicate_dframes_dicts(lookup_dframes_dicts, tables_key_columns=LINEUPS_LOOKUP_TABLES_KEYS)
+            if 'df_countries' in lookup_dframes_dict:
+                competitions_dframes_dict['df_competitions'] = normalize_countries_field_df_competitions(competitions_dframes_dict['df_competitions'],
+                                                                                                         lookup_dframes_dict['df_countries'])
+        for table_name, dframe in {**competitions_dframes_dict, **lookup_dframes_dict}.items():
+            upload_dataframe_to_sql_table(dframe, table_name.replace('df_', ''), mysql_connection,
+                                          chunksize=upload_chunksize, strategy=upload_strategy)
+        mysql_connection.commit()
+    return {'scale': scale,
+            'seconds': round(perf_counter() - start_time, 3),
+            'stages': summarize_stages_metrics()}
+
+
+def get_benchmark_environment(mysql_engine:sqlalchemy.Engine) -> dict:
+    """
+    Gets what the results of a benchmark depend on besides its parameters: the commit of the code, the versions of python and the libraries,
+    the machine, and the benchmark database, so the reports of different commits can be told apart (and compared on the same machine).
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        is_dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, is_dirty = None, None
+    return {'commit': commit,
+            'uncommitted changes': is_dirty,
+            'created at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': mysql_engine.dialect.name}
+
+
+def get_stage_key(scale:int, stage_summary:dict) -> str:
+    return f"{scale}x | {stage_summary['stage']} | {stage_summary['labels']}"
+
+
+def compare_with_baseline_report(report:dict,
+                                 baseline_report:dict,
+                                 regression_threshold:float=0.1,
+                                 min_seconds:float=0.1) -> List[dict]:
+    """
+    Compares the stages of a benchmark report with the same stages (same scale and labels) of a baseline report,
+    by their throughput (rows/sec), or by their wall time for the stages without rows.
+
+    ## Parameters
+    report: dict
+        The report of the current run
+    baseline_report: dict
+        The report of the baseline run (e.g. of the previous commit)
+    regression_threshold: float, default=0.1
+        A stage is a regression when it's slower than the baseline by more than this fraction (e.g. 0.1 -> 10% slower)
+    min_seconds: float, default=0.1
+        The stages that took less than this in the baseline are compared, but never flagged as regressions
+        (the small tables are loaded in a few milliseconds, and their timings are mostly noise)
+
+    ## Returns
+    List[dict]
+        A row per stage in both reports, with the baseline and current values, the change and whether it's a regression
+    """
+    baseline_stages = {get_stage_key(result['scale'], stage_summary): stage_summary
+                       for result in baseline_report['results'] for stage_summary in result['stages']}
+    comparison = []
+    for result in report['results']:
+        for stage_summary in result['stages']:
+            stage_key = get_stage_key(result['scale'], stage_summary)
+            if stage_key not in baseline_stages:
+                continue
+            baseline_summary = baseline_stages[stage_key]
+            if stage_summary['rows_per_sec'] and baseline_summary['rows_per_sec']:
+                metric, baseline_value, value = 'rows/sec', baseline_summary['rows_per_sec'], stage_summary['rows_per_sec']
+                slowdown = baseline_value / value - 1
+            else:
+                metric, baseline_value, value = 'seconds', baseline_summary['wall_seconds'], stage_summary['wall_seconds']
+                slowdown = value / baseline_value - 1 if baseline_value > 0 else 0.0
+            comparison.append({'stage': stage_key,
+                               'metric': metric,
+                               'baseline': baseline_value,
+                               'current': value,
+                               'change': f'{(value / baseline_value - 1) * 100:+.1f}%' if baseline_value else None,
+                               'regression': slowdown > regression_threshold and baseline_summary['wall_seconds'] >= min_seconds})
+    return comparison
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='benchmark the ETL on synthetic data at mutiple scales of the sample data')
+    args_parser.add_argument('--scales', type=int, nargs='+', default=[1],
+                             help='scales of the synthetic data, in copies of the sample data (1 to 1000)')
+    args_parser.add_argument('--seed', type=int, default=0)
+    args_parser.add_argument('--collections', nargs='+', choices=BENCHMARKED_COLLECTIONS, default=BENCHMARKED_COLLECTIONS)
+    args_parser.add_argument('--data-dir', type=Path, default=DEFAULT_DATA_DIR,
+                             help='data directory of the sample data')
+    args_parser.add_argument('--sql-url', default=None,
+                             help='SQLAlchemy url of the benchmark database (default is a temporary sqlite database), its tables are dropped')
+    args_parser.add_argument('--docs-per-batch', type=int, default=5_000)
+    args_parser.add_argument('--upload-chunksize', type=int, default=10_000)
+    args_parser.add_argument('--upload-strategy', choices=list(UPLOAD_STRATEGIES.keys()), default='to_sql',
+                             help='the bulk strategy needs a MySQL database')
+    args_parser.add_argument('--transform-backend', choices=TRANSFORM_BACKENDS, default='pandas')
+    args_parser.add_argument('--pipeline-queue-size', type=int, default=0,
+                             help='run the stages of each collection concurrently, with queues of this many batches between them')
+    args_parser.add_argument('--report-file', type=Path, default=None,
+                             help='write the json report of the benchmark to this file')
+    args_parser.add_argument('--baseline-report', type=Path, default=None,
+                             help='compare the stages with the json report of a previous benchmark (with the same parameters)')
+    args_parser.add_argument('--regression-threshold', type=float, default=0.1,
+                             help='fraction a stage can be slower than the baseline before it is a regression')
+    args_parser.add_argument('--min-seconds', type=float, default=0.1,
+                             help='stages shorter than this in the baseline are never flagged as regressions')
+    args = args_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sql_url = args.sql_url or f"sqlite:///{Path(temp_dir) / 'benchmark.sqlite'}"
+        engine = sqlalchemy.create_engine(sql_url)
+        report = {'environment': get_benchmark_environment(engine),
+                  'parameters': {'seed': args.seed, 'collections': args.collections, 'docs per batch': args.docs_per_batch,
+                                 'upload chunksize': args.upload_chunksize, 'upload strategy': args.upload_strategy,
+                                 'transform backend': args.transform_backend, 'pipeline queue size': args.pipeline_queue_size},
+                  'results': []}
+        for scale in args.scales:
+            print(f'benchmarking the ETL at {scale}x the sample data')
+            report['results'].append(run_etl_benchmark(engine, scale, seed=args.seed, collections_names=args.collections,
+                                                       data_dir=args.data_dir, docs_per_batch=args.docs_per_batch,
+                                                       upload_chunksize=args.upload_chunksize, upload_strategy=args.upload_strategy,
+                                                       transform_backend=args.transform_backend,
+                                                       pipeline_queue_size=args.pipeline_queue_size))
+        engine.dispose()
+
+    for result in report['results']:
+        print(f"{result['scale']}x the sample data - {result['seconds']} seconds")
+        print(tabulate(result['stages'], headers='keys', tablefmt='psql'))
+    if args.report_file is not None:
+        args.report_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.report_file, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f'report written to {args.report_file}')
+    if args.baseline_report is not None:
+        with open(args.baseline_report, 'r') as baseline_report_file:
+            baseline_report = json.load(baseline_report_file)
+        if baseline_report['parameters'] != report['parameters']:
+            print(f"***** WARNING ***** - the baseline report was run with other parameters: {baseline_report['parameters']}")
+        comparison = compare_with_baseline_report(report, baseline_report, args.regression_threshold, args.min_seconds)
+        print(f"compared with the baseline of commit {baseline_report['environment']['commit']}")
+        print(tabulate(comparison, headers='keys', tablefmt='psql'))
+        regressions_count = sum(row['regression'] for row in comparison)
+        if regressions_count:
+            print(f'{regressions_count} stages are more than {args.regression_threshold:.0%} slower than the baseline')
+            sys.exit(1)
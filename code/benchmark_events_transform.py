@@ -0,0 +1,70 @@
+# This module benchmarks the events transform (parse_and_process_events) on the local events json files,
+# it reports the throughput (events/sec) and the peak memory of the transform for different batch sizes, e.g.:
+#   python benchmark_events_transform.py --batch-sizes 10000 50000
+
+
+import argparse
+import tracemalloc
+import pandas as pd
+
+from pathlib import Path
+from time import perf_counter
+from tabulate import tabulate
+from typing import Callable, List
+
+from helpful_funcs import read_json_file_to_dict
+from events_parser_funcs import parse_and_process_events
+
+
+def read_events_json_files(events_dir:Path) -> List[dict]:
+    """
+    Reads all the events json files in a directory, and adds the `match_id` field to each event (as done while porting them to mongodb).
+    """
+    events_dicts = []
+    for events_json_path in sorted(events_dir.glob('*.json')):
+        match_events = read_json_file_to_dict(events_json_path)
+        for event in match_events:
+            event['match_id'] = int(events_json_path.stem)
+        events_dicts.extend(match_events)
+    return events_dicts
+
+
+def measure_transform(transform_func:Callable[[List[dict]], object], events_dicts:List[dict], batch_size:int) -> dict:
+    """
+    Runs a transform function over the events in batches, and measures its wall time and peak (traced) memory.
+    The wall time is measured in a separate run, as tracing the memory allocations slows the transform down.
+    """
+    def run_transform() -> None:
+        for batch_start in range(0, len(events_dicts), batch_size):
+            transform_func(events_dicts[batch_start:batch_start + batch_size])
+
+    start_time = perf_counter()
+    run_transform()
+    elapsed_time = perf_counter() - start_time
+
+    tracemalloc.start()
+    run_transform()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'batch size': batch_size,
+            'events': len(events_dicts),
+            'seconds': round(elapsed_time, 3),
+            'events/sec': round(len(events_dicts) / elapsed_time),
+            'peak memory (MB)': round(peak_memory / 1024 ** 2, 1)}
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='benchmark the events transform on the local events json files')
+    args_parser.add_argument('--events-dir', type=Path, default=Path().cwd().parent / 'data' / 'events')
+    args_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10_000, 50_000])
+    args_parser.add_argument('--skip-json-normalize', action='store_true',
+                             help="don't run the pd.json_normalize baseline (it's slow and memory hungry)")
+    args = args_parser.parse_args()
+
+    events_dicts = read_events_json_files(args.events_dir)
+    results = []
+    for batch_size in args.batch_sizes:
+        results.append({'transform': 'parse_and_process_events', **measure_transform(parse_and_process_events, events_dicts, batch_size)})
+        if not(args.skip_json_normalize):
+            results.append({'transform': 'pd.json_normalize (baseline)', **measure_transform(pd.json_normalize, events_dicts, batch_size)})
+    print(tabulate(results, headers='keys', tablefmt='psql'))
@@ -0,0 +1,146 @@
+# This module benchmarks the matches transform (parse_and_process_matches_dict) against the previous `pd.json_normalize` based one,
+# and against the arrow transform backend (parse_and_process_matches_to_arrow, if pyarrow is installed),
+# on the local matches json files scaled up to mutiple times their volume, it reports the throughput (matches/sec),
+# the peak memory of each transform, and the memory of the output tables per 1M matches, e.g.:
+#   python benchmark_matches_transform.py --scales 1 10 100
+# it first checks that the dtypes of the tables match the baseline's, batch by batch (see `compare_batches_dtypes`), e.g.:
+#   python benchmark_matches_transform.py --scales 1 --check-batch-sizes 7 50 1000
+
+
+import argparse
+import copy
+import tracemalloc
+import warnings
+
+from pathlib import Path
+from time import perf_counter
+from tabulate import tabulate
+from typing import Callable, Dict, List
+
+from helpful_funcs import read_json_file_to_dict
+from arrow_parser_funcs import pa
+from arrow_parser_funcs import parse_and_process_matches_to_arrow
+from json_data_parser_funcs import get_competition_season_matches_json_file_paths
+from json_data_parser_funcs import parse_and_process_matches_dict
+from json_data_parser_funcs import parse_and_process_matches_dict_with_json_normalize
+
+
+def read_scaled_matches_dicts(matches_dir:Path, scale:int) -> List[dict]:
+    """
+    Reads all the matches json files, and repeats them `scale` times (with new match ids), to mimic a larger matches collection.
+    """
+    matches_dicts = []
+    for json_file_path in sorted(get_competition_season_matches_json_file_paths(matches_dir)):
+        matches_dicts.extend(read_json_file_to_dict(json_file_path))
+    match_id_offset = max(match_dict['match_id'] for match_dict in matches_dicts) + 1
+    scaled_matches_dicts = []
+    for copy_number in range(scale):
+        for match_dict in matches_dicts:
+            scaled_match_dict = copy.deepcopy(match_dict)
+            scaled_match_dict['match_id'] += copy_number * match_id_offset
+            scaled_matches_dicts.append(scaled_match_dict)
+    return scaled_matches_dicts
+
+
+def get_tables_memory_bytes(tables_dict:Dict[str, object]) -> int:
+    """
+    Gets the memory used by the output tables of a transform (dataframes or arrow tables), including the python strings.
+    """
+    return sum(table.nbytes if pa is not None and isinstance(table, pa.Table) else int(table.memory_usage(deep=True).sum())
+               for table in tables_dict.values())
+
+
+def measure_transform(transform_func:Callable[[List[dict]], Dict[str, object]], matches_dicts:List[dict]) -> dict:
+    """
+    Runs a transform function over all the matches at once, and measures its wall time, peak memory and the memory of its output.
+    The wall time is measured in a separate run, as tracing the memory allocations slows the transform down.
+    The peak memory is the traced python memory plus the peak of arrow's memory pool (which isn't traced by tracemalloc).
+    """
+    start_time = perf_counter()
+    tables_dict = transform_func(matches_dicts)
+    elapsed_time = perf_counter() - start_time
+    output_memory = get_tables_memory_bytes(tables_dict)
+    del tables_dict
+
+    if pa is not None:
+        # a proxy of the default pool, so its peak only covers this run
+        default_memory_pool = pa.default_memory_pool()
+        arrow_memory_pool = pa.proxy_memory_pool(default_memory_pool)
+        pa.set_memory_pool(arrow_memory_pool)
+    tracemalloc.start()
+    transform_func(matches_dicts)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if pa is not None:
+        pa.set_memory_pool(default_memory_pool)
+        peak_memory += arrow_memory_pool.max_memory()
+    return {'matches': len(matches_dicts),
+            'seconds': round(elapsed_time, 3),
+            'matches/sec': round(len(matches_dicts) / elapsed_time),
+            'peak memory (MB)': round(peak_memory / 1024 ** 2, 1),
+            'output MB per 1M matches': round(output_memory / 1024 ** 2 * 1_000_000 / len(matches_dicts), 1)}
+
+
+def compare_batches_dtypes(matches_dicts:List[dict], docs_per_batch:int) -> List[dict]:
+    """
+    Transforms the matches in batches (as the ETL does) with `parse_and_process_matches_dict` and with the `pd.json_normalize` baseline,
+    and compares the dtypes of their columns batch by batch, e.g. a batch where all the teams of a source were in a previous source.
+    The columns with only missing values are skipped, as the baseline's dtype depends on whether their fields are missing or null.
+
+    ## Parameters
+    matches_dicts: List[dict]
+        The matches
+    docs_per_batch: int
+        Number of matches per batch
+
+    ## Returns
+    List[dict]
+        The columns whose dtypes differ (batch, table, column and both dtypes), empty if they all match
+    """
+    dtypes_mismatches = []
+    for batch_start in range(0, len(matches_dicts), docs_per_batch):
+        batch_matches_dicts = matches_dicts[batch_start:batch_start + docs_per_batch]
+        dframes_dict = parse_and_process_matches_dict(batch_matches_dicts)
+        baseline_dframes_dict = parse_and_process_matches_dict_with_json_normalize(batch_matches_dicts)
+        for table_name, dframe in dframes_dict.items():
+            for col in dframe.columns.intersection(baseline_dframes_dict[table_name].columns):
+                baseline_col = baseline_dframes_dict[table_name][col]
+                if dframe[col].isna().all() and baseline_col.isna().all():
+                    continue
+                if dframe[col].dtype != baseline_col.dtype:
+                    dtypes_mismatches.append({'batch': batch_start // docs_per_batch + 1,
+                                              'table': table_name,
+                                              'column': col,
+                                              'dtype': str(dframe[col].dtype),
+                                              'baseline dtype': str(baseline_col.dtype)})
+    return dtypes_mismatches
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='benchmark the matches transform on the local matches json files')
+    args_parser.add_argument('--matches-dir', type=Path, default=Path().cwd().parent / 'data' / 'matches')
+    args_parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                             help='how many times the local matches are repeated')
+    args_parser.add_argument('--check-batch-sizes', type=int, nargs='*', default=[50],
+                             help='batch sizes to compare the dtypes of the tables with the baseline at, before benchmarking (none to skip)')
+    args = args_parser.parse_args()
+
+    # the json_normalize based transform is noisy with SettingWithCopyWarning
+    warnings.simplefilter('ignore')
+    for docs_per_batch in args.check_batch_sizes:
+        dtypes_mismatches = compare_batches_dtypes(read_scaled_matches_dicts(args.matches_dir, 1), docs_per_batch)
+        if dtypes_mismatches:
+            print(tabulate(dtypes_mismatches, headers='keys', tablefmt='psql'))
+            raise ValueError(f'the dtypes of {len(dtypes_mismatches)} columns differ from the baseline with batches of {docs_per_batch} matches')
+        print(f'the dtypes of all the tables match the baseline with batches of {docs_per_batch} matches')
+    results = []
+    for scale in args.scales:
+        matches_dicts = read_scaled_matches_dicts(args.matches_dir, scale)
+        results.append({'transform': 'parse_and_process_matches_dict', 'scale': scale,
+                        **measure_transform(parse_and_process_matches_dict, matches_dicts)})
+        results.append({'transform': 'pd.json_normalize (baseline)', 'scale': scale,
+                        **measure_transform(parse_and_process_matches_dict_with_json_normalize, matches_dicts)})
+        if pa is not None:
+            results.append({'transform': 'parse_and_process_matches_to_arrow', 'scale': scale,
+                            **measure_transform(parse_and_process_matches_to_arrow, matches_dicts)})
+    print(tabulate(results, headers='keys', tablefmt='psql'))
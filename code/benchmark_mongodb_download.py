@@ -0,0 +1,110 @@
+# This module benchmarks the single cursor download of a collection against the partitioned (parallel) download.
+# it's meant to be run manually against the mongodb database, e.g.:
+#   python benchmark_mongodb_download.py --collection events --partition-field match_id --partitions 8
+
+
+import argparse
+import pymongo.collection
+
+from json import dumps as json_dumps
+from time import perf_counter
+from tabulate import tabulate
+from typing import Callable, List, Tuple
+
+from mongodb_downloader import connect_to_mongo_database
+from mongodb_downloader import download_collection_to_list_of_dicts
+from mongodb_downloader import download_collection_in_parallel_partitions
+
+
+def time_download(download_func:Callable[[], List[dict]], repeats:int) -> Tuple[float, List[dict]]:
+    """
+    Runs a download function `repeats` times and returns the best wall time and the downloaded documents.
+
+    ## Parameters
+    download_func: Callable[[], List[dict]]
+        Function that downloads a collection
+    repeats: int
+        Number of times to run the download
+
+    ## Returns
+    Tuple[float, List[dict]]
+        The best wall time (in seconds), and the documents downloaded by the last run
+    """
+    best_time = float('inf')
+    docs_list = []
+    for _ in range(repeats):
+        start_time = perf_counter()
+        docs_list = download_func()
+        best_time = min(best_time, perf_counter() - start_time)
+    return best_time, docs_list
+
+
+def docs_fingerprints(docs_list:List[dict]) -> List[str]:
+    """
+    Returns a sorted list of a canonical string for each document, used to check that two downloads have the same documents.
+    """
+    return sorted(json_dumps(doc, sort_keys=True, default=str) for doc in docs_list)
+
+
+def benchmark_collection_download(collection:pymongo.collection.Collection,
+                                  partition_field:str,
+                                  partitions_counts:List[int],
+                                  repeats:int=3) -> List[dict]:
+    """
+    Benchmarks the single cursor download of a collection against the partitioned download,
+    for each of the given partitions counts, and checks that all of them return the same documents.
+
+    ## Parameters
+    collection: pymongo.collection.Collection
+        Collection to download
+    partition_field: str
+        Field to partition the collection by
+    partitions_counts: List[int]
+        The partitions counts to benchmark
+    repeats: int, default=3
+        Number of runs per download method (the best one is reported)
+
+    ## Returns
+    List[dict]
+        One result row per download method
+    """
+    single_cursor_time, single_cursor_docs = time_download(lambda: download_collection_to_list_of_dicts(collection), repeats)
+    expected_fingerprints = docs_fingerprints(single_cursor_docs)
+    results = [{'method': 'single cursor',
+                'partitions': 1,
+                'docs': len(single_cursor_docs),
+                'seconds': round(single_cursor_time, 3),
+                'docs/sec': round(len(single_cursor_docs) / single_cursor_time),
+                'speedup': 1.0,
+                'same docs': True}]
+    for partitions_count in partitions_counts:
+        def download_func() -> List[dict]:
+            return download_collection_in_parallel_partitions(collection,
+                                                              partition_field=partition_field,
+                                                              partitions_count=partitions_count)
+        partitioned_time, partitioned_docs = time_download(download_func, repeats)
+        results.append({'method': f'partitioned by {partition_field}',
+                        'partitions': partitions_count,
+                        'docs': len(partitioned_docs),
+                        'seconds': round(partitioned_time, 3),
+                        'docs/sec': round(len(partitioned_docs) / partitioned_time),
+                        'speedup': round(single_cursor_time / partitioned_time, 2),
+                        'same docs': docs_fingerprints(partitioned_docs) == expected_fingerprints})
+    return results
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='benchmark the partitioned download of a mongodb collection')
+    args_parser.add_argument('--collection', default='events')
+    args_parser.add_argument('--partition-field', default='_id')
+    args_parser.add_argument('--partitions', type=int, nargs='+', default=[2, 4, 8])
+    args_parser.add_argument('--repeats', type=int, default=3)
+    args = args_parser.parse_args()
+
+    db = connect_to_mongo_database()
+    results = benchmark_collection_download(collection=db.get_collection(args.collection),
+                                            partition_field=args.partition_field,
+                                            partitions_counts=args.partitions,
+                                            repeats=args.repeats)
+    db.client.close()
+    print(tabulate(results, headers='keys', tablefmt='psql'))
@@ -0,0 +1,43 @@
+# This module benchmarks how the sharded matches transform scales with the number of worker processes,
+# each matches json file (data/matches/<competition>/<season>.json) is a shard, read and parsed by one of the workers, e.g.:
+#   python benchmark_sharded_transform.py --workers 1 2 4 8
+
+
+import argparse
+import os
+import pandas as pd
+# remove the SettingWithCopyWarning (in the worker processes as well)
+pd.options.mode.chained_assignment = None
+
+from pathlib import Path
+from time import perf_counter
+from tabulate import tabulate
+
+from helpful_funcs import read_json_file_to_dict
+from json_data_parser_funcs import get_competition_season_matches_json_file_paths
+from json_data_parser_funcs import parse_and_process_matches_dict
+from json_data_parser_funcs import concat_and_deduplicate_dframes_dicts
+from sharded_transform import transform_shards_in_process_pool
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='benchmark the sharded matches transform on the local matches json files')
+    args_parser.add_argument('--matches-dir', type=Path, default=Path().cwd().parent / 'data' / 'matches')
+    args_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = args_parser.parse_args()
+
+    shards = sorted(get_competition_season_matches_json_file_paths(args.matches_dir))
+    results = []
+    for max_workers in args.workers:
+        start_time = perf_counter()
+        shards_dframes_dicts = list(transform_shards_in_process_pool(shards, read_json_file_to_dict, parse_and_process_matches_dict,
+                                                                     max_workers=max_workers))
+        # the reduce step, merging the lookup tables of all the shards
+        concat_and_deduplicate_dframes_dicts(shards_dframes_dicts)
+        elapsed_time = perf_counter() - start_time
+        results.append({'workers': max_workers,
+                        'shards': len(shards),
+                        'seconds': round(elapsed_time, 3),
+                        'speedup': round(results[0]['seconds'] / elapsed_time, 2) if results else 1.0})
+    print(f'{os.cpu_count()} cores available')
+    print(tabulate(results, headers='keys', tablefmt='psql'))
@@ -0,0 +1,102 @@
+# This module micro-benchmarks the typed fields parsing (typed_fields_parser.py) against the per row parsing it replaced,
+# on synthetic columns with the repetition of the real data (e.g. a few thousand distinct match dates for a million matches), e.g.:
+#   python benchmark_typed_fields_parsing.py --rows 1000000 --repeats 3
+
+
+import argparse
+import numpy as np
+import pandas as pd
+
+from time import perf_counter
+from tabulate import tabulate
+from typing import Callable, Dict, Tuple
+
+from typed_fields_parser import parse_dates
+from typed_fields_parser import parse_clock_times
+from typed_fields_parser import combine_dates_and_times
+from typed_fields_parser import parse_season_years
+
+
+def generate_typed_fields_columns(rows:int, seed:int=0) -> Dict[str, pd.Series]:
+    """
+    Generates the string columns of the typed fields, with about as many distinct values as the real data would have for that many rows.
+    """
+    random_generator = np.random.default_rng(seed)
+    match_dates = pd.Series(pd.date_range('2000-01-01', periods=8_000, freq='D').strftime('%Y-%m-%d'))
+    kick_offs = pd.Series([f'{hour:02d}:{minute:02d}:00.000' for hour in range(12, 23) for minute in (0, 15, 30, 45)])
+    dates_of_birth = pd.Series(pd.date_range('1940-01-01', periods=20_000, freq='D').strftime('%Y-%m-%d'))
+    season_names = pd.Series([f'{year}/{year + 1}' for year in range(1970, 2025)] + [str(year) for year in range(1970, 2025)])
+    event_seconds = random_generator.integers(0, 95 * 60 * 1000, size=rows)
+    event_timestamps = pd.Series([f'00:{milliseconds // 60_000:02d}:{milliseconds // 1000 % 60:02d}.{milliseconds % 1000:03d}'
+                                  for milliseconds in event_seconds.tolist()])
+    lineup_seconds = random_generator.integers(0, 95 * 60, size=rows)
+    lineup_times = pd.Series([f'{seconds // 60:02d}:{seconds % 60:02d}' for seconds in lineup_seconds.tolist()])
+    return {'match_date': match_dates.sample(rows, replace=True, random_state=seed, ignore_index=True),
+            'kick_off': kick_offs.sample(rows, replace=True, random_state=seed + 1, ignore_index=True),
+            'manager_dob': dates_of_birth.sample(rows, replace=True, random_state=seed + 2, ignore_index=True),
+            'season_name': season_names.sample(rows, replace=True, random_state=seed + 3, ignore_index=True),
+            'event_timestamp': event_timestamps,
+            'from_time': lineup_times}
+
+
+def parse_season_years_with_apply(season_names:pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    The per row parsing of the season years that `parse_season_years` replaced.
+    """
+    split_season_names = season_names.str.split('/')
+    return (split_season_names.apply(lambda x: x[0]).astype(int),
+            split_season_names.apply(lambda x: x[1] if len(x) > 1 else x[0]).astype(int))
+
+
+def parse_timedeltas_row_by_row(clock_times:pd.Series) -> pd.Series:
+    """
+    Parses clock times one row at a time (prefixing the `mm:ss` ones with the hours), as the baseline of `parse_clock_times`.
+    """
+    return pd.Series([pd.Timedelta(clock_time if clock_time.count(':') == 2 else f'00:{clock_time}') for clock_time in clock_times])
+
+
+def measure_parsing(parse_func:Callable[[], object], repeats:int) -> float:
+    """
+    Returns the best wall time (in seconds) of a few runs of a parsing function.
+    """
+    elapsed_times = []
+    for _ in range(repeats):
+        start_time = perf_counter()
+        parse_func()
+        elapsed_times.append(perf_counter() - start_time)
+    return min(elapsed_times)
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='micro-benchmark the vectorized typed fields parsing against the per row parsing')
+    args_parser.add_argument('--rows', type=int, default=1_000_000)
+    args_parser.add_argument('--repeats', type=int, default=3)
+    args = args_parser.parse_args()
+
+    columns = generate_typed_fields_columns(args.rows)
+    benchmarks = {'season years': ('season_name',
+                                   lambda: parse_season_years_with_apply(columns['season_name']),
+                                   lambda: parse_season_years(columns['season_name'])),
+                  'match datetime': ('match_date',
+                                     lambda: pd.to_datetime(columns['match_date'] + ' ' + columns['kick_off'].str[:8], format='%Y-%m-%d %H:%M:%S'),
+                                     lambda: combine_dates_and_times(columns['match_date'], columns['kick_off'])),
+                  'manager dob': ('manager_dob',
+                                  lambda: pd.to_datetime(columns['manager_dob'], format='%Y-%m-%d', cache=False),
+                                  lambda: parse_dates(columns['manager_dob'])),
+                  'event timestamp': ('event_timestamp',
+                                      lambda: parse_timedeltas_row_by_row(columns['event_timestamp']),
+                                      lambda: parse_clock_times(columns['event_timestamp'])),
+                  'lineup from time': ('from_time',
+                                       lambda: parse_timedeltas_row_by_row(columns['from_time']),
+                                       lambda: parse_clock_times(columns['from_time']))}
+    results = []
+    for field_name, (column_name, baseline_func, vectorized_func) in benchmarks.items():
+        baseline_seconds = measure_parsing(baseline_func, args.repeats)
+        vectorized_seconds = measure_parsing(vectorized_func, args.repeats)
+        results.append({'field': field_name,
+                        'rows': args.rows,
+                        'distinct values': columns[column_name].nunique(),
+                        'per row (seconds)': round(baseline_seconds, 3),
+                        'vectorized (seconds)': round(vectorized_seconds, 3),
+                        'speedup': round(baseline_seconds / vectorized_seconds, 1)})
+    print(tabulate(results, headers='keys', tablefmt='psql'))
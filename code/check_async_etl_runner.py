@@ -0,0 +1,148 @@
+# This module checks the async runner (async_etl_runner.py) against the sync full load, on local stand-ins of the databases:
+# the collections are read from the json files of the data directory into mongomock (the sync load) and mongomock-motor (the async one),
+# and each load goes to its own sqlite database (through aiosqlite for the async one), then the tables of both databases are compared
+# (the same tables, with the same rows), e.g.:
+#   python check_async_etl_runner.py --include-lineups --docs-per-batch 200 --async-inserts 4
+# it's skipped when the stand-ins (mongomock, mongomock-motor, motor, aiosqlite and greenlet) aren't installed.
+
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import sqlalchemy
+
+from pathlib import Path
+from tabulate import tabulate
+from typing import Dict, List
+from unittest.mock import patch
+
+from benchmark_etl import create_benchmark_schema
+from local_file_source import read_local_collection
+from local_file_source import DEFAULT_DATA_DIR
+from async_etl_runner import motor
+from async_etl_runner import sqlalchemy_asyncio
+
+import main
+
+# the stand-ins are only needed by this check
+try:
+    import aiosqlite
+    import mongomock
+    import mongomock_motor
+except ImportError:
+    aiosqlite = None
+    mongomock = None
+    mongomock_motor = None
+
+
+def run_sql_commands_on_sqlite(sql_commands:List[str], connection:sqlalchemy.Connection) -> None:
+    """
+    Replaces `run_sql_commands` for the sqlite databases: the tables are created without the MySQL specific parts
+    (see `create_benchmark_schema`), and the foreign keys aren't created.
+    """
+    if not(any('FOREIGN KEY' in sql_command.upper() for sql_command in sql_commands)):
+        create_benchmark_schema(connection)
+    return None
+
+
+def read_sqlite_tables_rows(sqlite_file_path:Path) -> Dict[str, list]:
+    """
+    Reads the (sorted) rows of all the tables of a sqlite database.
+    """
+    engine = sqlalchemy.create_engine(f'sqlite:///{sqlite_file_path}')
+    with engine.connect() as connection:
+        tables_rows = {table_name: sorted(connection.exec_driver_sql(f'SELECT * FROM "{table_name}"').fetchall(), key=repr)
+                       for table_name in sqlalchemy.inspect(connection).get_table_names()}
+    engine.dispose()
+    return tables_rows
+
+
+def compare_async_and_sync_loads(collections_names:List[str],
+                                 data_dir:Path,
+                                 work_dir:Path,
+                                 **load_kwargs) -> List[dict]:
+    """
+    Runs the sync full load and the async runner on the stand-ins (see the note at the top of the module),
+    and compares the tables they loaded.
+
+    ## Parameters
+    collections_names: List[str]
+        The collections read into the stand-ins of the mongodb database
+    data_dir: Path
+        The data directory
+    work_dir: Path
+        Directory of the sqlite databases (and of the dimension key index and content hashes of the runs)
+    **load_kwargs
+        Passed to `main.main` for both loads (e.g. `include_lineups`, `docs_per_batch` or `async_inserts`)
+
+    ## Returns
+    List[dict]
+        The rows count of each table in both loads, and whether their rows are the same
+    """
+    sync_mongodb_db = mongomock.MongoClient().statsbomb
+    async_mongodb_db = mongomock_motor.AsyncMongoMockClient().statsbomb
+    for collection_name in collections_names:
+        # each stand-in gets its own documents, as the inserts add an `_id` to them
+        sync_mongodb_db.get_collection(collection_name).insert_many(read_local_collection(collection_name, data_dir=data_dir))
+        asyncio.run(async_mongodb_db.get_collection(collection_name).insert_many(read_local_collection(collection_name, data_dir=data_dir)))
+
+    runs_kwargs = {'dimension_key_index_path': work_dir / 'dimension_key_index.sqlite',
+                   'content_hashes_path': work_dir / 'content_hashes.sqlite'}
+    sync_sqlite_file_path = work_dir / 'sync.sqlite'
+    with patch('main.connect_to_mongo_database', return_value=sync_mongodb_db), \
+         patch('main.create_sql_db_engine', return_value=sqlalchemy.create_engine(f'sqlite:///{sync_sqlite_file_path}')), \
+         patch('main.run_sql_commands', run_sql_commands_on_sqlite):
+        main.main(**runs_kwargs, **load_kwargs)
+
+    # the async uploads wait for the sqlite write lock of each other instead of failing
+    async_sqlite_file_path = work_dir / 'async.sqlite'
+    async_engine = sqlalchemy_asyncio.create_async_engine(f'sqlite+aiosqlite:///{async_sqlite_file_path}', connect_args={'timeout': 60})
+    with patch('async_etl_runner.connect_to_mongo_database_async', return_value=async_mongodb_db), \
+         patch('async_etl_runner.create_async_sql_db_engine', return_value=async_engine), \
+         patch('async_etl_runner.run_sql_commands', run_sql_commands_on_sqlite):
+        main.main(async_io=True, **runs_kwargs, **load_kwargs)
+
+    sync_tables_rows = read_sqlite_tables_rows(sync_sqlite_file_path)
+    async_tables_rows = read_sqlite_tables_rows(async_sqlite_file_path)
+    return [{'table': table_name,
+             'sync rows': len(sync_tables_rows.get(table_name, [])),
+             'async rows': len(async_tables_rows.get(table_name, [])),
+             'same tables and rows': table_name in sync_tables_rows and table_name in async_tables_rows
+                                     and sync_tables_rows[table_name] == async_tables_rows[table_name]}
+            for table_name in sorted(set(sync_tables_rows) | set(async_tables_rows))]
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='check the async runner against the sync full load on local stand-ins of the databases')
+    args_parser.add_argument('--data-dir', type=Path, default=DEFAULT_DATA_DIR)
+    args_parser.add_argument('--include-events', action='store_true')
+    args_parser.add_argument('--include-lineups', action='store_true')
+    args_parser.add_argument('--transform-backend', choices=main.TRANSFORM_BACKENDS, default='pandas')
+    args_parser.add_argument('--docs-per-batch', type=int, default=500)
+    args_parser.add_argument('--upload-chunksize', type=int, default=500)
+    args_parser.add_argument('--async-cursors', type=int, default=4)
+    args_parser.add_argument('--async-inserts', type=int, default=4)
+    args = args_parser.parse_args()
+
+    if None in (motor, sqlalchemy_asyncio, aiosqlite, mongomock, mongomock_motor):
+        print('skipped: the check needs mongomock, mongomock-motor, motor, aiosqlite and greenlet, '
+              'install them with `pip install mongomock mongomock-motor motor aiosqlite sqlalchemy[asyncio]`')
+        sys.exit(0)
+    collections_names = ['competitions', 'matches'] + ['events'] * args.include_events + ['lineups'] * args.include_lineups
+    with tempfile.TemporaryDirectory() as work_dir:
+        tables_comparison = compare_async_and_sync_loads(collections_names,
+                                                         data_dir=args.data_dir,
+                                                         work_dir=Path(work_dir),
+                                                         include_events=args.include_events,
+                                                         include_lineups=args.include_lineups,
+                                                         transform_backend=args.transform_backend,
+                                                         docs_per_batch=args.docs_per_batch,
+                                                         upload_chunksize=args.upload_chunksize,
+                                                         async_cursors=args.async_cursors,
+                                                         async_inserts=args.async_inserts)
+    print(tabulate(tables_comparison, headers='keys', tablefmt='psql'))
+    different_tables = [table_comparison['table'] for table_comparison in tables_comparison if not(table_comparison['same tables and rows'])]
+    if different_tables:
+        raise ValueError(f'the async runner loaded different rows than the sync load in the tables {different_tables}')
+    print(f'the async runner loaded the same {len(tables_comparison)} tables as the sync load')
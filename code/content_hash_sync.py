@@ -0,0 +1,409 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import pymongo.database
+import sqlalchemy
+import sqlite3
+
+from json import dumps as dict_to_json_string
+from pathlib import Path
+from tabulate import tabulate
+from typing import Dict, List, Tuple
+
+from json_data_parser_funcs import parse_and_process_competitions_dict
+from json_data_parser_funcs import parse_and_process_matches_dict
+from json_data_parser_funcs import normalize_countries_field_df_competitions
+from json_data_parser_funcs import MATCHES_PROJECTION
+
+from local_file_source import get_local_collection_file_paths
+from local_file_source import read_collection_file_documents
+from local_file_source import read_local_collection
+
+from mongodb_downloader import download_collection_to_list_of_dicts
+from mongodb_downloader import stream_collection_in_batches
+
+from mysql_load_scheduler import parse_foreign_keys_dependencies
+from mysql_load_scheduler import sort_tables_by_dependencies
+
+from incremental_sync import UPSERT_TABLES_KEY_COLUMNS
+from incremental_sync import REPLACE_TABLES_KEY_COLUMN
+from incremental_sync import MATCHES_HIGH_WATER_MARK_FIELD
+from incremental_sync import read_countries_table
+from incremental_sync import sync_dframes_to_sql_tables_with_index
+
+from dimension_key_index import open_dimension_key_index
+from dimension_key_index import read_natural_keys_ids
+from dimension_key_index import get_rows_hashes
+
+from pipeline_metrics import measure_stage
+
+# NOTE: the change detection sync splits the matches into partitions, one per (competition, season),
+# and records a hash of each partition's source documents, and of each table the partition is transformed into,
+# in a local sqlite file (next to the dimension key index), once the sync that loaded them is committed.
+# the next sync only extracts, transforms and loads the partitions whose source hash changed since then,
+# and of those, only reloads the tables whose content hash changed (e.g. a new `last_updated` with the same rows is only transformed).
+# - files source -> the source hash of a partition is the hash of its json file (matches/<competition_id>/<season_id>.json)
+# - mongodb source -> the source hash of a partition is the hash of its match ids and their `last_updated` values,
+#   computed by the server with an aggregation, so the unchanged partitions aren't downloaded at all
+# the competitions collection is small, it's always extracted, and only transformed and loaded if its hash changed.
+# the hashes only reflect the MySQL database while no other sync writes to it, so the full load and the incremental sync clear them
+# (the next change detection sync then reloads all the partitions once).
+# the sync only covers the competitions and matches collections, the rows of the events and lineups of a match aren't deleted
+# with it when it's removed from a partition (and they aren't reloaded when it changes), so it's rejected on a database
+# that was loaded with the events or the lineups (see `read_loaded_matches_dependent_tables`).
+
+DEFAULT_CONTENT_HASHES_PATH = Path().cwd() / 'sync_state' / 'content_hashes.sqlite'
+
+# the tables of a matches partition whose rows are all deleted (and re-inserted) when they change,
+# so the matches removed from a partition are removed from the database as well.
+# the lookup tables are shared between the partitions, their changed rows are upserted (see `sync_dframes_to_sql_tables_with_index`)
+PARTITION_TABLES_DELETE_COMMANDS = {'team_managers_matches': 'DELETE FROM `team_managers_matches` WHERE `match_id` IN '
+                                                             '(SELECT `match_id` FROM `matches` WHERE `competition_id` = :competition_id AND `season_id` = :season_id)',
+                                    'matches': 'DELETE FROM `matches` WHERE `competition_id` = :competition_id AND `season_id` = :season_id'}
+
+# the tables of the events and lineups collections that have rows per match, the change detection sync doesn't keep them
+# in line with the matches it deletes
+MATCHES_DEPENDENT_TABLES = ['events', 'match_lineups', 'player_positions', 'player_cards']
+
+
+def read_loaded_matches_dependent_tables(mysql_connection: sqlalchemy.Connection) -> List[str]:
+    """
+    Finds the tables of the events and lineups collections that have rows in the database (see `MATCHES_DEPENDENT_TABLES`),
+    i.e. whether the database was loaded with the events or the lineups.
+    """
+    existing_tables = set(sqlalchemy.inspect(mysql_connection).get_table_names())
+    return [sql_table_name for sql_table_name in MATCHES_DEPENDENT_TABLES
+            if sql_table_name in existing_tables
+            and mysql_connection.execute(sqlalchemy.text(f'SELECT 1 FROM `{sql_table_name}` LIMIT 1')).first() is not None]
+
+
+def open_content_hashes(content_hashes_path: Path=None) -> sqlite3.Connection:
+    """
+    Opens (and creates, if it doesn't exist yet) the content hashes file.
+    The writes to it are only saved by `commit`, so they can be committed together with the MySQL transaction they record.
+
+    ## Parameters
+    content_hashes_path: Path, default=None
+        Path to the sqlite file of the content hashes (default is `sync_state/content_hashes.sqlite`)
+
+    ## Returns
+    sqlite3.Connection
+        The connection to the content hashes
+    """
+    if content_hashes_path is None:
+        content_hashes_path = DEFAULT_CONTENT_HASHES_PATH
+    content_hashes_path.parent.mkdir(parents=True, exist_ok=True)
+    hashes_connection = sqlite3.connect(content_hashes_path)
+    hashes_connection.execute('CREATE TABLE IF NOT EXISTS content_hashes (hash_key TEXT NOT NULL PRIMARY KEY, '
+                              'content_hash TEXT NOT NULL, rows_count INTEGER NOT NULL) WITHOUT ROWID')
+    hashes_connection.commit()
+    return hashes_connection
+
+
+def read_content_hashes(hashes_connection: sqlite3.Connection) -> Dict[str, Tuple[str, int]]:
+    """
+    Reads the content hashes recorded by the previous syncs, as a dictionary mapping each hash key to its hash and number of rows.
+    """
+    return {hash_key: (content_hash, rows_count)
+            for hash_key, content_hash, rows_count in hashes_connection.execute('SELECT hash_key, content_hash, rows_count FROM content_hashes')}
+
+
+def record_content_hash(hashes_connection: sqlite3.Connection, hash_key: str, content_hash: str, rows_count: int) -> None:
+    """
+    Records a content hash (the hashes have to be committed afterwards).
+    """
+    hashes_connection.execute('INSERT OR REPLACE INTO content_hashes (hash_key, content_hash, rows_count) VALUES (?, ?, ?)',
+                              (hash_key, content_hash, rows_count))
+    return None
+
+
+def clear_content_hashes(content_hashes_path: Path=None) -> None:
+    """
+    Deletes all the content hashes, so the next change detection sync reloads all the partitions.
+    It has to be called by the syncs that write to the MySQL database without recording the hashes (the full load and the incremental sync).
+    """
+    hashes_connection = open_content_hashes(content_hashes_path)
+    hashes_connection.execute('DELETE FROM content_hashes')
+    hashes_connection.commit()
+    hashes_connection.close()
+    return None
+
+
+def get_hash_key(name: str, partition: Tuple[int, int]=None) -> str:
+    """
+    Returns the key of a content hash, e.g. ('matches', (11, 90)) -> matches:11/90, or ('competitions', None) -> competitions.
+    The source hashes are named after the collection with a `source.` prefix (e.g. source.matches:11/90).
+    """
+    if partition is None:
+        return name
+    return f'{name}:{partition[0]}/{partition[1]}'
+
+
+def parse_hash_key(hash_key: str) -> Tuple[str, Tuple[int, int]]:
+    """
+    Parses a content hash key (see `get_hash_key`), e.g. matches:11/90 -> ('matches', (11, 90)), or competitions -> ('competitions', None).
+    """
+    if ':' not in hash_key:
+        return hash_key, None
+    name, partition = hash_key.split(':')
+    competition_id, season_id = partition.split('/')
+    return name, (int(competition_id), int(season_id))
+
+
+def get_documents_content_hash(documents: List[dict]) -> str:
+    """
+    Hashes the content of a list of documents (their json, with sorted keys, and the values that aren't json written as strings).
+    """
+    return hashlib.sha256(dict_to_json_string(documents, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_dataframe_content_hash(dframe: pd.DataFrame) -> str:
+    """
+    Hashes the content of a dataframe, the hash doesn't depend on the order of its rows and columns, or on the dtypes of its columns
+    (see `get_rows_hashes`), so the same rows transformed from the same documents always get the same hash.
+    """
+    columns = sorted(dframe.columns)
+    content_hash = hashlib.sha256(dict_to_json_string(columns).encode())
+    content_hash.update(np.sort(get_rows_hashes(dframe[columns])).tobytes())
+    return content_hash.hexdigest()
+
+
+def hash_files_matches_partitions(data_dir: Path=None) -> Dict[Tuple[int, int], Tuple[str, Path]]:
+    """
+    Hashes the json file of each matches partition of the files source (matches/<competition_id>/<season_id>.json).
+
+    ## Parameters
+    data_dir: Path, default=None
+        The data directory (default is the data directory of the repo)
+
+    ## Returns
+    Dict[Tuple[int, int], Tuple[str, Path]]
+        Dictionary mapping each (competition_id, season_id) partition to the hash and the path of its file
+    """
+    return {(int(file_path.parent.name), int(file_path.stem)): (hashlib.sha256(file_path.read_bytes()).hexdigest(), file_path)
+            for file_path in get_local_collection_file_paths('matches', data_dir)}
+
+
+def hash_mongodb_matches_partitions(mongodb_db: pymongo.database.Database) -> Dict[Tuple[int, int], Tuple[str, dict]]:
+    """
+    Hashes the match ids and the `last_updated` values of each matches partition of the mongodb source,
+    they're grouped by the server, so only these two fields of each document are downloaded.
+
+    ## Parameters
+    mongodb_db: pymongo.database.Database
+        The mongodb database to extract the documents from
+
+    ## Returns
+    Dict[Tuple[int, int], Tuple[str, dict]]
+        Dictionary mapping each (competition_id, season_id) partition to its hash and the query of its documents
+    """
+    pipeline = [{'$group': {'_id': {'competition_id': '$competition.competition_id', 'season_id': '$season.season_id'},
+                            'matches': {'$push': {'match_id': '$match_id', 'last_updated': f'${MATCHES_HIGH_WATER_MARK_FIELD}'}}}}]
+    partitions_hashes = {}
+    for partition_doc in mongodb_db.get_collection('matches').aggregate(pipeline, allowDiskUse=True):
+        competition_id, season_id = partition_doc['_id']['competition_id'], partition_doc['_id']['season_id']
+        matches_versions = sorted((match['match_id'], str(match.get('last_updated'))) for match in partition_doc['matches'])
+        partitions_hashes[(competition_id, season_id)] = (get_documents_content_hash(matches_versions),
+                                                          {'competition.competition_id': competition_id, 'season.season_id': season_id})
+    return partitions_hashes
+
+
+def sync_changed_tables(sql_dframes_dict: Dict[str, pd.DataFrame],
+                        previous_hashes: Dict[str, Tuple[str, int]],
+                        hashes_connection: sqlite3.Connection,
+                        partition: Tuple[int, int],
+                        mysql_connection: sqlalchemy.Connection,
+                        index_connection: sqlite3.Connection,
+                        tables_order: List[str],
+                        tables_stats: Dict[str, dict],
+                        upload_chunksize: int=None) -> None:
+    """
+    Syncs the tables (of a matches partition, or of the competitions) whose content hash changed since the previous sync,
+    and records the hashes of all of them (without committing them). The rows of the partition tables of a changed partition
+    (see `PARTITION_TABLES_DELETE_COMMANDS`) are deleted before they're synced again, the rest of the tables are upserted.
+    The number of skipped and synced rows of each table are added to `tables_stats`.
+    """
+    changed_dframes_dict = {}
+    for sql_table_name, dframe in sql_dframes_dict.items():
+        hash_key = get_hash_key(sql_table_name, partition)
+        content_hash = get_dataframe_content_hash(dframe)
+        table_stats = tables_stats.setdefault(sql_table_name, {'skipped': 0, 'skipped rows': 0, 'synced': 0, 'synced rows': 0})
+        if previous_hashes.get(hash_key, (None, 0))[0] == content_hash:
+            table_stats['skipped'] += 1
+            table_stats['skipped rows'] += len(dframe)
+        else:
+            changed_dframes_dict[sql_table_name] = dframe
+            table_stats['synced'] += 1
+        record_content_hash(hashes_connection, hash_key, content_hash, len(dframe))
+    if partition is not None:
+        for sql_table_name, sql_command in PARTITION_TABLES_DELETE_COMMANDS.items():
+            if sql_table_name in changed_dframes_dict:
+                mysql_connection.execute(sqlalchemy.text(sql_command), {'competition_id': partition[0], 'season_id': partition[1]})
+    for sql_table_name, rows_count in sync_dframes_to_sql_tables_with_index(changed_dframes_dict, mysql_connection, index_connection,
+                                                                            tables_order, upload_chunksize).items():
+        tables_stats[sql_table_name]['synced rows'] += rows_count
+    return None
+
+
+def skip_unchanged_tables(previous_hashes: Dict[str, Tuple[str, int]],
+                          partition: Tuple[int, int],
+                          tables_stats: Dict[str, dict]) -> None:
+    """
+    Adds the tables recorded by the previous sync for an unchanged source (a matches partition, or the competitions) to the skipped rows
+    of `tables_stats`, their hashes are kept as they are.
+    """
+    for hash_key, (content_hash, rows_count) in previous_hashes.items():
+        sql_table_name, hash_partition = parse_hash_key(hash_key)
+        if hash_partition != partition or sql_table_name.startswith('source.'):
+            continue
+        table_stats = tables_stats.setdefault(sql_table_name, {'skipped': 0, 'skipped rows': 0, 'synced': 0, 'synced rows': 0})
+        table_stats['skipped'] += 1
+        table_stats['skipped rows'] += rows_count
+    return None
+
+
+def run_change_detection_sync(mongodb_db: pymongo.database.Database,
+                              mysql_engine: sqlalchemy.Engine,
+                              sql_foreign_keys_file_path: Path,
+                              source: str='mongodb',
+                              data_dir: Path=None,
+                              cache_dir: Path=None,
+                              cursor_batch_size: int=1_000,
+                              upload_chunksize: int=None,
+                              dimension_key_index_path: Path=None,
+                              content_hashes_path: Path=None) -> Dict[str, dict]:
+    """
+    Syncs the MySQL database with the matches partitions (and the competitions) whose content changed since the previous
+    change detection sync, and skips extracting, transforming and loading the rest (see the note at the top of the module).
+    The tables should already exist (i.e. after a full load). Everything is synced in a single transaction,
+    and the new hashes are only saved after it's committed, so a failed sync is simply retried by the next run.
+    The number of partitions (and rows) of each table that were skipped or synced is printed at the end.
+
+    ## Parameters
+    mongodb_db: pymongo.database.Database
+        The mongodb database to extract the documents from (None for the files source)
+    mysql_engine: sqlalchemy.Engine
+        The engine of the MySQL database
+    sql_foreign_keys_file_path: Path
+        The path to the foreign keys commands file, used to sync the tables in the order of their foreign keys
+    source: str, default='mongodb'
+        Where the documents are extracted from, the mongodb database or the json files of `data_dir`
+    data_dir: Path, default=None
+        The data directory of the files source (default is the data directory of the repo)
+    cache_dir: Path, default=None
+        The cache directory of the decoded json files of the files source (None disables the cache)
+    cursor_batch_size: int, default=1_000
+        Number of documents the mongodb cursor fetches per round trip
+    upload_chunksize: int, default=None
+        The number of rows per statement, by default it's estimated from the server's `max_allowed_packet`
+    dimension_key_index_path: Path, default=None
+        Path to the dimension key index (see dimension_key_index.py, default is `sync_state/dimension_key_index.sqlite`)
+    content_hashes_path: Path, default=None
+        Path to the content hashes of the previous syncs (default is `sync_state/content_hashes.sqlite`)
+
+    ## Returns
+    Dict[str, dict]
+        Dictionary mapping each table name to the number of partitions (and rows) that were skipped and synced
+    """
+    dependencies = parse_foreign_keys_dependencies(sql_foreign_keys_file_path)
+    tables_order = sort_tables_by_dependencies(list(UPSERT_TABLES_KEY_COLUMNS.keys()) + list(REPLACE_TABLES_KEY_COLUMN.keys()),
+                                               dependencies)
+    tables_stats = {}
+
+    hashes_connection = open_content_hashes(content_hashes_path)
+    index_connection = open_dimension_key_index(dimension_key_index_path)
+    try:
+        previous_hashes = read_content_hashes(hashes_connection)
+        print(f'hashing the matches partitions of the {source} source')
+        with measure_stage('source_hashes', collection='matches') as stage_metrics:
+            if source == 'files':
+                partitions_hashes = hash_files_matches_partitions(data_dir)
+            else:
+                partitions_hashes = hash_mongodb_matches_partitions(mongodb_db)
+            stage_metrics['rows'] = len(partitions_hashes)
+        unchanged_partitions = [partition for partition, (source_hash, _) in sorted(partitions_hashes.items())
+                                if previous_hashes.get(get_hash_key('source.matches', partition), (None, 0))[0] == source_hash]
+        changed_partitions = sorted(set(partitions_hashes) - set(unchanged_partitions))
+        removed_partitions = sorted({partition for name, partition in map(parse_hash_key, previous_hashes)
+                                     if name == 'source.matches' and partition not in partitions_hashes})
+        skipped_documents = sum(previous_hashes[get_hash_key('source.matches', partition)][1]
+                                for partition in unchanged_partitions)
+        print(f'{len(changed_partitions)} of {len(partitions_hashes)} matches partitions changed, {len(removed_partitions)} removed')
+
+        with mysql_engine.begin() as mysql_connection:
+            # the rows are synced in the order of the foreign keys, but a match can reference a competition that is only
+            # synced at the end (it needs the synced countries), so the checks are disabled until the transaction is complete
+            mysql_connection.execute(sqlalchemy.text('SET foreign_key_checks = 0'))
+
+            for partition in unchanged_partitions:
+                skip_unchanged_tables(previous_hashes, partition, tables_stats)
+
+            for partition_number, partition in enumerate(changed_partitions, start=1):
+                source_hash, partition_location = partitions_hashes[partition]
+                with measure_stage('extract', collection='matches', partition=get_hash_key('matches', partition)) as stage_metrics:
+                    if source == 'files':
+                        matches_docs = read_collection_file_documents('matches', partition_location, cache_dir)
+                    else:
+                        matches_docs = [doc for docs_batch in stream_collection_in_batches(mongodb_db.get_collection('matches'),
+                                                                                           docs_per_batch=1_000_000,
+                                                                                           cursor_batch_size=cursor_batch_size,
+                                                                                           query=partition_location,
+                                                                                           projection=MATCHES_PROJECTION)
+                                        for doc in docs_batch]
+                    stage_metrics['rows'] = len(matches_docs)
+                print(f'syncing matches partition {get_hash_key("matches", partition)} ({partition_number}/{len(changed_partitions)}, {len(matches_docs)} documents)')
+                with measure_stage('transform', collection='matches', function='parse_and_process_matches_dict') as stage_metrics:
+                    matches_dframes_dict = parse_and_process_matches_dict(matches_docs)
+                    stage_metrics['rows'] = len(matches_docs)
+                sync_changed_tables({table_name.replace('df_', ''): dframe for table_name, dframe in matches_dframes_dict.items()},
+                                    previous_hashes, hashes_connection, partition, mysql_connection, index_connection,
+                                    tables_order, tables_stats, upload_chunksize)
+                record_content_hash(hashes_connection, get_hash_key('source.matches', partition), source_hash, len(matches_docs))
+
+            for partition in removed_partitions:
+                print(f'deleting removed matches partition {get_hash_key("matches", partition)}')
+                for sql_command in PARTITION_TABLES_DELETE_COMMANDS.values():
+                    mysql_connection.execute(sqlalchemy.text(sql_command), {'competition_id': partition[0], 'season_id': partition[1]})
+                hashes_connection.executemany('DELETE FROM content_hashes WHERE hash_key = ?',
+                                              [(hash_key,) for hash_key in previous_hashes if parse_hash_key(hash_key)[1] == partition])
+
+            with measure_stage('extract', collection='competitions') as stage_metrics:
+                if source == 'files':
+                    competitions_dict = read_local_collection('competitions', data_dir=data_dir, cache_dir=cache_dir)
+                else:
+                    competitions_dict = download_collection_to_list_of_dicts(mongodb_db.get_collection('competitions'))
+                stage_metrics['rows'] = len(competitions_dict)
+            competitions_source_hash = get_documents_content_hash(competitions_dict)
+            if previous_hashes.get('source.competitions', (None, 0))[0] == competitions_source_hash:
+                print('the competitions collection is unchanged')
+                skip_unchanged_tables(previous_hashes, None, tables_stats)
+            else:
+                print('syncing competitions collection')
+                with measure_stage('transform', collection='competitions', function='parse_and_process_competitions_dict') as stage_metrics:
+                    competitions_dframes_dict = parse_and_process_competitions_dict(competitions_dict)
+                    stage_metrics['rows'] = len(competitions_dict)
+                # the countries of all the previous syncs are in the database, not only the ones of this sync's matches,
+                # they're looked up in the index (which has the ones of this sync as well), or read from the database if the index is empty
+                countries_ids = read_natural_keys_ids(index_connection, 'countries')
+                if not(countries_ids):
+                    countries_ids = dict(read_countries_table(mysql_connection)[['country_name', 'country_id']].itertuples(index=False))
+                competitions_dframes_dict['df_competitions'] = normalize_countries_field_df_competitions(competitions_dframes_dict['df_competitions'],
+                                                                                                         countries_ids=countries_ids)
+                sync_changed_tables({table_name.replace('df_', ''): dframe for table_name, dframe in competitions_dframes_dict.items()},
+                                    previous_hashes, hashes_connection, None, mysql_connection, index_connection,
+                                    tables_order, tables_stats, upload_chunksize)
+                record_content_hash(hashes_connection, 'source.competitions', competitions_source_hash, len(competitions_dict))
+
+            mysql_connection.execute(sqlalchemy.text('SET foreign_key_checks = 1'))
+        # the hashes (and the index) are only committed once the MySQL transaction is, closing them without a commit discards them
+        index_connection.commit()
+        hashes_connection.commit()
+    finally:
+        index_connection.close()
+        hashes_connection.close()
+
+    print(f'skipped extracting {len(unchanged_partitions)} of {len(partitions_hashes)} matches partitions '
+          f'({skipped_documents} documents)')
+    print(tabulate([{'table': sql_table_name, **table_stats} for sql_table_name, table_stats in sorted(tables_stats.items())],
+                   headers='keys', tablefmt='psql'))
+    return tables_stats
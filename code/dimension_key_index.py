@@ -0,0 +1,188 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# NOTE: the dimension (lookup) tables, e.g. countries, stadiums, referees, teams and managers, barely change between syncs,
+# but every batch of matches holds (and would upsert again) the dimension rows of its matches.
+# this index is a local sqlite file that records which dimension rows are already in the MySQL database (their key and a hash
+# of their values), so only the new or changed rows have to be synced, and the natural keys of some tables (e.g. country name -> id),
+# so looking them up doesn't need a query (or a merge) against the MySQL database.
+# the index only reflects the MySQL database when it's written right after it (see `record_dimension_rows`),
+# it's rebuilt by every full load, as the full load drops and recreates all the tables.
+
+# the key columns of the dimension tables in the index (sql table name -> key columns)
+DIMENSION_TABLES_KEY_COLUMNS = {'countries': ['country_id'],
+                                'competitions': ['competition_id'],
+                                'competition_stages': ['competition_stage_id'],
+                                'stadiums': ['stadium_id'],
+                                'referees': ['referee_id'],
+                                'team_base_info': ['team_id'],
+                                'managers_base_data': ['manager_id']}
+
+# the natural keys recorded in the index (sql table name -> (natural key column, id column)), see `read_natural_keys_ids`
+NATURAL_KEYS_COLUMNS = {'countries': ('country_name', 'country_id')}
+
+DEFAULT_DIMENSION_KEY_INDEX_PATH = Path().cwd() / 'sync_state' / 'dimension_key_index.sqlite'
+
+
+def open_dimension_key_index(index_file_path:Path=None) -> sqlite3.Connection:
+    """
+    Opens (and creates, if it doesn't exist yet) the dimension key index.
+    The writes to the index are only saved by `commit`, so they can be committed together with the MySQL transaction they record.
+
+    ## Parameters
+    index_file_path: Path, default=None
+        Path to the sqlite file of the index (default is `sync_state/dimension_key_index.sqlite`)
+
+    ## Returns
+    sqlite3.Connection
+        The connection to the index
+    """
+    if index_file_path is None:
+        index_file_path = DEFAULT_DIMENSION_KEY_INDEX_PATH
+    index_file_path.parent.mkdir(parents=True, exist_ok=True)
+    index_connection = sqlite3.connect(index_file_path)
+    index_connection.execute('CREATE TABLE IF NOT EXISTS dimension_rows (table_name TEXT NOT NULL, row_key TEXT NOT NULL, '
+                             'row_hash INTEGER NOT NULL, PRIMARY KEY (table_name, row_key)) WITHOUT ROWID')
+    index_connection.execute('CREATE TABLE IF NOT EXISTS natural_keys (table_name TEXT NOT NULL, natural_key TEXT NOT NULL, '
+                             'id INTEGER NOT NULL, PRIMARY KEY (table_name, natural_key)) WITHOUT ROWID')
+    index_connection.commit()
+    return index_connection
+
+
+def get_numeric_values(values:pd.Series) -> Optional[pd.Series]:
+    """
+    Gets the values of a column as floats if they're all numbers (whatever the dtype of the column, e.g. integers in an object column
+    after concatenating an empty dataframe), or None if they aren't.
+    """
+    if pd.api.types.is_bool_dtype(values):
+        return None
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+    if values.dtype != object:
+        return None
+    numeric_values = pd.to_numeric(values, errors='coerce')
+    if numeric_values.notna().sum() != values.notna().sum():
+        return None
+    return numeric_values.astype('float64')
+
+
+def get_rows_keys(dframe:pd.DataFrame, key_columns:List[str]) -> List[str]:
+    """
+    Gets the key of each row of a dataframe as a string (the key values joined by `|`),
+    the whole numbers are written the same way whatever the dtype of their column (e.g. `12`, not `12.0`).
+    """
+    keys_columns_values = []
+    for col in key_columns:
+        values = dframe[col]
+        numeric_values = get_numeric_values(values)
+        if numeric_values is not None:
+            values = numeric_values.astype('Int64')
+        keys_columns_values.append(values.astype(str).tolist())
+    return ['|'.join(key_values) for key_values in zip(*keys_columns_values)]
+
+
+def get_rows_hashes(dframe:pd.DataFrame) -> np.ndarray:
+    """
+    Hashes the values of each row of a dataframe (as signed 64 bit integers, so they fit in sqlite),
+    the numbers are hashed as floats and the rest as strings, so the hash doesn't depend on the dtypes of the batch
+    (e.g. an integer column becomes float when a batch has missing values).
+    """
+    normalized_columns = {}
+    for col in dframe.columns:
+        values = dframe[col]
+        numeric_values = get_numeric_values(values)
+        if numeric_values is not None:
+            normalized_columns[col] = numeric_values
+        else:
+            normalized_columns[col] = values.astype(object).where(values.notna(), None).astype(str)
+    return pd.util.hash_pandas_object(pd.DataFrame(normalized_columns), index=False).to_numpy().view(np.int64)
+
+
+def filter_new_dimension_rows(index_connection:sqlite3.Connection,
+                              sql_table_name:str,
+                              dframe:pd.DataFrame) -> pd.DataFrame:
+    """
+    Keeps the rows of a dimension table that aren't in the MySQL database yet, or that changed since they were synced,
+    as recorded in the index (the tables that aren't dimension tables are returned as is).
+
+    ## Parameters
+    index_connection: sqlite3.Connection
+        The connection to the index
+    sql_table_name: str
+        The name of the table in the MySQL database
+    dframe: pd.DataFrame
+        The rows of the table
+
+    ## Returns
+    pd.DataFrame
+        The new (or changed) rows
+    """
+    if sql_table_name not in DIMENSION_TABLES_KEY_COLUMNS or dframe.empty:
+        return dframe
+    indexed_rows_hashes = dict(index_connection.execute('SELECT row_key, row_hash FROM dimension_rows WHERE table_name = ?',
+                                                        (sql_table_name,)).fetchall())
+    rows_keys = get_rows_keys(dframe, DIMENSION_TABLES_KEY_COLUMNS[sql_table_name])
+    rows_hashes = get_rows_hashes(dframe)
+    is_new_row = [indexed_rows_hashes.get(row_key) != row_hash for row_key, row_hash in zip(rows_keys, rows_hashes.tolist())]
+    return dframe[is_new_row]
+
+
+def record_dimension_rows(index_connection:sqlite3.Connection,
+                          sql_table_name:str,
+                          dframe:pd.DataFrame) -> None:
+    """
+    Records the rows of a dimension table (and its natural keys) in the index, once they're synced to the MySQL database
+    (the tables that aren't dimension tables are skipped). The index has to be committed afterwards.
+
+    ## Parameters
+    index_connection: sqlite3.Connection
+        The connection to the index
+    sql_table_name: str
+        The name of the table in the MySQL database
+    dframe: pd.DataFrame
+        The synced rows of the table
+    """
+    if sql_table_name not in DIMENSION_TABLES_KEY_COLUMNS or dframe.empty:
+        return None
+    rows_keys = get_rows_keys(dframe, DIMENSION_TABLES_KEY_COLUMNS[sql_table_name])
+    index_connection.executemany('INSERT OR REPLACE INTO dimension_rows (table_name, row_key, row_hash) VALUES (?, ?, ?)',
+                                 [(sql_table_name, row_key, row_hash) for row_key, row_hash in zip(rows_keys, get_rows_hashes(dframe).tolist())])
+    if sql_table_name in NATURAL_KEYS_COLUMNS:
+        natural_key_col, id_col = NATURAL_KEYS_COLUMNS[sql_table_name]
+        natural_keys = dframe[[natural_key_col, id_col]].dropna()
+        index_connection.executemany('INSERT OR REPLACE INTO natural_keys (table_name, natural_key, id) VALUES (?, ?, ?)',
+                                     [(sql_table_name, str(natural_key), int(id_value))
+                                      for natural_key, id_value in natural_keys.itertuples(index=False)])
+    return None
+
+
+def read_natural_keys_ids(index_connection:sqlite3.Connection, sql_table_name:str) -> Dict[str, int]:
+    """
+    Reads the natural keys of a table from the index, e.g. country name -> country id,
+    so they can be looked up with a dictionary instead of a merge against the whole table.
+    """
+    return dict(index_connection.execute('SELECT natural_key, id FROM natural_keys WHERE table_name = ?',
+                                         (sql_table_name,)).fetchall())
+
+
+def rebuild_dimension_key_index(index_connection:sqlite3.Connection, sql_dframes_dict:Dict[str, pd.DataFrame]) -> None:
+    """
+    Replaces the whole index with the dimension tables of a full load (tables missing from the dictionary are left empty),
+    and commits it. It has to be called after the full load is committed to the MySQL database.
+
+    ## Parameters
+    index_connection: sqlite3.Connection
+        The connection to the index
+    sql_dframes_dict: Dict[str, pd.DataFrame]
+        Dictionary mapping the table names in the MySQL database to their (full) dataframes
+    """
+    index_connection.execute('DELETE FROM dimension_rows')
+    index_connection.execute('DELETE FROM natural_keys')
+    for sql_table_name, dframe in sql_dframes_dict.items():
+        record_dimension_rows(index_connection, sql_table_name, dframe)
+    index_connection.commit()
+    return None
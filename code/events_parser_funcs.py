@@ -0,0 +1,182 @@
+import pandas as pd
+from pathlib import Path
+
+from typing import Dict, List
+from tabulate import tabulate
+from helpful_funcs import read_json_file_to_dict
+from helpful_funcs import downcast_all_numerical_cols_in_df
+from helpful_funcs import extract_columns_from_documents
+from helpful_funcs import build_projection_from_fields_paths
+
+# NOTE: the events documents are very wide and sparse (each event type has its own nested object, e.g. `pass`, `shot`, `carry`),
+# so instead of flattening every field of every event with `pd.json_normalize`, each output table is built column by column
+# from the field paths below, and the per type tables (passes, shots, carries) only look at the events of their type.
+
+EVENTS_COLUMNS_PATHS = {'event_id': ('id',),
+                        'match_id': ('match_id',),
+                        'event_index': ('index',),
+                        'period': ('period',),
+                        'event_timestamp': ('timestamp',),
+                        'minute': ('minute',),
+                        'second': ('second',),
+                        'event_type_id': ('type', 'id'),
+                        'possession': ('possession',),
+                        'possession_team_id': ('possession_team', 'id'),
+                        'play_pattern_id': ('play_pattern', 'id'),
+                        'team_id': ('team', 'id'),
+                        'player_id': ('player', 'id'),
+                        'position_id': ('position', 'id'),
+                        'location_x': ('location', 0),
+                        'location_y': ('location', 1),
+                        'duration': ('duration',),
+                        'is_under_pressure': ('under_pressure',),
+                        'is_counterpress': ('counterpress',),
+                        'is_off_camera': ('off_camera',),
+                        'is_out': ('out',)}
+
+PASSES_COLUMNS_PATHS = {'event_id': ('id',),
+                        'recipient_player_id': ('pass', 'recipient', 'id'),
+                        'pass_length': ('pass', 'length'),
+                        'pass_angle': ('pass', 'angle'),
+                        'pass_height_id': ('pass', 'height', 'id'),
+                        'end_location_x': ('pass', 'end_location', 0),
+                        'end_location_y': ('pass', 'end_location', 1),
+                        'body_part_id': ('pass', 'body_part', 'id'),
+                        'pass_type_id': ('pass', 'type', 'id'),
+                        'outcome_id': ('pass', 'outcome', 'id'),
+                        'technique_id': ('pass', 'technique', 'id'),
+                        'assisted_shot_id': ('pass', 'assisted_shot_id'),
+                        'is_cross': ('pass', 'cross'),
+                        'is_switch': ('pass', 'switch'),
+                        'is_through_ball': ('pass', 'through_ball'),
+                        'is_cut_back': ('pass', 'cut_back'),
+                        'is_aerial_won': ('pass', 'aerial_won'),
+                        'is_shot_assist': ('pass', 'shot_assist'),
+                        'is_goal_assist': ('pass', 'goal_assist')}
+
+SHOTS_COLUMNS_PATHS = {'event_id': ('id',),
+                       'statsbomb_xg': ('shot', 'statsbomb_xg'),
+                       'end_location_x': ('shot', 'end_location', 0),
+                       'end_location_y': ('shot', 'end_location', 1),
+                       'end_location_z': ('shot', 'end_location', 2),
+                       'key_pass_id': ('shot', 'key_pass_id'),
+                       'body_part_id': ('shot', 'body_part', 'id'),
+                       'shot_type_id': ('shot', 'type', 'id'),
+                       'outcome_id': ('shot', 'outcome', 'id'),
+                       'technique_id': ('shot', 'technique', 'id'),
+                       'is_first_time': ('shot', 'first_time'),
+                       'is_one_on_one': ('shot', 'one_on_one'),
+                       'is_aerial_won': ('shot', 'aerial_won'),
+                       'is_open_goal': ('shot', 'open_goal'),
+                       'is_deflected': ('shot', 'deflected')}
+
+CARRIES_COLUMNS_PATHS = {'event_id': ('id',),
+                         'end_location_x': ('carry', 'end_location', 0),
+                         'end_location_y': ('carry', 'end_location', 1)}
+
+# the (id, name) lookup tables of the events data, (table name -> (id column, name column, paths of the (id, name) objects))
+# the ids of the same kind of object (e.g. outcomes) are unique across the event types, so they share a single table
+EVENTS_LOOKUP_TABLES = {'df_event_types': ('event_type_id', 'event_type_name', [('type',)]),
+                        'df_play_patterns': ('play_pattern_id', 'play_pattern_name', [('play_pattern',)]),
+                        'df_positions': ('position_id', 'position_name', [('position',)]),
+                        'df_pass_heights': ('pass_height_id', 'pass_height_name', [('pass', 'height')]),
+                        'df_pass_types': ('pass_type_id', 'pass_type_name', [('pass', 'type')]),
+                        'df_shot_types': ('shot_type_id', 'shot_type_name', [('shot', 'type')]),
+                        'df_body_parts': ('body_part_id', 'body_part_name', [('pass', 'body_part'), ('shot', 'body_part')]),
+                        'df_event_outcomes': ('outcome_id', 'outcome_name', [('pass', 'outcome'), ('shot', 'outcome')]),
+                        'df_techniques': ('technique_id', 'technique_name', [('pass', 'technique'), ('shot', 'technique')])}
+
+# the output tables of the events data that hold one row per event (or per related events pair),
+# the rest of the output tables are lookup (dimension) tables.
+EVENTS_FACT_TABLES = ['df_events', 'df_passes', 'df_shots', 'df_carries', 'df_related_events']
+
+# the mongodb projection of the events collection, only the fields of the events tables are fetched
+# (e.g. not the tactics, freeze frames, or the details of the event types that have no table)
+EVENTS_PROJECTION = build_projection_from_fields_paths([*EVENTS_COLUMNS_PATHS.values(),
+                                                        *PASSES_COLUMNS_PATHS.values(),
+                                                        *SHOTS_COLUMNS_PATHS.values(),
+                                                        *CARRIES_COLUMNS_PATHS.values(),
+                                                        ('related_events',),
+                                                        *[object_path + (key,)
+                                                          for _, _, objects_paths in EVENTS_LOOKUP_TABLES.values()
+                                                          for object_path in objects_paths
+                                                          for key in ['id', 'name']]])
+
+
+def fill_boolean_flags(df:pd.DataFrame) -> pd.DataFrame:
+    """
+    The boolean flags of the events (the `is_*` columns, e.g. `is_under_pressure`, `is_cross`) are only present in the source data
+    when they're true, this fills the missing ones with False.
+    """
+    boolean_cols = [col for col in df.columns if col.startswith('is_')]
+    for col in boolean_cols:
+        df[col] = df[col].fillna(False).astype(bool)
+    return df
+
+
+def parse_and_process_events(events_dicts:List[dict]) -> Dict[str, pd.DataFrame]:
+    """
+    This function parses and processes a list of events documents (e.g. a batch streamed from the events collection),
+    each document should have the `match_id` field that was added while porting the events json files to mongodb.
+    And it produces a dictionary containing mutiple dataframes, each one will be saved to a separate table in the SQL database.
+
+    The events are only flattened for the fields that end up in the SQL tables (see the `*_COLUMNS_PATHS` dictionaries),
+    so a large number of events can be processed batch by batch, with the memory bounded by the batch size.
+
+    ## Parameters
+    - events_dicts: List[dict]
+        List of dictionaries with the events data
+
+    ## Returns
+    - Dict[str, pd.DataFrame]: Dictionary with the output dataframes, they are:
+
+        1. `df_events` -> the main events dataframe, one row per event (with its location), keyed by `event_id`
+        2. `df_passes` -> the pass details of the pass events, keyed by `event_id`
+        3. `df_shots` -> the shot details of the shot events, keyed by `event_id`
+        4. `df_carries` -> the end location of the carry events, keyed by `event_id`
+        5. `df_related_events` -> the (event_id, related_event_id) pairs
+        6. the lookup tables (`df_event_types`, `df_play_patterns`, `df_positions`, `df_pass_heights`, `df_pass_types`,
+           `df_shot_types`, `df_body_parts`, `df_event_outcomes`, `df_techniques`) -> each one contains an id and a name column
+    """
+    # selecting the events of each type once, so the per type tables only go through their own events
+    events_by_type_key = {'pass': [], 'shot': [], 'carry': []}
+    for event in events_dicts:
+        for type_key, type_events in events_by_type_key.items():
+            if type_key in event:
+                type_events.append(event)
+
+    dataframes_dict = {}
+    dataframes_dict['df_events'] = fill_boolean_flags(extract_columns_from_documents(events_dicts, EVENTS_COLUMNS_PATHS))
+    dataframes_dict['df_passes'] = fill_boolean_flags(extract_columns_from_documents(events_by_type_key['pass'], PASSES_COLUMNS_PATHS))
+    dataframes_dict['df_shots'] = fill_boolean_flags(extract_columns_from_documents(events_by_type_key['shot'], SHOTS_COLUMNS_PATHS))
+    dataframes_dict['df_carries'] = extract_columns_from_documents(events_by_type_key['carry'], CARRIES_COLUMNS_PATHS)
+
+    related_events_pairs = [(event['id'], related_event_id)
+                            for event in events_dicts
+                            for related_event_id in event.get('related_events', [])]
+    dataframes_dict['df_related_events'] = pd.DataFrame(related_events_pairs, columns=['event_id', 'related_event_id'])
+
+    for table_name, (id_col, name_col, objects_paths) in EVENTS_LOOKUP_TABLES.items():
+        lookup_dframes = []
+        for object_path in objects_paths:
+            source_events = events_by_type_key.get(object_path[0], events_dicts) if len(object_path) > 1 else events_dicts
+            lookup_dframes.append(extract_columns_from_documents(source_events, {id_col: object_path + ('id',),
+                                                                                 name_col: object_path + ('name',)}))
+        df_lookup = pd.concat(lookup_dframes, axis=0, ignore_index=True)
+        df_lookup = df_lookup.dropna(subset=[id_col]).drop_duplicates(ignore_index=True)
+        dataframes_dict[table_name] = df_lookup
+
+    for table_name, df in dataframes_dict.items():
+        dataframes_dict[table_name] = downcast_all_numerical_cols_in_df(df)
+    return dataframes_dict
+
+
+if __name__ == "__main__":
+    events_json_path = Path().cwd().parent / "data" / "events" / "3749052.json"
+    events_dicts = read_json_file_to_dict(events_json_path)
+    for event in events_dicts:
+        event['match_id'] = int(events_json_path.stem)
+    events_dframes_dict = parse_and_process_events(events_dicts)
+    for table_name, df in events_dframes_dict.items():
+        print(table_name)
+        print(tabulate(df.head(), headers='keys', tablefmt='psql'))
@@ -1,8 +1,19 @@
+import codecs
+import mmap
+import re
 import pandas as pd
 
 from json import load as json_file_stream_to_dict
 from json import JSONDecodeError
+from json import JSONDecoder
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+# marks the list of sub documents in a field path, see `project_tables_from_documents`
+EACH_LIST_ITEM = '*'
+
+# the whitespace allowed between the json tokens
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
 
 def read_json_file_to_dict(file_path:Path) -> dict: # deprecated since moving to mongodb
     """
@@ -27,6 +38,116 @@ def read_json_file_to_dict(file_path:Path) -> dict: # deprecated since moving to
             return json_file_stream_to_dict(json_file)
         except JSONDecodeError:
             raise JSONDecodeError(f"File {file_path} is not a valid json file.")
+
+def stream_json_array_file(file_path:Path, chunk_size:int=1024 * 1024) -> Iterator[Any]:
+    """
+    Streams the elements of a json file holding a top level array (e.g. the events of a match), one element at a time.
+    The file is memory mapped and decoded a chunk at a time, so only the current chunk (and the current element)
+    is held in memory, no matter how big the file is.
+    
+    ## Parameters
+    file_path: Path
+        Path to the json file
+    chunk_size: int, default=1MB
+        Number of bytes decoded at a time, the chunk grows while an element is bigger than it
+    
+    ## Yields
+    Any
+        Each element of the array (usually a dictionary)
+        
+    ## Raises
+    FileNotFoundError
+        If the file does not exist
+    JSONDecodeError
+        If the file is not a valid json array
+    """
+    if not(file_path.exists()):
+        raise FileNotFoundError(f"File {file_path} does not exist.")
+    if file_path.stat().st_size == 0:
+        raise JSONDecodeError(f"File {file_path} is not a valid json file.", '', 0)
+    json_decoder = JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    with open(file_path, 'rb') as json_file, mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+        file_size = len(mapped_file)
+        file_offset = 0
+        buffer = ''
+        position = 0
+
+        def read_next_chunk() -> bool:
+            """
+            Appends the next chunk of the file to the (not yet parsed part of the) buffer, returns False at the end of the file.
+            """
+            nonlocal buffer, position, file_offset
+            if file_offset >= file_size:
+                return False
+            chunk = mapped_file[file_offset:file_offset + chunk_size]
+            file_offset += len(chunk)
+            buffer = buffer[position:] + utf8_decoder.decode(chunk, final=(file_offset >= file_size))
+            position = 0
+            return True
+
+        def next_token() -> str:
+            """
+            Skips the whitespace, and returns the next character of the file (or an empty string at the end of the file).
+            """
+            nonlocal position
+            while True:
+                position = JSON_WHITESPACE.match(buffer, position).end()
+                if position < len(buffer) or not(read_next_chunk()):
+                    return buffer[position:position + 1]
+
+        if next_token() != '[':
+            raise JSONDecodeError(f"File {file_path} is not a json array.", buffer, position)
+        position += 1
+        if next_token() == ']':
+            return
+        while True:
+            next_token()
+            try:
+                element, element_end = json_decoder.raw_decode(buffer, position)
+                # an element that ends with the buffer may be cut (e.g. a number), unless the whole file was read
+                is_complete = element_end < len(buffer) or file_offset >= file_size
+            except JSONDecodeError:
+                is_complete = False
+                if file_offset >= file_size:
+                    raise
+            if not(is_complete):
+                read_next_chunk()
+                continue
+            position = element_end
+            yield element
+            separator = next_token()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise JSONDecodeError(f"File {file_path} is not a valid json array, expecting ',' or ']'.", buffer, position)
+            position += 1
+
+def stream_json_array_file_in_batches(file_path:Path, docs_per_batch:int=1_000) -> Iterator[List[Any]]:
+    """
+    Streams the elements of a json file holding a top level array in batches (see `stream_json_array_file`),
+    so the peak memory depends on the batch size, not on the file size.
+    
+    ## Parameters
+    file_path: Path
+        Path to the json file
+    docs_per_batch: int, default=1_000
+        Number of elements in each yielded batch
+    
+    ## Yields
+    List[Any]
+        Batch of (at most `docs_per_batch`) elements of the array
+    """
+    if docs_per_batch < 1:
+        raise ValueError('docs_per_batch should be a positive integer')
+    docs_batch = []
+    for doc in stream_json_array_file(file_path):
+        docs_batch.append(doc)
+        if len(docs_batch) == docs_per_batch:
+            yield docs_batch
+            docs_batch = []
+    if docs_batch:
+        yield docs_batch
         
 def downcast_all_numerical_cols_in_df(df:pd.DataFrame) -> pd.DataFrame:
     """
@@ -45,4 +166,324 @@ def downcast_all_numerical_cols_in_df(df:pd.DataFrame) -> pd.DataFrame:
         df[col] = pd.to_numeric(df[col], downcast='float')        
     for col in df.select_dtypes(include=['int']).columns:
         df[col] = pd.to_numeric(df[col], downcast='integer')        
-    return df
\ No newline at end of file
+    return df
+
+def get_nested_field(document:dict, field_path:Tuple[Union[str, int], ...]):
+    """
+    Gets the value of a (possibly nested) field in a document, or None if any part of the path is missing.
+    
+    ## Parameters
+    document: dict
+        Document to get the field from
+    field_path: Tuple[Union[str, int], ...]
+        Keys to follow from the top of the document, integers are positions in a list, e.g. `('shot', 'end_location', 0)`
+    
+    ## Returns
+    Any
+        The value of the field, or None if it's missing
+    """
+    value = document
+    for key in field_path:
+        if isinstance(key, int):
+            if not(isinstance(value, list)) or len(value) <= key:
+                return None
+            value = value[key]
+        else:
+            if not(isinstance(value, dict)):
+                return None
+            value = value.get(key)
+            if value is None:
+                return None
+    return value
+
+def extract_fields_values_from_documents(documents:List[dict],
+                                        fields_paths:List[Tuple[Union[str, int], ...]]) -> Dict[Tuple[Union[str, int], ...], list]:
+    """
+    Gets the values of mutiple (possibly nested) fields from a list of documents, by following a field path per field.
+    The values are extracted one path level at a time for all the documents (instead of one document at a time),
+    and the values of the intermediate levels are shared between the paths with the same prefix, e.g. ('pass', 'end_location')
+    
+    ## Parameters
+    documents: List[dict]
+        Documents to get the fields from
+    fields_paths: List[Tuple[Union[str, int], ...]]
+        The paths of the fields to get (see `get_nested_field`)
+    
+    ## Returns
+    Dict[Tuple[Union[str, int], ...], list]
+        Dictionary mapping each field path to its values, one per document (missing fields are None)
+    """
+    prefixes_values = {(): documents}
+    for field_path in fields_paths:
+        for prefix_length in range(1, len(field_path) + 1):
+            prefix = tuple(field_path[:prefix_length])
+            if prefix in prefixes_values:
+                continue
+            key = prefix[-1]
+            parent_values = prefixes_values[prefix[:-1]]
+            if isinstance(key, int):
+                prefixes_values[prefix] = [value[key] if isinstance(value, list) and len(value) > key else None for value in parent_values]
+            else:
+                prefixes_values[prefix] = [value.get(key) if isinstance(value, dict) else None for value in parent_values]
+    return {tuple(field_path): prefixes_values[tuple(field_path)] for field_path in fields_paths}
+
+def extract_columns_from_documents(documents:List[dict], columns_paths:Dict[str, Tuple[Union[str, int], ...]]) -> pd.DataFrame:
+    """
+    Builds a dataframe from a list of (nested) documents, one column at a time, by following a field path per column.
+    This only touches the fields that are needed, unlike `pd.json_normalize` which flattens every field of every document,
+    so it's a lot lighter on wide documents with many optional fields (e.g. events).
+    
+    ## Parameters
+    documents: List[dict]
+        Documents to build the dataframe from, each one becomes a row
+    columns_paths: Dict[str, Tuple[Union[str, int], ...]]
+        Dictionary mapping each output column name to the path of its field in the documents (see `get_nested_field`)
+    
+    ## Returns
+    pd.DataFrame
+        Dataframe with a row per document, and a column per field path (missing fields are NaN/None)
+    """
+    fields_values = extract_fields_values_from_documents(documents, list(columns_paths.values()))
+    columns = {col_name: fields_values[tuple(field_path)] for col_name, field_path in columns_paths.items()}
+    return pd.DataFrame(columns, columns=list(columns_paths.keys()))
+
+def get_first_rows_positions_of_keys(key_columns_values:List[list], seen_keys:set) -> List[int]:
+    """
+    Gets the positions of the rows whose key wasn't seen yet (neither in `seen_keys`, nor in a previous row),
+    and adds their keys to `seen_keys`, i.e. the rows kept by `drop_duplicates(subset=key)`, without building a dataframe first.
+    
+    ## Parameters
+    key_columns_values: List[list]
+        The values of each key column, one per row
+    seen_keys: set
+        The keys that were already seen (a tuple of values per key, or the value itself for a single key column), updated in place
+    
+    ## Returns
+    List[int]
+        The positions of the first row of each new key
+    """
+    first_rows_positions = []
+    # a single key column is looked up by its values, instead of by 1-tuples of them
+    keys = key_columns_values[0] if len(key_columns_values) == 1 else zip(*key_columns_values)
+    for position, key in enumerate(keys):
+        if key not in seen_keys:
+            seen_keys.add(key)
+            first_rows_positions.append(position)
+    return first_rows_positions
+
+def project_tables_columns_from_documents(documents:List[dict], tables_specs:Dict[str, dict]) -> Dict[str, List[Dict[str, list]]]:
+    """
+    Gets the values of the columns of mutiple tables from a list of (nested) documents, as described by a table spec per table
+    (see `project_tables_from_documents`). The key fields of all the tables are extracted together
+    (see `extract_fields_values_from_documents`), so the documents are only gone through once for them.
+    The rows of each table are deduplicated on its key (keeping the first row, across all its sources) while they're still lists,
+    and the rest of the fields are only extracted from the documents of the kept rows, so a dimension repeated in every document
+    (e.g. the stadium, or the teams, of each match) is only read (and stored) once per distinct key, e.g. the name of a stadium
+    is read from the first match played in it, instead of being copied for every match and dropped later by a `drop_duplicates`.
+    
+    ## Parameters
+    documents: List[dict]
+        Documents to get the columns from
+    tables_specs: Dict[str, dict]
+        Dictionary mapping each output table name to its table spec
+    
+    ## Returns
+    Dict[str, List[Dict[str, list]]]
+        Dictionary mapping each table name to the columns of each of its sources (column name -> values), in the same order,
+        without the rows whose key is in a previous row (of the same source or of a previous one),
+        except for the sources whose columns are all key columns, which still have to be deduplicated
+    
+    ## Raises
+    ValueError
+        If a path (or a source) goes through more than one list of sub documents
+    """
+    def split_path(field_path:Tuple[Union[str, int], ...]) -> Tuple[tuple, tuple]:
+        """
+        Splits a path into the path of its list of sub documents and the path of the field inside the sub documents,
+        the list path is empty if the path doesn't go through a list.
+        """
+        if EACH_LIST_ITEM not in field_path:
+            return (), tuple(field_path)
+        if field_path.count(EACH_LIST_ITEM) > 1:
+            raise ValueError(f'the path {field_path} goes through more than one list of sub documents')
+        list_item_position = field_path.index(EACH_LIST_ITEM)
+        return tuple(field_path[:list_item_position]), tuple(field_path[list_item_position + 1:])
+    
+    # collecting the key fields of the documents, and of each list of sub documents, of all the tables
+    documents_fields_paths = {}
+    lists_fields_paths = {}
+    for table_spec in tables_specs.values():
+        for source in table_spec['sources']:
+            for col_name, field_path in source.items():
+                list_path, item_field_path = split_path(field_path)
+                if list_path:
+                    documents_fields_paths[list_path] = None
+                    lists_fields_paths.setdefault(list_path, {})
+                    if col_name in table_spec['key']:
+                        lists_fields_paths[list_path][item_field_path] = None
+                elif col_name in table_spec['key']:
+                    documents_fields_paths[item_field_path] = None
+    documents_fields_values = extract_fields_values_from_documents(documents, list(documents_fields_paths.keys()))
+    
+    # flattening each list of sub documents once, keeping the position of the document each item belongs to
+    # (the documents are the items of the empty list path, so both are looked up the same way below)
+    lists_items = {(): documents}
+    lists_items_positions = {}
+    lists_fields_values = {(): documents_fields_values}
+    for list_path, item_fields_paths in lists_fields_paths.items():
+        items = []
+        items_positions = []
+        for position, list_value in enumerate(documents_fields_values[list_path]):
+            if isinstance(list_value, list) and list_value:
+                items.extend(list_value)
+                items_positions.extend([position] * len(list_value))
+            else:
+                items.append(None)
+                items_positions.append(position)
+        lists_items[list_path] = items
+        lists_items_positions[list_path] = items_positions
+        lists_fields_values[list_path] = extract_fields_values_from_documents(items, list(item_fields_paths.keys()))
+    
+    dict_return = {}
+    for table_name, table_spec in tables_specs.items():
+        # the keys of the rows of the previous sources, e.g. a team that played at home in a match and away in another one
+        seen_keys = set()
+        sources_columns = []
+        for source in table_spec['sources']:
+            source_list_paths = {split_path(field_path)[0] for field_path in source.values()} - {()}
+            if len(source_list_paths) > 1:
+                raise ValueError(f'the source {source} of the table {table_name} goes through more than one list of sub documents')
+            source_list_path = source_list_paths.pop() if source_list_paths else ()
+            # the position of each row of the source in the documents (and in its list of sub documents),
+            # a source that goes through a list has a row per item, the fields of the documents are repeated for all their items
+            rows_positions = {(): lists_items_positions[source_list_path] if source_list_path else range(len(documents))}
+            if source_list_path:
+                rows_positions[source_list_path] = range(len(lists_items[source_list_path]))
+    
+            def get_rows_values(list_path:tuple, fields_values:Dict[tuple, list], item_field_path:tuple) -> list:
+                """
+                Gets the values of a field for the rows of the source, from the values extracted from all the (sub) documents.
+                """
+                if isinstance(rows_positions[list_path], range):
+                    return fields_values[item_field_path]
+                return [fields_values[item_field_path][position] for position in rows_positions[list_path]]
+    
+            # a source whose columns are all key columns (e.g. the matches of each team's managers) has nothing left to extract,
+            # so its rows are left for the caller to deduplicate (with `drop_duplicates`), which takes less memory than a set of tuples
+            if set(source.keys()) - set(table_spec['key']):
+                key_columns_values = []
+                for key_col in table_spec['key']:
+                    list_path, item_field_path = split_path(source[key_col])
+                    key_columns_values.append(get_rows_values(list_path, lists_fields_values[list_path], item_field_path))
+                first_rows_positions = get_first_rows_positions_of_keys(key_columns_values, seen_keys)
+                if len(first_rows_positions) < len(rows_positions[source_list_path]):
+                    rows_positions = {list_path: [positions[position] for position in first_rows_positions]
+                                      for list_path, positions in rows_positions.items()}
+    
+            # extracting the rest of the fields from the (sub) documents of the kept rows only
+            kept_fields_paths = {}
+            for field_path in source.values():
+                list_path, item_field_path = split_path(field_path)
+                if item_field_path not in lists_fields_values[list_path]:
+                    kept_fields_paths.setdefault(list_path, {})[item_field_path] = None
+            kept_fields_values = {}
+            for list_path, item_fields_paths in kept_fields_paths.items():
+                kept_items = lists_items[list_path]
+                if not(isinstance(rows_positions[list_path], range)):
+                    kept_items = [kept_items[position] for position in rows_positions[list_path]]
+                kept_fields_values[list_path] = extract_fields_values_from_documents(kept_items, list(item_fields_paths.keys()))
+    
+            columns = {}
+            for col_name, field_path in source.items():
+                list_path, item_field_path = split_path(field_path)
+                if item_field_path in kept_fields_values.get(list_path, {}):
+                    columns[col_name] = kept_fields_values[list_path][item_field_path]
+                else:
+                    columns[col_name] = get_rows_values(list_path, lists_fields_values[list_path], item_field_path)
+            sources_columns.append(columns)
+        dict_return[table_name] = sources_columns
+    return dict_return
+
+def project_tables_from_documents(documents:List[dict], tables_specs:Dict[str, dict]) -> Dict[str, pd.DataFrame]:
+    """
+    Builds mutiple tables from a list of (nested) documents, as described by a table spec per table.
+    All the fields of all the tables are extracted together (see `project_tables_columns_from_documents`),
+    so the documents are only gone through once, and no intermediate wide dataframe (e.g. from `pd.json_normalize`) is built.
+    
+    Each table spec is a dictionary with:
+    - `sources`: a list of dictionaries, each one mapping the output column names to the paths of their fields.
+      The rows of all the sources are stacked (e.g. the home team and the away team of a match are two sources of the teams table).
+      A path can go through a list of sub documents with `EACH_LIST_ITEM`, e.g. `('home_team', 'managers', EACH_LIST_ITEM, 'id')`,
+      then the source has a row per item of the list (or a single row with missing values if the list is empty or missing),
+      and the columns without `EACH_LIST_ITEM` are repeated for all the items of the same document.
+    - `key`: the key columns of the table, the rows are deduplicated on them (keeping the first row).
+      The rows are deduplicated before the rest of their fields are extracted (see `project_tables_columns_from_documents`).
+    - `downcast` (optional, default is False): whether to downcast the numerical columns of the table.
+    
+    ## Parameters
+    documents: List[dict]
+        Documents to build the tables from
+    tables_specs: Dict[str, dict]
+        Dictionary mapping each output table name to its table spec
+    
+    ## Returns
+    Dict[str, pd.DataFrame]
+        Dictionary with a dataframe per table spec (in the same order)
+    """
+    dict_return = {}
+    for table_name, sources_columns in project_tables_columns_from_documents(documents, tables_specs).items():
+        table_spec = tables_specs[table_name]
+        source_dframes = [pd.DataFrame(columns, columns=list(columns.keys())) for columns in sources_columns]
+        # the sources whose rows were all dropped (their keys were in a previous source) have empty object columns,
+        # which would turn the integer columns of the other sources into floats (or objects) once concatenated
+        source_dframes = [source_df for source_df in source_dframes if not(source_df.empty)] or source_dframes[:1]
+        df = pd.concat(source_dframes, axis=0, ignore_index=True) if len(source_dframes) > 1 else source_dframes[0]
+        df = df.drop_duplicates(subset=table_spec['key'], ignore_index=True)
+        if table_spec.get('downcast', False):
+            df = downcast_all_numerical_cols_in_df(df)
+        dict_return[table_name] = df
+    return dict_return
+
+def get_tables_specs_fields_paths(tables_specs:Dict[str, dict]) -> List[Tuple[Union[str, int], ...]]:
+    """
+    Gets the paths of all the fields that are read by mutiple tables specs (see `project_tables_from_documents`), without duplicates.
+    """
+    fields_paths = {}
+    for table_spec in tables_specs.values():
+        for source in table_spec['sources']:
+            for field_path in source.values():
+                fields_paths[tuple(field_path)] = None
+    return list(fields_paths.keys())
+
+def build_projection_from_fields_paths(fields_paths:List[Tuple[Union[str, int], ...]]) -> Dict[str, bool]:
+    """
+    Builds a mongodb projection that only returns the fields a transform reads (and not `_id`),
+    so the rest of each document doesn't have to be sent by the server, nor decoded by the driver.
+    The documents keep their nesting, so they can be parsed by the same functions as the full documents.
+    
+    ## Parameters
+    fields_paths: List[Tuple[Union[str, int], ...]]
+        The paths of the fields (as in `get_nested_field`), the lists of sub documents (`EACH_LIST_ITEM`) are projected
+        on the fields of their items (e.g. `home_team.managers.id`), and the positions in a list keep the whole list
+        (e.g. `location`, as a projection can't select an item of a list)
+    
+    ## Returns
+    Dict[str, bool]
+        The projection, e.g. `{'_id': False, 'match_id': True, 'home_team.managers.id': True}`
+    """
+    dotted_paths = set()
+    for field_path in fields_paths:
+        path_keys = []
+        for key in field_path:
+            if isinstance(key, int):
+                break
+            if key != EACH_LIST_ITEM:
+                path_keys.append(key)
+        dotted_paths.add('.'.join(path_keys))
+    # a field can't be projected together with one of its sub fields (a path collision), the parent field covers both
+    projection = {'_id': False}
+    for dotted_path in sorted(dotted_paths):
+        path_parts = dotted_path.split('.')
+        if not(any('.'.join(path_parts[:i]) in projection for i in range(1, len(path_parts)))):
+            projection[dotted_path] = True
+    return projection
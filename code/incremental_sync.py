@@ -0,0 +1,275 @@
+import pandas as pd
+import pymongo.database
+import sqlalchemy
+import sqlite3
+
+from json import dump as dict_to_json_file_stream
+from pathlib import Path
+from typing import Dict, List
+
+from helpful_funcs import read_json_file_to_dict
+
+from json_data_parser_funcs import parse_and_process_competitions_dict
+from json_data_parser_funcs import parse_and_process_matches_dict
+from json_data_parser_funcs import normalize_countries_field_df_competitions
+from json_data_parser_funcs import MATCHES_PROJECTION
+
+from mongodb_downloader import download_collection_to_list_of_dicts
+from mongodb_downloader import stream_collection_in_batches
+
+from mysql_db_funcs import upsert_dataframe_to_sql_table
+from mysql_db_funcs import replace_dataframe_rows_in_sql_table
+
+from mysql_load_scheduler import parse_foreign_keys_dependencies
+from mysql_load_scheduler import sort_tables_by_dependencies
+
+from dimension_key_index import open_dimension_key_index
+from dimension_key_index import filter_new_dimension_rows
+from dimension_key_index import record_dimension_rows
+from dimension_key_index import read_natural_keys_ids
+
+from pipeline_metrics import measure_each_item
+from pipeline_metrics import measure_stage
+
+# the primary key of each table that is upserted with `INSERT ... ON DUPLICATE KEY UPDATE`
+UPSERT_TABLES_KEY_COLUMNS = {'countries': ['country_id'],
+                             'competitions': ['competition_id'],
+                             'competition_stages': ['competition_stage_id'],
+                             'stadiums': ['stadium_id'],
+                             'referees': ['referee_id'],
+                             'team_base_info': ['team_id'],
+                             'managers_base_data': ['manager_id'],
+                             'matches': ['match_id']}
+
+# the tables without a primary key, their rows are replaced (deleted and re-inserted) per value of the key column
+REPLACE_TABLES_KEY_COLUMN = {'team_managers_matches': 'match_id',
+                             'seasons': 'competition_id'}
+
+# the field of the matches documents that holds the time the document was last updated (an ISO 8601 string)
+MATCHES_HIGH_WATER_MARK_FIELD = 'last_updated'
+
+
+def read_high_water_marks(high_water_marks_file_path: Path) -> Dict[str, str]:
+    """
+    Reads the high water marks (the latest `last_updated` value synced from each collection) of the previous syncs.
+
+    ## Parameters
+    high_water_marks_file_path: Path
+        Path to the json file holding the high water marks
+
+    ## Returns
+    Dict[str, str]
+        Dictionary mapping each collection name to its high water mark (empty if no sync was done yet)
+    """
+    if not(high_water_marks_file_path.exists()):
+        return {}
+    return read_json_file_to_dict(high_water_marks_file_path)
+
+
+def write_high_water_marks(high_water_marks: Dict[str, str], high_water_marks_file_path: Path) -> None:
+    """
+    Saves the high water marks, so the next sync only extracts the documents updated after them.
+
+    ## Parameters
+    high_water_marks: Dict[str, str]
+        Dictionary mapping each collection name to its high water mark
+    high_water_marks_file_path: Path
+        Path to the json file holding the high water marks
+    """
+    high_water_marks_file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(high_water_marks_file_path, 'w') as json_file:
+        dict_to_json_file_stream(high_water_marks, json_file, indent=4)
+    return None
+
+
+def sync_dframes_to_sql_tables(sql_dframes_dict: Dict[str, pd.DataFrame],
+                               connection: sqlalchemy.Connection,
+                               tables_order: List[str],
+                               chunksize: int=None) -> Dict[str, int]:
+    """
+    Upserts (or replaces the rows of) each dataframe into its table, following the given tables order.
+
+    ## Parameters
+    sql_dframes_dict: Dict[str, pd.DataFrame]
+        Dictionary mapping the table names in the MySQL database to the dataframes to sync
+    connection: sqlalchemy.Connection
+        The connection to the MySQL database
+    tables_order: List[str]
+        The order to sync the tables in (the tables missing from `sql_dframes_dict` are skipped)
+    chunksize: int, default=None
+        The number of rows per statement, by default it's estimated from the server's `max_allowed_packet`
+
+    ## Returns
+    Dict[str, int]
+        Dictionary mapping each table name to the number of synced rows
+    """
+    synced_rows = {}
+    for sql_table_name in tables_order:
+        if sql_table_name not in sql_dframes_dict:
+            continue
+        dframe = sql_dframes_dict[sql_table_name]
+        if sql_table_name in REPLACE_TABLES_KEY_COLUMN:
+            synced_rows[sql_table_name] = replace_dataframe_rows_in_sql_table(dframe, sql_table_name, connection,
+                                                                              key_column=REPLACE_TABLES_KEY_COLUMN[sql_table_name],
+                                                                              chunksize=chunksize)
+        else:
+            synced_rows[sql_table_name] = upsert_dataframe_to_sql_table(dframe, sql_table_name, connection,
+                                                                        key_columns=UPSERT_TABLES_KEY_COLUMNS[sql_table_name],
+                                                                        chunksize=chunksize)
+    return synced_rows
+
+
+def sync_dframes_to_sql_tables_with_index(sql_dframes_dict: Dict[str, pd.DataFrame],
+                                          connection: sqlalchemy.Connection,
+                                          index_connection: sqlite3.Connection,
+                                          tables_order: List[str],
+                                          chunksize: int=None) -> Dict[str, int]:
+    """
+    Syncs the dataframes with `sync_dframes_to_sql_tables`, skipping the dimension rows that the dimension key index
+    records as already synced (unchanged), and records the synced dimension rows in the index (without committing it).
+
+    ## Parameters
+    sql_dframes_dict: Dict[str, pd.DataFrame]
+        Dictionary mapping the table names in the MySQL database to the dataframes to sync
+    connection: sqlalchemy.Connection
+        The connection to the MySQL database
+    index_connection: sqlite3.Connection
+        The connection to the dimension key index
+    tables_order: List[str]
+        The order to sync the tables in (the tables missing from `sql_dframes_dict` are skipped)
+    chunksize: int, default=None
+        The number of rows per statement, by default it's estimated from the server's `max_allowed_packet`
+
+    ## Returns
+    Dict[str, int]
+        Dictionary mapping each table name to the number of synced rows
+    """
+    sql_dframes_dict = {sql_table_name: filter_new_dimension_rows(index_connection, sql_table_name, dframe)
+                        for sql_table_name, dframe in sql_dframes_dict.items()}
+    synced_rows = sync_dframes_to_sql_tables(sql_dframes_dict, connection, tables_order, chunksize)
+    for sql_table_name, dframe in sql_dframes_dict.items():
+        record_dimension_rows(index_connection, sql_table_name, dframe)
+    return synced_rows
+
+
+def read_countries_table(connection: sqlalchemy.Connection) -> pd.DataFrame:
+    """
+    Reads the countries lookup table from the MySQL database.
+    """
+    rows = connection.execute(sqlalchemy.text('SELECT country_id, country_name FROM countries')).fetchall()
+    return pd.DataFrame(rows, columns=['country_id', 'country_name'])
+
+
+def run_incremental_sync(mongodb_db: pymongo.database.Database,
+                         mysql_engine: sqlalchemy.Engine,
+                         sql_foreign_keys_file_path: Path,
+                         high_water_marks_file_path: Path=None,
+                         docs_per_batch: int=5_000,
+                         cursor_batch_size: int=1_000,
+                         upload_chunksize: int=None,
+                         dimension_key_index_path: Path=None) -> Dict[str, int]:
+    """
+    Syncs the MySQL database with the matches that were added or updated in the mongodb database since the previous sync,
+    instead of dropping and reloading all the tables. The tables should already exist (i.e. after a full load).
+
+    Only the matches documents with a `last_updated` value at or after the saved high water mark are extracted,
+    and their rows are upserted into `matches`, the lookup tables, and `team_managers_matches`.
+    The competitions collection is small, so it's always fully synced.
+    Everything is synced in a single transaction, and the new high water mark is only saved after it's committed,
+    so a failed sync is simply retried by the next run.
+
+    ## Parameters
+    mongodb_db: pymongo.database.Database
+        The mongodb database to extract the documents from
+    mysql_engine: sqlalchemy.Engine
+        The engine of the MySQL database
+    sql_foreign_keys_file_path: Path
+        The path to the foreign keys commands file, used to sync the tables in the order of their foreign keys
+    high_water_marks_file_path: Path, default=None
+        Path to the json file holding the high water marks (default is `sync_state/high_water_marks.json`)
+    docs_per_batch: int, default=5_000
+        Number of matches documents processed and synced at a time
+    cursor_batch_size: int, default=1_000
+        Number of documents the mongodb cursor fetches per round trip
+    upload_chunksize: int, default=None
+        The number of rows per statement, by default it's estimated from the server's `max_allowed_packet`
+    dimension_key_index_path: Path, default=None
+        Path to the dimension key index (see dimension_key_index.py), only the dimension rows that aren't in it are synced,
+        and it's updated once the sync is committed (default is `sync_state/dimension_key_index.sqlite`)
+
+    ## Returns
+    Dict[str, int]
+        Dictionary mapping each table name to the number of synced rows
+    """
+    if high_water_marks_file_path is None:
+        high_water_marks_file_path = Path().cwd() / 'sync_state' / 'high_water_marks.json'
+    high_water_marks = read_high_water_marks(high_water_marks_file_path)
+    matches_high_water_mark = high_water_marks.get('matches')
+    # the documents updated exactly at the high water mark are synced again, which is harmless as the sync is idempotent
+    matches_query = {MATCHES_HIGH_WATER_MARK_FIELD: {'$gte': matches_high_water_mark}} if matches_high_water_mark else {}
+    print(f'syncing matches updated since {matches_high_water_mark}')
+
+    dependencies = parse_foreign_keys_dependencies(sql_foreign_keys_file_path)
+    tables_order = sort_tables_by_dependencies(list(UPSERT_TABLES_KEY_COLUMNS.keys()) + list(REPLACE_TABLES_KEY_COLUMN.keys()),
+                                               dependencies)
+    synced_rows = {sql_table_name: 0 for sql_table_name in tables_order}
+    new_matches_high_water_mark = matches_high_water_mark
+
+    # the rows recorded in the index are only committed after the MySQL transaction (closing it without a commit discards them),
+    # so it never records rows that were rolled back
+    index_connection = open_dimension_key_index(dimension_key_index_path)
+    try:
+        with mysql_engine.begin() as mysql_connection:
+            # the rows are synced in the order of the foreign keys, but a match can reference a competition that is only
+            # synced at the end (it needs the synced countries), so the checks are disabled until the transaction is complete
+            mysql_connection.execute(sqlalchemy.text('SET foreign_key_checks = 0'))
+
+            matches_batches = stream_collection_in_batches(mongodb_db.get_collection('matches'),
+                                                           docs_per_batch=docs_per_batch,
+                                                           cursor_batch_size=cursor_batch_size,
+                                                           query=matches_query,
+                                                           projection={**MATCHES_PROJECTION, MATCHES_HIGH_WATER_MARK_FIELD: True})
+            matches_batches = measure_each_item(matches_batches, 'extract', rows_func=len, collection='matches')
+            for batch_number, matches_batch in enumerate(matches_batches, start=1):
+                print(f'syncing matches batch {batch_number} ({len(matches_batch)} documents)')
+                batch_high_water_mark = max((doc[MATCHES_HIGH_WATER_MARK_FIELD] for doc in matches_batch
+                                             if doc.get(MATCHES_HIGH_WATER_MARK_FIELD) is not None), default=None)
+                if batch_high_water_mark is not None and (new_matches_high_water_mark is None or batch_high_water_mark > new_matches_high_water_mark):
+                    new_matches_high_water_mark = batch_high_water_mark
+                with measure_stage('transform', collection='matches', function='parse_and_process_matches_dict') as stage_metrics:
+                    matches_dframes_dict = parse_and_process_matches_dict(matches_batch)
+                    stage_metrics['rows'] = len(matches_batch)
+                sql_dframes_dict = {table_name.replace('df_', ''): dframe for table_name, dframe in matches_dframes_dict.items()}
+                for sql_table_name, rows_count in sync_dframes_to_sql_tables_with_index(sql_dframes_dict, mysql_connection, index_connection,
+                                                                                        tables_order, upload_chunksize).items():
+                    synced_rows[sql_table_name] += rows_count
+
+            print('syncing competitions collection')
+            with measure_stage('extract', collection='competitions') as stage_metrics:
+                competitions_dict = download_collection_to_list_of_dicts(mongodb_db.get_collection('competitions'))
+                stage_metrics['rows'] = len(competitions_dict)
+            with measure_stage('transform', collection='competitions', function='parse_and_process_competitions_dict') as stage_metrics:
+                competitions_dframes_dict = parse_and_process_competitions_dict(competitions_dict)
+                stage_metrics['rows'] = len(competitions_dict)
+            # the countries of all the previous syncs are in the database, not only the ones of this sync's matches,
+            # they're looked up in the index (which has the ones of this sync as well), or read from the database if the index is empty
+            countries_ids = read_natural_keys_ids(index_connection, 'countries')
+            if not(countries_ids):
+                countries_ids = dict(read_countries_table(mysql_connection)[['country_name', 'country_id']].itertuples(index=False))
+            competitions_dframes_dict['df_competitions'] = normalize_countries_field_df_competitions(competitions_dframes_dict['df_competitions'],
+                                                                                                     countries_ids=countries_ids)
+            sql_dframes_dict = {table_name.replace('df_', ''): dframe for table_name, dframe in competitions_dframes_dict.items()}
+            for sql_table_name, rows_count in sync_dframes_to_sql_tables_with_index(sql_dframes_dict, mysql_connection, index_connection,
+                                                                                    tables_order, upload_chunksize).items():
+                synced_rows[sql_table_name] += rows_count
+
+            mysql_connection.execute(sqlalchemy.text('SET foreign_key_checks = 1'))
+        index_connection.commit()
+    finally:
+        index_connection.close()
+
+    if new_matches_high_water_mark is not None:
+        high_water_marks['matches'] = new_matches_high_water_mark
+        write_high_water_marks(high_water_marks, high_water_marks_file_path)
+    print(f'synced rows per table: {synced_rows}')
+    return synced_rows
@@ -5,6 +5,134 @@ from typing import Dict, List
 from tabulate import tabulate
 from helpful_funcs import read_json_file_to_dict
 from helpful_funcs import downcast_all_numerical_cols_in_df
+from helpful_funcs import project_tables_from_documents
+from helpful_funcs import EACH_LIST_ITEM
+from helpful_funcs import get_tables_specs_fields_paths
+from helpful_funcs import build_projection_from_fields_paths
+from typed_fields_parser import parse_dates
+from typed_fields_parser import combine_dates_and_times
+from typed_fields_parser import parse_season_years
+
+def get_team_tables_sources(is_home_team:bool) -> Dict[str, Dict[str, tuple]]:
+    """
+    The home and away teams of a match have the same fields (prefixed by `home_team`/`away_team`),
+    this returns the sources (see `project_tables_from_documents`) of the teams and managers tables for one of them.
+    """
+    prefix = 'home_team' if is_home_team else 'away_team'
+    manager_path = (prefix, 'managers', EACH_LIST_ITEM)
+    return {'df_team_base_info': {'team_id': (prefix, f'{prefix}_id'),
+                                  'team_name': (prefix, f'{prefix}_name'),
+                                  'team_gender': (prefix, f'{prefix}_gender'),
+                                  'country_id': (prefix, 'country', 'id'),
+                                  'country_name': (prefix, 'country', 'name')},
+            'df_team_managers_matches': {'match_id': ('match_id',),
+                                         'team_id': (prefix, f'{prefix}_id'),
+                                         'manager_id': manager_path + ('id',)},
+            'df_managers_base_data': {'manager_id': manager_path + ('id',),
+                                      'manager_name': manager_path + ('name',),
+                                      'manager_nickname': manager_path + ('nickname',),
+                                      'manager_dob': manager_path + ('dob',),
+                                      'country_id': manager_path + ('country', 'id'),
+                                      'country_name': manager_path + ('country', 'name')}}
+
+# the output tables of the matches data, described as tables specs (see `project_tables_from_documents`),
+# the columns that hold a country (id, name) pair are later moved to the countries table (see `extract_countries_lookup_table`)
+MATCHES_TABLES_SPECS = {'df_matches': {'key': ['match_id'],
+                                       'sources': [{'match_id': ('match_id',),
+                                                    'home_score': ('home_score',),
+                                                    'away_score': ('away_score',),
+                                                    'match_week': ('match_week',),
+                                                    'competition_id': ('competition', 'competition_id'),
+                                                    'season_id': ('season', 'season_id'),
+                                                    'home_team_id': ('home_team', 'home_team_id'),
+                                                    'away_team_id': ('away_team', 'away_team_id'),
+                                                    'competition_stage_id': ('competition_stage', 'id'),
+                                                    'stadium_id': ('stadium', 'id'),
+                                                    'referee_id': ('referee', 'id'),
+                                                    'match_date': ('match_date',),
+                                                    'kick_off': ('kick_off',)}]},
+                        'df_competition_stages': {'key': ['competition_stage_id'],
+                                                  'downcast': True,
+                                                  'sources': [{'competition_stage_id': ('competition_stage', 'id'),
+                                                               'competition_stage_name': ('competition_stage', 'name')}]},
+                        'df_stadiums': {'key': ['stadium_id'],
+                                        'downcast': True,
+                                        'sources': [{'stadium_id': ('stadium', 'id'),
+                                                     'stadium_name': ('stadium', 'name'),
+                                                     'country_id': ('stadium', 'country', 'id'),
+                                                     'country_name': ('stadium', 'country', 'name')}]},
+                        'df_referees': {'key': ['referee_id'],
+                                        'downcast': True,
+                                        'sources': [{'referee_id': ('referee', 'id'),
+                                                     'referee_name': ('referee', 'name'),
+                                                     'country_id': ('referee', 'country', 'id'),
+                                                     'country_name': ('referee', 'country', 'name')}]},
+                        'df_team_base_info': {'key': ['team_id'],
+                                              'sources': [get_team_tables_sources(is_home_team)['df_team_base_info']
+                                                          for is_home_team in [True, False]]},
+                        'df_team_managers_matches': {'key': ['match_id', 'team_id', 'manager_id'],
+                                                     'sources': [get_team_tables_sources(is_home_team)['df_team_managers_matches']
+                                                                 for is_home_team in [True, False]]},
+                        'df_managers_base_data': {'key': ['manager_id'],
+                                                  'sources': [get_team_tables_sources(is_home_team)['df_managers_base_data']
+                                                              for is_home_team in [True, False]]}}
+
+# all the (flattened) fields of a match document that are referenced while parsing the matches data with `pd.json_normalize`,
+# some of them are optional in the source data (e.g. stadium, referee, managers), so a batch of documents
+# might not contain them at all, they are added as empty columns in that case.
+MATCHES_SOURCE_COLUMNS = ['match_id',
+                          'match_date',
+                          'kick_off',
+                          'competition.competition_id',
+                          'competition.country_name',
+                          'competition.competition_name',
+                          'season.season_id',
+                          'season.season_name',
+                          'home_team.home_team_id',
+                          'home_team.home_team_name',
+                          'home_team.home_team_gender',
+                          'home_team.home_team_group',
+                          'home_team.country.id',
+                          'home_team.country.name',
+                          'home_team.managers',
+                          'away_team.away_team_id',
+                          'away_team.away_team_name',
+                          'away_team.away_team_gender',
+                          'away_team.away_team_group',
+                          'away_team.country.id',
+                          'away_team.country.name',
+                          'away_team.managers',
+                          'home_score',
+                          'away_score',
+                          'match_status',
+                          'match_status_360',
+                          'last_updated',
+                          'last_updated_360',
+                          'metadata.data_version',
+                          'metadata.shot_fidelity_version',
+                          'metadata.xy_fidelity_version',
+                          'match_week',
+                          'competition_stage.id',
+                          'competition_stage.name',
+                          'stadium.id',
+                          'stadium.name',
+                          'stadium.country.id',
+                          'stadium.country.name',
+                          'referee.id',
+                          'referee.name',
+                          'referee.country.id',
+                          'referee.country.name']
+
+# the fields of a single manager (inside the home_team/away_team managers lists)
+MANAGERS_SOURCE_COLUMNS = ['id', 'name', 'nickname', 'dob', 'country.id', 'country.name']
+
+# the output tables of the matches data that hold one row per match (or per team per match),
+# the rest of the output tables are lookup (dimension) tables.
+MATCHES_FACT_TABLES = ['df_matches', 'df_team_managers_matches']
+
+# the mongodb projection of the matches collection, only the fields of the matches tables are fetched
+# (e.g. not `metadata`, `last_updated_360` or `match_status`)
+MATCHES_PROJECTION = build_projection_from_fields_paths(get_tables_specs_fields_paths(MATCHES_TABLES_SPECS))
 
 def parse_and_process_competitions_dict(competitions_dict:dict) -> Dict[str, pd.DataFrame]:
     """
@@ -30,10 +158,8 @@ def parse_and_process_competitions_dict(competitions_dict:dict) -> Dict[str, pd.
     
     # extracting the seasons table
     df_seasons = df_competitions[['competition_id', 'season_id', 'season_name']].drop_duplicates(ignore_index=True)
-    df_seasons.season_name = df_seasons.season_name.str.split('/')
     ## extracting the start and end year of the season
-    df_seasons['season_start_year'] = df_seasons.season_name.apply(lambda x: x[0]).astype(int)
-    df_seasons['season_end_year'] = df_seasons.season_name.apply(lambda x: x[1] if len(x) > 1 else x[0]).astype(int)
+    df_seasons['season_start_year'], df_seasons['season_end_year'] = parse_season_years(df_seasons.season_name)
     df_seasons.drop('season_name', axis=1, inplace=True)
     ## downcasting the numerical columns
     df_seasons = downcast_all_numerical_cols_in_df(df_seasons)
@@ -94,10 +220,13 @@ def read_matches_dicts_from_json_files(matches_json_file_paths:List[Path]) -> Li
     return matches_dicts
 
 
-def parse_and_process_matches_dict(matches_dict:dict) -> Dict[str, pd.DataFrame]:
+# deprecated since moving to the tables specs (see `MATCHES_TABLES_SPECS`), kept as the baseline of benchmark_matches_transform.py
+def parse_and_process_matches_dict_with_json_normalize(matches_dict:dict) -> Dict[str, pd.DataFrame]:
     """
+    `deprecated since moving to the tables specs.`\n
     This function parses and processes the matches JSON files that were previously read into a dictionary.
     And it produces a dictionary containing mutiple dataframe, each one will be saved to a separate table in the SQL database.
+    (the output is the same as `parse_and_process_matches_dict`)
     
     ## Parameters
     - matches_dict: dict
@@ -156,10 +285,12 @@ def parse_and_process_matches_dict(matches_dict:dict) -> Dict[str, pd.DataFrame]
     """
     
     df_matches = pd.json_normalize(matches_dict)
+    missing_cols = [col for col in MATCHES_SOURCE_COLUMNS if col not in df_matches.columns]
+    for col in missing_cols:
+        df_matches[col] = None
     
     # match_date and kick_off are in different columns, we need to combine them into one column
-    df_matches['match_datetime'] = (df_matches.match_date) + ' ' + (df_matches.kick_off)
-    df_matches.match_datetime = pd.to_datetime(df_matches.match_datetime, format='%Y-%m-%d %H:%M:%S')
+    df_matches['match_datetime'] = combine_dates_and_times(df_matches.match_date, df_matches.kick_off)
     df_matches.drop(columns=['match_date', 'kick_off'], inplace=True)
     
     # the next dictionary will be used to hold all the dataframes that will be extracted from the matches JSON files
@@ -292,6 +423,7 @@ def parse_and_process_matches_dict(matches_dict:dict) -> Dict[str, pd.DataFrame]
         
         df_team_managers_step_3_left = df_team_managers_step_2.drop(columns=['managers'])
         df_team_managers_step_3_right = pd.json_normalize(df_team_managers_step_2.managers)
+        df_team_managers_step_3_right = df_team_managers_step_3_right.reindex(columns=MANAGERS_SOURCE_COLUMNS)
         df_team_managers_step_3_right.rename(columns={'id': 'manager_id',
                                                       'name': 'manager_name',
                                                       'nickname': 'manager_nickname',
@@ -299,7 +431,7 @@ def parse_and_process_matches_dict(matches_dict:dict) -> Dict[str, pd.DataFrame]
                                                       'country.id': 'country_id',
                                                       'country.name': 'country_name'}, 
                                              inplace=True)
-        df_team_managers_step_3_right.manager_dob = pd.to_datetime(df_team_managers_step_3_right.manager_dob, format='%Y-%m-%d')
+        df_team_managers_step_3_right.manager_dob = parse_dates(df_team_managers_step_3_right.manager_dob)
         
         df_team_managers_step_4 = pd.concat([df_team_managers_step_3_left,df_team_managers_step_3_right], axis=1)
         
@@ -339,6 +471,113 @@ def parse_and_process_matches_dict(matches_dict:dict) -> Dict[str, pd.DataFrame]
     dataframes_dict['df_managers_base_data'] = df_managers_base_data.drop_duplicates(ignore_index=True)
           
     # generating the countries lookup table
+    dataframes_dict['df_countries'] = extract_countries_lookup_table(dataframes_dict)
+    
+    for df in dataframes_dict.values():
+        df.dropna(how='all', axis=0, inplace=True)
+    
+    return dataframes_dict
+
+def parse_and_process_matches_dict(matches_dict:dict) -> Dict[str, pd.DataFrame]:
+    """
+    This function parses and processes the matches JSON files that were previously read into a dictionary.
+    And it produces a dictionary containing mutiple dataframe, each one will be saved to a separate table in the SQL database.
+    
+    The tables are projected straight from the documents as described by `MATCHES_TABLES_SPECS`,
+    in a single pass over the documents (see `project_tables_from_documents`).
+    
+    ## Parameters
+    - matches_dict: dict
+        Dictionary with the matches data -> as read from the matches json files (all of them)
+    
+    ## Returns
+    - Dict[str, pd.DataFrame]: Dictionary with the ouptut dataframes, they are:
+    
+        1. `df_matches` -> the main matches dataframe, contains:
+            - match_id (`int`)
+            - home_score (`int`)
+            - away_score (`int`)
+            - match_week (`int`)
+            - competition_id (`int`)
+            - season_id (`int`)
+            - home_team_id (`int`)
+            - away_team_id (`int`)
+            - competition_stage_id (`int`)
+            - stadium_id (`int`)
+            - referee_id (`int`)
+            - match_datetime (`datetime64[ns]`)
+        
+        2. `df_competition_stages` -> the competition stages dataframe, contains:
+            - competition_stage_id (`int`)
+            - competition_stage_name (`str`)
+            
+        3. `df_stadiums` -> the stadiums dataframe, contains:
+            - stadium_id (`int`)
+            - stadium_name (`str`)
+            - country_id (`int`)
+            
+        4. `df_referees` -> the referees dataframe, contains:
+            - referee_id (`int`)
+            - referee_name (`str`)
+            - country_id (`int`)
+        
+        5. `df_team_base_info` -> the teams base info dataframe, contains:
+            - team_id (`int`)
+            - team_name (`str`)
+            - team_gender (`str`)
+            - country_id (`int`)
+            
+        6. `df_team_managers_matches` -> this dataframe shows which manager managed which team in which match, contains:
+            - match_id (`int`)
+            - team_id (`int`)
+            - manager_id (`int`)
+        
+        7. `df_managers_base_data` -> the managers base data dataframe, contains:
+            - manager_id (`int`)
+            - manager_name (`str`)
+            - manager_nickname (`str`)
+            - manager_dob (`datetime64[ns]`)
+            - country_id (`int`)
+            
+        8. `df_countries` -> the countries dataframe, contains:
+            - country_id (`int`)
+            - country_name (`str`)
+            
+    """
+    dataframes_dict = project_tables_from_documents(matches_dict, MATCHES_TABLES_SPECS)
+    
+    # match_date and kick_off are in different fields, we need to combine them into one column
+    df_matches = dataframes_dict['df_matches']
+    df_matches['match_datetime'] = combine_dates_and_times(df_matches.match_date, df_matches.kick_off)
+    df_matches.drop(columns=['match_date', 'kick_off'], inplace=True)
+    
+    df_managers_base_data = dataframes_dict['df_managers_base_data']
+    df_managers_base_data.manager_dob = parse_dates(df_managers_base_data.manager_dob)
+    
+    # generating the countries lookup table
+    dataframes_dict['df_countries'] = extract_countries_lookup_table(dataframes_dict)
+    
+    for df in dataframes_dict.values():
+        df.dropna(how='all', axis=0, inplace=True)
+    
+    return dataframes_dict
+
+def extract_countries_lookup_table(dataframes_dict:Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Most of the tables have a (country id <> country name) pair of columns, this function collects these pairs
+    from all the dataframes into a single deduplicated countries lookup table,
+    and drops the `country_name` column from these dataframes (in place), as it can then be looked up by the `country_id`.
+    
+    ## Parameters
+    dataframes_dict: Dict[str, pd.DataFrame]
+        Dictionary with the dataframes to extract the countries from
+    
+    ## Returns
+    pd.DataFrame
+        The countries lookup table, contains:
+        - country_id (`int`)
+        - country_name (`str`)
+    """
     df_countires = pd.DataFrame(columns=['country_id', 'country_name'])
     for dframe in dataframes_dict.values():
         if 'country_id' not in dframe.columns.tolist():
@@ -347,15 +586,59 @@ def parse_and_process_matches_dict(matches_dict:dict) -> Dict[str, pd.DataFrame]
             df_countires = pd.concat([df_countires, dframe[['country_id', 'country_name']]], axis=0, ignore_index=True)
             dframe.drop(columns=['country_name'], inplace=True)
     df_countires.drop_duplicates(ignore_index=True, inplace=True)
-    dataframes_dict['df_countries'] = df_countires
+    return df_countires
+
+def concat_and_deduplicate_dframes_dicts(dframes_dicts:List[Dict[str, pd.DataFrame]],
+                                         tables_key_columns:Dict[str, List[str]]=None) -> Dict[str, pd.DataFrame]:
+    """
+    Combines the output dictionaries of mutiple calls to one of the parsing functions (e.g. one call per batch of documents)
+    into a single dictionary, by concatenating the dataframes of each table and dropping the duplicate rows.
     
-    for df in dataframes_dict.values():
-        df.dropna(how='all', axis=0, inplace=True)
+    ## Parameters
+    dframes_dicts: List[Dict[str, pd.DataFrame]]
+        List of dictionaries as returned by the parsing functions (the tables with the same name are combined)
+    tables_key_columns: Dict[str, List[str]], default=None
+        The tables that are deduplicated on their key columns (keeping the last row) instead of on the full row
     
-    return dataframes_dict
+    ## Returns
+    Dict[str, pd.DataFrame]
+        Dictionary with a single deduplicated dataframe per table
+    """
+    dict_return = {}
+    for dframes_dict in dframes_dicts:
+        for table_name, dframe in dframes_dict.items():
+            dict_return.setdefault(table_name, []).append(dframe)
+    if tables_key_columns is None:
+        tables_key_columns = {}
+    for table_name, dframes_list in dict_return.items():
+        dict_return[table_name] = pd.concat(dframes_list, axis=0, ignore_index=True).drop_duplicates(subset=tables_key_columns.get(table_name),
+                                                                                                   keep='last',
+                                                                                                   ignore_index=True)
+    return dict_return
 
-def normalize_countries_field_df_competitions(df_competitions:pd.DataFrame, df_countries:pd.DataFrame) -> pd.DataFrame:
-    df_competitions = df_competitions.merge(df_countries, how='left', on='country_name')
+def normalize_countries_field_df_competitions(df_competitions:pd.DataFrame,
+                                              df_countries:pd.DataFrame=None,
+                                              countries_ids:Dict[str, int]=None) -> pd.DataFrame:
+    """
+    Adds the `country_id` column to the competitions dataframe, looked up by the `country_name` of each competition
+    (left empty for the countries that aren't found).
+    
+    ## Parameters
+    df_competitions: pd.DataFrame
+        The competitions dataframe
+    df_countries: pd.DataFrame, default=None
+        The countries lookup table, to get the ids from (if `countries_ids` isn't given)
+    countries_ids: Dict[str, int], default=None
+        Dictionary mapping each country name to its id (e.g. from the dimension key index)
+    
+    ## Returns
+    pd.DataFrame
+        The competitions dataframe with the `country_id` column
+    """
+    if countries_ids is None:
+        countries_ids = dict(zip(df_countries['country_name'], df_countries['country_id']))
+    df_competitions = df_competitions.copy()
+    df_competitions['country_id'] = df_competitions['country_name'].map(countries_ids)
     # df_competitions.drop(columns=['country_name'], inplace=True)
     return df_competitions
 
@@ -0,0 +1,162 @@
+import pandas as pd
+from pathlib import Path
+
+from typing import Dict, List
+from tabulate import tabulate
+from helpful_funcs import read_json_file_to_dict
+from helpful_funcs import downcast_all_numerical_cols_in_df
+from helpful_funcs import extract_columns_from_documents
+from helpful_funcs import build_projection_from_fields_paths
+from helpful_funcs import EACH_LIST_ITEM
+from json_data_parser_funcs import extract_countries_lookup_table
+
+# NOTE: each lineup document holds the lineup of one team in one match, with a nested list of players,
+# and each player has nested lists of positions and cards. these lists are flattened with plain list comprehensions
+# (one pass over the documents per table), instead of chains of `explode` and per row `apply` calls on a dataframe.
+
+PLAYERS_COLUMNS_PATHS = {'player_id': ('player_id',),
+                         'player_name': ('player_name',),
+                         'player_nickname': ('player_nickname',),
+                         'country_id': ('country', 'id'),
+                         'country_name': ('country', 'name')}
+
+PLAYER_POSITIONS_COLUMNS_PATHS = {'position_id': ('position_id',),
+                                  'position_name': ('position',),
+                                  'from_time': ('from',),
+                                  'to_time': ('to',),
+                                  'from_period': ('from_period',),
+                                  'to_period': ('to_period',),
+                                  'start_reason': ('start_reason',),
+                                  'end_reason': ('end_reason',)}
+
+PLAYER_CARDS_COLUMNS_PATHS = {'card_time': ('time',),
+                              'card_type': ('card_type',),
+                              'card_reason': ('reason',),
+                              'period': ('period',)}
+
+# the key of the lookup tables whose rows can change between documents (e.g. a player's name is spelled differently
+# in the lineups of different matches), these are deduplicated on their key (keeping the last row), not on the full row.
+LINEUPS_LOOKUP_TABLES_KEYS = {'df_players': ['player_id']}
+
+# the output tables of the lineups data that hold one row per player per match,
+# the rest of the output tables are lookup (dimension) tables.
+LINEUPS_FACT_TABLES = ['df_match_lineups', 'df_player_positions', 'df_player_cards']
+
+# the mongodb projection of the lineups collection, only the fields of the lineups tables are fetched
+LINEUPS_PROJECTION = build_projection_from_fields_paths([('match_id',), ('team_id',),
+                                                         ('lineup', EACH_LIST_ITEM, 'jersey_number'),
+                                                         *[('lineup', EACH_LIST_ITEM) + field_path
+                                                           for field_path in PLAYERS_COLUMNS_PATHS.values()],
+                                                         *[('lineup', EACH_LIST_ITEM, 'positions', EACH_LIST_ITEM) + field_path
+                                                           for field_path in PLAYER_POSITIONS_COLUMNS_PATHS.values()],
+                                                         *[('lineup', EACH_LIST_ITEM, 'cards', EACH_LIST_ITEM) + field_path
+                                                           for field_path in PLAYER_CARDS_COLUMNS_PATHS.values()]])
+
+
+def parse_and_process_lineups(lineups_dicts:List[dict]) -> Dict[str, pd.DataFrame]:
+    """
+    This function parses and processes a list of lineups documents (e.g. a batch streamed from the lineups collection),
+    each document should have the `match_id` field that was added while porting the lineups json files to mongodb.
+    And it produces a dictionary containing mutiple dataframes, each one will be saved to a separate table in the SQL database.
+
+    ## Parameters
+    - lineups_dicts: List[dict]
+        List of dictionaries with the lineups data (one per team per match)
+
+    ## Returns
+    - Dict[str, pd.DataFrame]: Dictionary with the output dataframes, they are:
+
+        1. `df_players` -> the players dataframe, contains:
+            - player_id (`int`)
+            - player_name (`str`)
+            - player_nickname (`str`)
+            - country_id (`int`)
+
+        2. `df_match_lineups` -> which player was in the lineup of which team in which match, contains:
+            - match_id (`int`)
+            - team_id (`int`)
+            - player_id (`int`)
+            - jersey_number (`int`)
+
+        3. `df_player_positions` -> the positions each player played in each match, contains:
+            - match_id (`int`)
+            - player_id (`int`)
+            - position_id (`int`)
+            - from_time (`str`) -> `mm:ss` from the start of the match
+            - to_time (`str`) -> `mm:ss` from the start of the match, empty if the player finished the match in this position
+            - from_period (`int`)
+            - to_period (`int`)
+            - start_reason (`str`)
+            - end_reason (`str`)
+
+        4. `df_player_cards` -> the cards each player received in each match, contains:
+            - match_id (`int`)
+            - player_id (`int`)
+            - card_time (`str`)
+            - card_type (`str`)
+            - card_reason (`str`)
+            - period (`int`)
+
+        5. `df_positions` -> the positions lookup table, contains:
+            - position_id (`int`)
+            - position_name (`str`)
+
+        6. `df_countries` -> the countries of the players, contains:
+            - country_id (`int`)
+            - country_name (`str`)
+    """
+    # flattening the players of all the lineups, keeping the (match, team) they belong to
+    lineup_players = []
+    lineup_keys = []
+    for lineup_dict in lineups_dicts:
+        for player in lineup_dict.get('lineup') or []:
+            lineup_players.append(player)
+            lineup_keys.append((lineup_dict['match_id'], lineup_dict['team_id']))
+
+    dataframes_dict = {}
+
+    df_players = extract_columns_from_documents(lineup_players, PLAYERS_COLUMNS_PATHS)
+    dataframes_dict['df_players'] = df_players.drop_duplicates(subset=LINEUPS_LOOKUP_TABLES_KEYS['df_players'], keep='last', ignore_index=True)
+
+    df_match_lineups = pd.DataFrame(lineup_keys, columns=['match_id', 'team_id'])
+    df_match_lineups['player_id'] = df_players['player_id']
+    df_match_lineups['jersey_number'] = [player.get('jersey_number') for player in lineup_players]
+    dataframes_dict['df_match_lineups'] = df_match_lineups
+
+    def flatten_player_list_field(list_field:str, columns_paths:Dict[str, tuple]) -> pd.DataFrame:
+        """
+        Flattens a list field of the players (e.g. `positions`), into a dataframe with a row per item in the lists,
+        keyed by the match and the player the item belongs to.
+        """
+        items = []
+        items_keys = []
+        for (match_id, _), player in zip(lineup_keys, lineup_players):
+            for item in player.get(list_field) or []:
+                items.append(item)
+                items_keys.append((match_id, player['player_id']))
+        df_keys = pd.DataFrame(items_keys, columns=['match_id', 'player_id'])
+        return pd.concat([df_keys, extract_columns_from_documents(items, columns_paths)], axis=1)
+
+    df_player_positions = flatten_player_list_field('positions', PLAYER_POSITIONS_COLUMNS_PATHS)
+    dataframes_dict['df_positions'] = df_player_positions[['position_id', 'position_name']].drop_duplicates(ignore_index=True)
+    dataframes_dict['df_player_positions'] = df_player_positions.drop(columns=['position_name'])
+    dataframes_dict['df_player_cards'] = flatten_player_list_field('cards', PLAYER_CARDS_COLUMNS_PATHS)
+
+    # generating the countries lookup table (the same way the matches data does)
+    dataframes_dict['df_countries'] = extract_countries_lookup_table(dataframes_dict)
+
+    for table_name, df in dataframes_dict.items():
+        df.dropna(how='all', axis=0, inplace=True)
+        dataframes_dict[table_name] = downcast_all_numerical_cols_in_df(df)
+    return dataframes_dict
+
+
+if __name__ == "__main__":
+    lineups_json_path = Path().cwd().parent / "data" / "lineups" / "15946.json"
+    lineups_dicts = read_json_file_to_dict(lineups_json_path)
+    for lineup_dict in lineups_dicts:
+        lineup_dict['match_id'] = int(lineups_json_path.stem)
+    lineups_dframes_dict = parse_and_process_lineups(lineups_dicts)
+    for table_name, df in lineups_dframes_dict.items():
+        print(table_name)
+        print(tabulate(df.head(), headers='keys', tablefmt='psql'))
@@ -0,0 +1,289 @@
+import gc
+import hashlib
+import os
+import pickle
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from json import loads as json_bytes_to_dict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from helpful_funcs import stream_json_array_file
+from sharded_transform import transform_shards_in_process_pool
+
+# orjson is only needed to decode the json files faster, the standard json module is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# NOTE: this is the offline counterpart of the mongodb collections, it reads the statsbomb json files in the data directory directly
+# (e.g. for local runs, or to replay a run without the network). the documents of each file are the same as the ones ported
+# to mongodb (see porting_json_to_mongodb.py), so the same parsing functions can be used on them.
+# decoding the json files is the slowest part of reading them, so the decoded documents of each file are cached on disk (pickled),
+# keyed by the path, modification time and size of the file: repeat runs skip the json decoding, and a file that changed is decoded again.
+# most of the decoding time is spent in the garbage collector, which runs over and over while millions of dicts and lists are created,
+# the decoded documents have no reference cycles, so the garbage collector is paused while decoding them (or loading them from the cache).
+# the big files can also be streamed one document at a time instead (see `stream_json_array_file`), without the cache and the concurrent reads
+# (which hold whole files in memory), so the peak memory depends on the batch size, not on the size of the files.
+
+# where each collection is stored in the data directory (collection name -> glob pattern, relative to the data directory)
+LOCAL_COLLECTIONS_FILES_PATTERNS = {'competitions': 'competitions.json',
+                                    'matches': 'matches/**/*.json',
+                                    'events': 'events/*.json',
+                                    'lineups': 'lineups/*.json'}
+
+# the collections whose files hold the documents of a single match, named after its id (e.g. events/15946.json),
+# the `match_id` field is added to their documents while reading them, as it was while porting them to mongodb.
+MATCH_ID_FROM_FILE_NAME_COLLECTIONS = ['events', 'lineups']
+
+DEFAULT_DATA_DIR = Path().cwd().parent / 'data'
+DEFAULT_CACHE_DIR = Path().cwd().parent / '.parsed_json_cache'
+
+# the garbage collector is paused as long as at least one thread is decoding documents, see `garbage_collector_paused`
+GC_PAUSES_LOCK = threading.Lock()
+GC_PAUSES_COUNT = 0
+GC_WAS_ENABLED = True
+
+
+@contextmanager
+def garbage_collector_paused():
+    """
+    Pauses the (cyclic) garbage collector while the block runs, e.g. while decoding a file into many acyclic documents,
+    the pauses of concurrent threads are counted, so the garbage collector is only resumed after the last one (if it was enabled).
+    """
+    global GC_PAUSES_COUNT, GC_WAS_ENABLED
+    with GC_PAUSES_LOCK:
+        if GC_PAUSES_COUNT == 0:
+            GC_WAS_ENABLED = gc.isenabled()
+            gc.disable()
+        GC_PAUSES_COUNT += 1
+    try:
+        yield
+    finally:
+        with GC_PAUSES_LOCK:
+            GC_PAUSES_COUNT -= 1
+            if GC_PAUSES_COUNT == 0 and GC_WAS_ENABLED:
+                gc.enable()
+
+
+def decode_json_bytes(json_bytes:bytes) -> Any:
+    """
+    Decodes the contents of a json file, with orjson if it's installed (a lot faster), or with the standard json module.
+    """
+    with garbage_collector_paused():
+        if orjson is not None:
+            return orjson.loads(json_bytes)
+        return json_bytes_to_dict(json_bytes)
+
+
+def get_file_cache_key(file_path:Path) -> Tuple[str, int, int]:
+    """
+    Gets the cache key of a file, its (resolved path, modification time in nanoseconds, size in bytes).
+    """
+    file_stat = file_path.stat()
+    return (str(file_path.resolve()), file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def get_cache_file_path(cache_dir:Path, cache_key:Tuple[str, int, int]) -> Path:
+    """
+    Gets the path of the cache file of a json file (from its cache key), one cache file per json file (named after a hash of its path),
+    so a json file that changed overwrites its previous cache file.
+    """
+    path_hash = hashlib.sha1(cache_key[0].encode()).hexdigest()
+    return cache_dir / f'{path_hash}.pickle'
+
+
+def serialize_cache_entry(cache_entry:dict) -> bytes:
+    """
+    Serializes a cache entry (the cache key and the documents of a json file).
+    """
+    return pickle.dumps(cache_entry, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def deserialize_cache_entry(cache_entry_bytes:bytes) -> dict:
+    """
+    Deserializes a cache entry written by `serialize_cache_entry`.
+    """
+    with garbage_collector_paused():
+        return pickle.loads(cache_entry_bytes)
+
+
+def read_json_file_documents(file_path:Path, cache_dir:Path=None) -> List[dict]:
+    """
+    Reads the documents of a json file, from its cache file if it's up to date, otherwise the json file is decoded,
+    and the decoded documents are cached for the next runs.
+
+    ## Parameters
+    file_path: Path
+        Path to the json file
+    cache_dir: Path, default=None
+        Directory of the cache files, `None` disables the cache
+
+    ## Returns
+    List[dict]
+        The documents in the json file
+    """
+    if cache_dir is None:
+        return decode_json_bytes(file_path.read_bytes())
+    cache_key = get_file_cache_key(file_path)
+    cache_file_path = get_cache_file_path(cache_dir, cache_key)
+    try:
+        cache_entry = deserialize_cache_entry(cache_file_path.read_bytes())
+        if cache_entry['key'] == cache_key:
+            return cache_entry['documents']
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # a truncated or corrupt cache file (e.g. `EOFError`, `pickle.UnpicklingError`, or an entry without its key) is a cache miss,
+        # the json file is decoded again and the cache file is rewritten
+        print(f'the cache file of {file_path} could not be read ({type(e).__name__}: {e}), decoding the json file again')
+    documents = decode_json_bytes(file_path.read_bytes())
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # written to a temporary file first, so an interrupted run (or a concurrent one) never leaves a partial cache file
+    temp_cache_file_path = cache_file_path.with_name(f'{cache_file_path.name}.{os.getpid()}.tmp')
+    temp_cache_file_path.write_bytes(serialize_cache_entry({'key': cache_key, 'documents': documents}))
+    os.replace(temp_cache_file_path, cache_file_path)
+    return documents
+
+
+def read_collection_file_documents(collection_name:str, file_path:Path, cache_dir:Path=None) -> List[dict]:
+    """
+    Reads the documents of a json file of a collection (see `read_json_file_documents`),
+    and adds the `match_id` field to them, for the collections that are stored in a file per match.
+    """
+    documents = read_json_file_documents(file_path, cache_dir)
+    if collection_name in MATCH_ID_FROM_FILE_NAME_COLLECTIONS:
+        for doc in documents:
+            doc['match_id'] = int(file_path.stem)
+    return documents
+
+
+def get_local_collection_file_paths(collection_name:str, data_dir:Path=None) -> List[Path]:
+    """
+    Gets the (sorted) paths of the json files of a collection in the data directory.
+
+    ## Parameters
+    collection_name: str
+        One of the collections in `LOCAL_COLLECTIONS_FILES_PATTERNS`
+    data_dir: Path, default=None
+        The data directory (default is the data directory of the repo)
+
+    ## Returns
+    List[Path]
+        The paths of the json files of the collection
+    """
+    if collection_name not in LOCAL_COLLECTIONS_FILES_PATTERNS:
+        raise ValueError(f'unknown collection {collection_name}, should be one of {list(LOCAL_COLLECTIONS_FILES_PATTERNS.keys())}')
+    if data_dir is None:
+        data_dir = DEFAULT_DATA_DIR
+    if not(data_dir.exists() and data_dir.is_dir()):
+        raise FileNotFoundError(f'Directory {data_dir} does not exist.')
+    return sorted(data_dir.glob(LOCAL_COLLECTIONS_FILES_PATTERNS[collection_name]))
+
+
+def read_files_concurrently(file_paths:List[Path],
+                            read_file_func:Callable[[Path], List[dict]],
+                            max_workers:int=4) -> Iterator[List[dict]]:
+    """
+    Reads mutiple files in a pool of threads, and yields the documents of each file (in the order of the files).
+    At most `2 * max_workers` files are read ahead of the one being consumed, so only a few files are held in memory at a time.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending_reads = deque()
+        for file_path in file_paths:
+            pending_reads.append(executor.submit(read_file_func, file_path))
+            if len(pending_reads) >= 2 * max_workers:
+                yield pending_reads.popleft().result()
+        while pending_reads:
+            yield pending_reads.popleft().result()
+
+
+def read_local_collection(collection_name:str,
+                          data_dir:Path=None,
+                          cache_dir:Path=None,
+                          max_workers:int=4) -> List[dict]:
+    """
+    Reads all the documents of a collection from its json files, the offline counterpart of `download_collection_to_list_of_dicts`.
+    (see `stream_local_collection_in_batches` for the parameters)
+    """
+    return [doc for docs_batch in stream_local_collection_in_batches(collection_name, data_dir=data_dir, cache_dir=cache_dir,
+                                                                     docs_per_batch=1_000_000, max_workers=max_workers)
+            for doc in docs_batch]
+
+
+def stream_collection_file_documents(collection_name:str, file_path:Path) -> Iterator[dict]:
+    """
+    Streams the documents of a json file of a collection one at a time (see `stream_json_array_file`),
+    and adds the `match_id` field to them, for the collections that are stored in a file per match.
+    """
+    match_id = int(file_path.stem) if collection_name in MATCH_ID_FROM_FILE_NAME_COLLECTIONS else None
+    for doc in stream_json_array_file(file_path):
+        if match_id is not None:
+            doc['match_id'] = match_id
+        yield doc
+
+
+def stream_local_collection_in_batches(collection_name:str,
+                                       data_dir:Path=None,
+                                       cache_dir:Path=None,
+                                       docs_per_batch:int=5_000,
+                                       max_workers:int=4,
+                                       stream_files:bool=False) -> Iterator[List[dict]]:
+    """
+    This function streams the documents of a collection from its json files in batches of documents,
+    the offline counterpart of `stream_collection_in_batches`, the files are read concurrently, and their decoded documents are cached.
+
+    ## Parameters
+    collection_name: str
+        One of the collections in `LOCAL_COLLECTIONS_FILES_PATTERNS`
+    data_dir: Path, default=None
+        The data directory (default is the data directory of the repo)
+    cache_dir: Path, default=None
+        Directory of the parsed documents cache, `None` disables the cache
+    docs_per_batch: int, default=5_000
+        Number of documents in each yielded batch
+    max_workers: int, default=4
+        Number of files read concurrently
+    stream_files: bool, default=False
+        Stream each file one document at a time instead (`cache_dir` and `max_workers` are ignored),
+        so no file is ever held in memory as a whole
+
+    ## Yields
+    List[dict]
+        Batch of (at most `docs_per_batch`) documents of the collection
+    """
+    if docs_per_batch < 1:
+        raise ValueError('docs_per_batch should be a positive integer')
+    file_paths = get_local_collection_file_paths(collection_name, data_dir)
+    if stream_files:
+        files_documents = (stream_collection_file_documents(collection_name, file_path) for file_path in file_paths)
+    else:
+        read_file_func = partial(read_collection_file_documents, collection_name, cache_dir=cache_dir)
+        files_documents = read_files_concurrently(file_paths, read_file_func, max_workers=max_workers)
+    docs_batch = []
+    for documents in files_documents:
+        for doc in documents:
+            docs_batch.append(doc)
+            if len(docs_batch) == docs_per_batch:
+                yield docs_batch
+                docs_batch = []
+    if docs_batch:
+        yield docs_batch
+
+
+def transform_matches_files_in_shards(parse_func:Callable[[List[dict]], Dict[str, Any]],
+                                      data_dir:Path=None,
+                                      cache_dir:Path=None,
+                                      max_workers:int=None) -> Iterator[Dict[str, Any]]:
+    """
+    The offline counterpart of `transform_matches_collection_in_shards`, each matches json file (one per (competition, season))
+    is a shard, read and parsed in a pool of processes with `transform_shards_in_process_pool`.
+    """
+    file_paths = get_local_collection_file_paths('matches', data_dir)
+    print(f'transforming the matches files in {len(file_paths)} (competition, season) shards')
+    read_file_func = partial(read_collection_file_documents, 'matches', cache_dir=cache_dir)
+    return transform_shards_in_process_pool(file_paths, read_file_func, parse_func, max_workers)
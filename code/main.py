@@ -1,79 +1,682 @@
+import argparse
+import asyncio
 import pandas as pd
 # remove the SettingWithCopyWarning
 pd.options.mode.chained_assignment = None  # default='warn'
 from pathlib import Path
 
 from helpful_funcs import read_json_file_to_dict
+from typing import Callable, Dict, Iterator, List
 
 from json_data_parser_funcs import parse_and_process_competitions_dict
 from json_data_parser_funcs import parse_and_process_matches_dict
 from json_data_parser_funcs import normalize_countries_field_df_competitions
+from json_data_parser_funcs import concat_and_deduplicate_dframes_dicts
+from json_data_parser_funcs import MATCHES_FACT_TABLES
+from json_data_parser_funcs import MATCHES_PROJECTION
+
+from events_parser_funcs import parse_and_process_events
+from events_parser_funcs import EVENTS_FACT_TABLES
+from events_parser_funcs import EVENTS_PROJECTION
+
+from lineups_parser_funcs import parse_and_process_lineups
+from lineups_parser_funcs import LINEUPS_FACT_TABLES
+from lineups_parser_funcs import LINEUPS_LOOKUP_TABLES_KEYS
+from lineups_parser_funcs import LINEUPS_PROJECTION
+
+from arrow_parser_funcs import parse_and_process_matches_to_arrow
+from arrow_parser_funcs import arrow_tables_dict_to_dframes_dict
 
 from mongodb_downloader import connect_to_mongo_database
 from mongodb_downloader import download_collection_to_list_of_dicts
+from mongodb_downloader import stream_collection_in_batches
 
-from mysql_db_funcs import create_sql_db_connection
-from mysql_db_funcs import run_sql_commands_from_file
+import sqlalchemy
 
-def main():
-    print('starting ETL script')
+from mysql_db_funcs import create_sql_db_engine
+from mysql_db_funcs import read_sql_commands_from_file
+from mysql_db_funcs import run_sql_commands
+from mysql_db_funcs import sort_table_by_columns
+from mysql_db_funcs import UPLOAD_STRATEGIES
+
+from mysql_load_scheduler import parse_foreign_keys_dependencies_of_sql_commands
+from mysql_load_scheduler import upload_tables_concurrently
+
+from mysql_deferred_indexes import build_deferred_indexes_and_foreign_keys
+from mysql_deferred_indexes import defer_secondary_indexes_of_schema_commands
+from mysql_deferred_indexes import parse_foreign_keys_clauses
+from mysql_deferred_indexes import FAST_LOAD_SESSION_VARIABLES
+
+from mysql_staging_swap import parse_created_tables_names
+from mysql_staging_swap import rename_tables_to_staging_tables
+from mysql_staging_swap import swap_staging_tables
+from mysql_staging_swap import STAGING_TABLE_SUFFIX
+
+from incremental_sync import run_incremental_sync
+
+from content_hash_sync import run_change_detection_sync
+from content_hash_sync import clear_content_hashes
+from content_hash_sync import read_loaded_matches_dependent_tables
+
+from dimension_key_index import open_dimension_key_index
+from dimension_key_index import rebuild_dimension_key_index
+
+from sharded_transform import transform_matches_collection_in_shards
+
+from async_etl_runner import run_async_etl
+from async_etl_runner import ASYNC_MYSQL_DRIVERS
+
+from local_file_source import read_local_collection
+from local_file_source import stream_local_collection_in_batches
+from local_file_source import transform_matches_files_in_shards
+from local_file_source import DEFAULT_CACHE_DIR
+
+from pipeline_metrics import configure_pipeline_metrics
+from pipeline_metrics import measure_each_item
+from pipeline_metrics import measure_stage
+from pipeline_metrics import report_stages_metrics
+from pipeline_metrics import METRICS_FORMATS
+
+from pipeline_stages import run_stage_in_thread
+
+from run_checkpoints import checkpoint_extracted_batches
+from run_checkpoints import configure_run_checkpoints
+from run_checkpoints import create_load_checkpoints_table
+from run_checkpoints import finish_run_checkpoints
+from run_checkpoints import is_checkpoint_done
+from run_checkpoints import is_run_checkpointed
+from run_checkpoints import read_checkpoint_batches
+from run_checkpoints import read_checkpoint_tables
+from run_checkpoints import record_checkpoint
+from run_checkpoints import upload_table_with_checkpoints
+from run_checkpoints import write_checkpoint_tables
+
+# how the final tables are uploaded to the mysql database:
+# - sequential -> one table after the other over a single connection, foreign keys are created at the end
+# - parallel -> independent tables are uploaded concurrently, foreign keys are created at the end
+# - fk_ordered -> foreign keys are created up front, tables are uploaded concurrently once the tables they reference are uploaded
+LOAD_MODES = ['sequential', 'parallel', 'fk_ordered']
+
+# how the mysql database is synced with the mongodb database:
+# - full -> all the tables are dropped, recreated and reloaded from scratch
+# - incremental -> only the matches updated since the previous sync are extracted and upserted into the existing tables
+# - changed -> only the (competition, season) partitions whose content hash changed since the previous sync are extracted and reloaded
+SYNC_MODES = ['full', 'incremental', 'changed']
+
+# how the matches documents are transformed into tables:
+# - pandas -> dataframes (numpy and object columns)
+# - arrow -> typed arrow tables (exact integer widths, dictionary encoded strings), needs pyarrow
+TRANSFORM_BACKENDS = ['pandas', 'arrow']
+
+# where the documents are extracted from:
+# - mongodb -> the collections of the mongodb database
+# - files -> the json files in the data directory (no network needed, see local_file_source.py)
+SOURCES = ['mongodb', 'files']
+
+# the fields fetched from each mongodb collection, only the ones read by its transform (see `build_projection_from_fields_paths`)
+COLLECTIONS_PROJECTIONS = {'matches': MATCHES_PROJECTION,
+                           'events': EVENTS_PROJECTION,
+                           'lineups': LINEUPS_PROJECTION}
+
+def upload_fact_tables_of_parsed_batches(parsed_batches:Iterator[Dict[str, pd.DataFrame]],
+                                         fact_tables:List[str],
+                                         mysql_connection:sqlalchemy.Connection,
+                                         upload_chunksize:int,
+                                         upload_strategy:str,
+                                         tables_sort_columns:Dict[str, List[str]]=None,
+                                         sql_tables_suffix:str='') -> List[Dict[str, pd.DataFrame]]:
+    """
+    Uploads the tables that have a row per document (the fact tables) of each parsed batch (or shard) as soon as it's parsed,
+    while the rest of the tables (the lookup tables) are returned, to be deduplicated and uploaded
+    once all the batches are processed.
+    
+    ## Parameters
+    parsed_batches: Iterator[Dict[str, pd.DataFrame]]
+        The parsed batches, as returned by one of the parsing functions
+    fact_tables: List[str]
+        The tables uploaded batch by batch, an empty list keeps all the tables for later (e.g. when the foreign keys already exist)
+    mysql_connection: sqlalchemy.Connection
+        The connection to the MySQL database
+    upload_chunksize: int
+        Passed to `upload_dataframe_to_sql_table`
+    upload_strategy: str
+        Passed to `upload_dataframe_to_sql_table`
+    tables_sort_columns: Dict[str, List[str]], default=None
+        The columns each (sql) table is sorted by before it's uploaded, e.g. its primary key (see `sort_table_by_columns`)
+    sql_tables_suffix: str, default=''
+        Appended to the name of each (sql) table, e.g. to upload into the staging tables (see `STAGING_TABLE_SUFFIX`)
     
-    print('connecting to mongodb database')
-    mongodb_db =  connect_to_mongo_database()
+    ## Returns
+    List[Dict[str, pd.DataFrame]]
+        The dataframes of the tables that weren't uploaded, one dictionary per batch
+    """
+    tables_sort_columns = tables_sort_columns or {}
+    remaining_dframes_dicts = []
+    for batch_number, batch_dframes_dict in enumerate(parsed_batches, start=1):
+        for table_name in fact_tables:
+            sql_table_name = table_name.replace('df_', '') + sql_tables_suffix
+            dframe = sort_table_by_columns(batch_dframes_dict.pop(table_name), tables_sort_columns.get(sql_table_name))
+            print(f'uploading batch {batch_number} of table {table_name}')
+            upload_table_with_checkpoints(dframe, sql_table_name, mysql_connection, checkpoint_key=f'load:{sql_table_name}:{batch_number}',
+                                          chunksize=upload_chunksize, strategy=upload_strategy)
+        remaining_dframes_dicts.append(batch_dframes_dict)
+    return remaining_dframes_dicts
+
+def parse_and_upload_docs_batches(docs_batches:Iterator[List[dict]],
+                                  collection_name:str,
+                                  parse_func:Callable[[List[dict]], Dict[str, pd.DataFrame]],
+                                  fact_tables:List[str],
+                                  mysql_connection:sqlalchemy.Connection,
+                                  upload_chunksize:int,
+                                  upload_strategy:str,
+                                  pipeline_queue_size:int=0,
+                                  tables_sort_columns:Dict[str, List[str]]=None,
+                                  sql_tables_suffix:str='') -> List[Dict[str, pd.DataFrame]]:
+    """
+    Parses each batch of documents of a collection (streamed from mongodb or from the json files),
+    and uploads the fact tables batch by batch (see `upload_fact_tables_of_parsed_batches`).
+    The extract, transform and load of the batches can run as concurrent stages (see `run_stage_in_thread`),
+    the upload stays in the calling thread, as it's the only one using the connection.
     
-    competitions_collection = mongodb_db.get_collection('competitions')
-    matches_collection = mongodb_db.get_collection('matches')
-
-    print('downloading collections from mongodb database')
-    competitions_dict = download_collection_to_list_of_dicts(competitions_collection)
-    matches_dict = download_collection_to_list_of_dicts(matches_collection)
-    print('closing mongodb connection')
-    mongodb_db.client.close()
-        
-    print('processing json data')
-    competitions_dframes_dict = parse_and_process_competitions_dict(competitions_dict)
-    matches_dframes_dict = parse_and_process_matches_dict(matches_dict)
+    ## Parameters
+    docs_batches: Iterator[List[dict]]
+        The batches of documents of the collection
+    collection_name: str
+        The name of the collection, used in the progress messages and in the checkpoints of the run (see `run_checkpoints.py`)
+    parse_func: Callable[[List[dict]], Dict[str, pd.DataFrame]]
+        Function that parses a batch of documents into a dictionary of dataframes (e.g. `parse_and_process_matches_dict`)
+    fact_tables: List[str]
+        The tables uploaded batch by batch, an empty list keeps all the tables for later (e.g. when the foreign keys already exist)
+    mysql_connection: sqlalchemy.Connection
+        The connection to the MySQL database
+    upload_chunksize: int
+        Passed to `upload_dataframe_to_sql_table`
+    upload_strategy: str
+        Passed to `upload_dataframe_to_sql_table`
+    pipeline_queue_size: int, default=0
+        Number of batches each stage can get ahead of the next one when the stages run concurrently,
+        0 runs them one after the other (extract a batch, transform it, upload it, then the next batch)
+    tables_sort_columns: Dict[str, List[str]], default=None
+        Passed to `upload_fact_tables_of_parsed_batches`
+    sql_tables_suffix: str, default=''
+        Passed to `upload_fact_tables_of_parsed_batches`
     
-    competitions_dframes_dict['df_competitions'] = normalize_countries_field_df_competitions(competitions_dframes_dict['df_competitions'],
-                                                                                             matches_dframes_dict['df_countries'])
+    ## Returns
+    List[Dict[str, pd.DataFrame]]
+        The dataframes of the tables that weren't uploaded, one dictionary per batch
+    """
+    def parse_docs_batches() -> Iterator[Dict[str, pd.DataFrame]]:
+        if is_checkpoint_done(f'transform:{collection_name}'):
+            # a previous run of the checkpointed run transformed all the batches, so nothing is extracted or transformed again
+            yield from read_checkpoint_batches(collection_name)
+            return
+        # the extract stage of each batch is the time spent waiting for it (the cursor round trips, or reading the json files)
+        measured_docs_batches = measure_each_item(checkpoint_extracted_batches(collection_name, lambda: docs_batches),
+                                                  'extract', rows_func=len, collection=collection_name)
+        if pipeline_queue_size > 0:
+            measured_docs_batches = run_stage_in_thread(measured_docs_batches, pipeline_queue_size, stage_name=f'{collection_name}-extract')
+        batches_count = 0
+        for batch_number, docs_batch in enumerate(measured_docs_batches, start=1):
+            print(f'processing {collection_name} batch {batch_number} ({len(docs_batch)} documents)')
+            batch_checkpoint_key, batch_dir_parts = f'transform:{collection_name}:{batch_number}', ('transform', collection_name, f'batch_{batch_number:05d}')
+            if is_checkpoint_done(batch_checkpoint_key):
+                batch_dframes_dict = read_checkpoint_tables(batch_checkpoint_key, *batch_dir_parts)
+            else:
+                with measure_stage('transform', collection=collection_name, function=parse_func.__name__) as stage_metrics:
+                    batch_dframes_dict = parse_func(docs_batch)
+                    stage_metrics['rows'] = len(docs_batch)
+                if is_run_checkpointed():
+                    with measure_stage('checkpoint', collection=collection_name):
+                        write_checkpoint_tables(batch_checkpoint_key, batch_dframes_dict, *batch_dir_parts)
+            batches_count = batch_number
+            yield batch_dframes_dict
+        record_checkpoint(f'transform:{collection_name}', batches=batches_count)
+    parsed_batches = parse_docs_batches()
+    if pipeline_queue_size > 0:
+        parsed_batches = run_stage_in_thread(parsed_batches, pipeline_queue_size, stage_name=f'{collection_name}-transform')
+    return upload_fact_tables_of_parsed_batches(parsed_batches,
+                                                fact_tables=fact_tables,
+                                                mysql_connection=mysql_connection,
+                                                upload_chunksize=upload_chunksize,
+                                                upload_strategy=upload_strategy,
+                                                tables_sort_columns=tables_sort_columns,
+                                                sql_tables_suffix=sql_tables_suffix)
+
+def main(docs_per_batch:int=5_000,
+         cursor_batch_size:int=1_000,
+         upload_strategy:str='to_sql',
+         upload_chunksize:int=None,
+         load_mode:str='sequential',
+         load_workers:int=4,
+         sync_mode:str='full',
+         include_events:bool=False,
+         include_lineups:bool=False,
+         transform_backend:str='pandas',
+         transform_workers:int=1,
+         source:str='mongodb',
+         data_dir:Path=None,
+         json_cache_dir:Path=DEFAULT_CACHE_DIR,
+         read_workers:int=4,
+         stream_json_files:bool=False,
+         dimension_key_index_path:Path=None,
+         content_hashes_path:Path=None,
+         metrics_file_path:Path=None,
+         metrics_format:str='jsonl',
+         trace_memory:bool=False,
+         profile_stages:List[str]=None,
+         profile_dir:Path=None,
+         pipeline_queue_size:int=0,
+         defer_indexes:bool=False,
+         shadow_load:bool=False,
+         run_dir:Path=None,
+         checkpoint_rows:int=100_000,
+         async_io:bool=False,
+         async_cursors:int=4,
+         async_inserts:int=4,
+         async_mysql_driver:str='aiomysql'):
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f'unknown load mode {load_mode}, should be one of {LOAD_MODES}')
+    if sync_mode not in SYNC_MODES:
+        raise ValueError(f'unknown sync mode {sync_mode}, should be one of {SYNC_MODES}')
+    if transform_backend not in TRANSFORM_BACKENDS:
+        raise ValueError(f'unknown transform backend {transform_backend}, should be one of {TRANSFORM_BACKENDS}')
+    if source not in SOURCES:
+        raise ValueError(f'unknown source {source}, should be one of {SOURCES}')
+    if source == 'files' and sync_mode == 'incremental':
+        raise ValueError('the incremental sync mode needs the mongodb source, the json files have no update timestamps')
+    if defer_indexes and load_mode == 'fk_ordered':
+        raise ValueError('the deferred indexes are built after the load, the fk_ordered load mode creates the foreign keys before it')
+    if shadow_load and sync_mode != 'full':
+        raise ValueError(f'the shadow load reloads all the tables, the {sync_mode} sync mode upserts into the live tables')
+    if run_dir is not None and (sync_mode != 'full' or load_mode != 'sequential' or transform_workers > 1):
+        raise ValueError('the checkpointed runs need the full sync mode, the sequential load mode and a single transform worker, '
+                         'so the batches (and the tables) of a rerun are the same as in the failed run')
+    if async_io and (sync_mode != 'full' or source != 'mongodb' or load_mode != 'sequential' or transform_workers > 1
+                     or pipeline_queue_size > 0 or defer_indexes or shadow_load or run_dir is not None):
+        raise ValueError('the async runner does a full load from the mongodb database with its own concurrency (--async-cursors and --async-inserts), '
+                         'it can\'t be combined with the other sync and load modes, sources, transform workers, pipeline queues, '
+                         'deferred indexes, shadow load or checkpointed runs')
+    configure_pipeline_metrics(metrics_file_path=metrics_file_path,
+                               metrics_format=metrics_format,
+                               trace_memory=trace_memory,
+                               profile_stages=profile_stages,
+                               profile_dir=profile_dir)
+    # the parameters that change the batches or the tables of the run, a checkpointed run is only resumed with the same ones
+    configure_run_checkpoints(run_dir,
+                              run_parameters={'source': source, 'data_dir': data_dir, 'docs_per_batch': docs_per_batch,
+                                              'include_events': include_events, 'include_lineups': include_lineups,
+                                              'transform_backend': transform_backend, 'defer_indexes': defer_indexes,
+                                              'shadow_load': shadow_load},
+                              checkpoint_rows=checkpoint_rows)
+    print('starting ETL script')
+
+    if async_io:
+        # the collections are streamed and the tables are uploaded on an event loop (see async_etl_runner.py)
+        uploaded_dframes_dict = asyncio.run(run_async_etl(mysql_driver=async_mysql_driver,
+                                                          include_events=include_events,
+                                                          include_lineups=include_lineups,
+                                                          transform_backend=transform_backend,
+                                                          docs_per_batch=docs_per_batch,
+                                                          cursor_batch_size=cursor_batch_size,
+                                                          upload_chunksize=upload_chunksize,
+                                                          upload_strategy=upload_strategy,
+                                                          max_cursors=async_cursors,
+                                                          max_inserts=async_inserts))
+        print('rebuilding the dimension key index')
+        index_connection = open_dimension_key_index(dimension_key_index_path)
+        rebuild_dimension_key_index(index_connection, uploaded_dframes_dict)
+        index_connection.close()
+        clear_content_hashes(content_hashes_path)
+        report_stages_metrics()
+        print('done all ETL steps')
+        return None
+
+    mongodb_db = None
+    if source == 'mongodb':
+        print('connecting to mongodb database')
+        mongodb_db =  connect_to_mongo_database()
     
-    matches_dframes_dict['df_stadiums'].to_csv('testing.csv', index=False)
-        
+    if sync_mode == 'incremental':
+        print('connecting to mysql database')
+        mysql_engine = create_sql_db_engine()
+        run_incremental_sync(mongodb_db=mongodb_db,
+                             mysql_engine=mysql_engine,
+                             sql_foreign_keys_file_path=Path().cwd() / 'sql_files' / 'database_foreign_keys.sql',
+                             docs_per_batch=docs_per_batch,
+                             cursor_batch_size=cursor_batch_size,
+                             upload_chunksize=upload_chunksize,
+                             dimension_key_index_path=dimension_key_index_path)
+        # the incremental sync doesn't record the content hashes of what it synced
+        clear_content_hashes(content_hashes_path)
+        print('closing mongodb connection')
+        mongodb_db.client.close()
+        mysql_engine.dispose()
+        report_stages_metrics()
+        print('done all ETL steps')
+        return None
+
+    if sync_mode == 'changed':
+        print('connecting to mysql database')
+        mysql_engine = create_sql_db_engine()
+        with mysql_engine.connect() as mysql_connection:
+            loaded_dependent_tables = read_loaded_matches_dependent_tables(mysql_connection)
+        if loaded_dependent_tables:
+            mysql_engine.dispose()
+            raise ValueError(f'the changed sync mode only syncs the competitions and matches, the database was loaded with the '
+                             f'events or lineups (tables {loaded_dependent_tables}) whose rows would be left for removed matches, '
+                             f'reload it with the full sync mode instead')
+        run_change_detection_sync(mongodb_db=mongodb_db,
+                                  mysql_engine=mysql_engine,
+                                  sql_foreign_keys_file_path=Path().cwd() / 'sql_files' / 'database_foreign_keys.sql',
+                                  source=source,
+                                  data_dir=data_dir,
+                                  cache_dir=json_cache_dir,
+                                  cursor_batch_size=cursor_batch_size,
+                                  upload_chunksize=upload_chunksize,
+                                  dimension_key_index_path=dimension_key_index_path,
+                                  content_hashes_path=content_hashes_path)
+        if mongodb_db is not None:
+            print('closing mongodb connection')
+            mongodb_db.client.close()
+        mysql_engine.dispose()
+        report_stages_metrics()
+        print('done all ETL steps')
+        return None
+
+    def stream_docs_batches(collection_name:str) -> Iterator[List[dict]]:
+        """
+        Streams the documents of a collection in batches, from the source of the run.
+        """
+        if source == 'files':
+            return stream_local_collection_in_batches(collection_name, data_dir=data_dir, cache_dir=json_cache_dir,
+                                                      docs_per_batch=docs_per_batch, max_workers=read_workers,
+                                                      stream_files=stream_json_files)
+        return stream_collection_in_batches(mongodb_db.get_collection(collection_name),
+                                            docs_per_batch=docs_per_batch,
+                                            cursor_batch_size=cursor_batch_size,
+                                            projection=COLLECTIONS_PROJECTIONS[collection_name])
+
+    def extract_competitions() -> Iterator[List[dict]]:
+        """
+        Extracts the competitions collection from the source of the run, as a single batch.
+        """
+        if source == 'files':
+            print('reading competitions json file')
+            yield read_local_collection('competitions', data_dir=data_dir, cache_dir=json_cache_dir)
+        else:
+            print('downloading competitions collection from mongodb database')
+            yield download_collection_to_list_of_dicts(mongodb_db.get_collection('competitions'))
+
+    with measure_stage('extract', collection='competitions') as stage_metrics:
+        competitions_dict = [doc for docs_batch in checkpoint_extracted_batches('competitions', extract_competitions) for doc in docs_batch]
+        stage_metrics['rows'] = len(competitions_dict)
+    with measure_stage('transform', collection='competitions', function='parse_and_process_competitions_dict') as stage_metrics:
+        competitions_dframes_dict = parse_and_process_competitions_dict(competitions_dict)
+        stage_metrics['rows'] = len(competitions_dict)
+
     print('connecting to mysql database')
-    with create_sql_db_connection() as mysql_connection:
+    mysql_engine = create_sql_db_engine(local_infile=(upload_strategy == 'bulk'), pool_size=load_workers + 1,
+                                        session_variables=FAST_LOAD_SESSION_VARIABLES if defer_indexes else None)
+    with mysql_engine.connect() as mysql_connection:
         mysql_connection.begin()
         print('reading database schema creation commands from file')
-        sql_database_config_commands_file_path = Path().cwd() / 'sql_files' / 'database_schema_creation_commands.sql'
-        run_sql_commands_from_file(sql_commands_file_path=sql_database_config_commands_file_path,
-                                connection=mysql_connection)
+        sql_database_config_commands = read_sql_commands_from_file(Path().cwd() / 'sql_files' / 'database_schema_creation_commands.sql')
+        sql_foreign_key_constraints_commands = read_sql_commands_from_file(Path().cwd() / 'sql_files' / 'database_foreign_keys.sql')
+        tables_names = parse_created_tables_names(sql_database_config_commands)
+        # with the shadow load the whole load runs on the staging tables, the live tables are only swapped with them at the end
+        sql_tables_suffix = ''
+        if shadow_load:
+            sql_database_config_commands = rename_tables_to_staging_tables(sql_database_config_commands)
+            sql_foreign_key_constraints_commands = rename_tables_to_staging_tables(sql_foreign_key_constraints_commands)
+            sql_tables_suffix = STAGING_TABLE_SUFFIX
+        # with the deferred indexes the tables are created with their primary keys only, and each table is sorted by its primary key
+        # before it's uploaded, the secondary indexes and the foreign keys are built once all the tables are loaded
+        tables_index_clauses, tables_primary_keys = {}, {}
+        if defer_indexes:
+            sql_database_config_commands, tables_index_clauses, tables_primary_keys = defer_secondary_indexes_of_schema_commands(sql_database_config_commands)
+        if is_checkpoint_done('create_schema'):
+            # the tables were created (and partially loaded) by a previous run of the checkpointed run, so they're kept
+            print('the tables were already created by the resumed run')
+        else:
+            run_sql_commands(sql_database_config_commands, mysql_connection)
+            record_checkpoint('create_schema')
+        if is_run_checkpointed():
+            create_load_checkpoints_table(mysql_connection)
+        if load_mode == 'fk_ordered':
+            print('creating foreign key constraints')
+            run_sql_commands(sql_foreign_key_constraints_commands, mysql_connection)
         print('starting upload of data to mysql database')
-    
-        for table_name, dframe in competitions_dframes_dict.items():
-            print(f'uploading table {table_name}')
-            sql_table_name = table_name.replace('df_', '')
-            dframe = dframe.dropna(axis=1, how='all')
-            dframe.to_sql(name=sql_table_name,
-                          con=mysql_connection,
-                          if_exists='append',
-                          index=False,
-                          chunksize=10_000)
-            print(f'done uploading table {table_name}')
-
-        for table_name, dframe in matches_dframes_dict.items():
-            print(f'uploading table {table_name}')
-            sql_table_name = table_name.replace('df_', '')
-            dframe = dframe.dropna(axis=1, how='all')
-            dframe.to_sql(name=sql_table_name,
-                          con=mysql_connection,
-                          if_exists='append',
-                          index=False,
-                          chunksize=10_000)
-            print(f'done uploading table {table_name}')
-            
-        print('creating foreign key constraints')
-        sql_foreign_key_constraints_commands_fp = Path().cwd() / 'sql_files' / 'database_foreign_keys.sql'
-        run_sql_commands_from_file(sql_foreign_key_constraints_commands_fp, mysql_connection)
+
+        # the matches (events and lineups) collections are streamed in batches, the tables that have a row per match (or per event)
+        # are uploaded batch by batch, while the lookup tables are collected and uploaded (deduplicated) once all batches are processed.
+        # (when the foreign keys exist up front, all the tables are collected, as the lookup tables have to be uploaded first)
+        matches_parse_func = parse_and_process_matches_dict if transform_backend == 'pandas' else parse_and_process_matches_to_arrow
+        matches_fact_tables = MATCHES_FACT_TABLES if load_mode != 'fk_ordered' else []
+        if transform_workers > 1:
+            # the matches are downloaded (or read) and parsed in a pool of processes, one (competition, season) shard per task
+            if source == 'files':
+                matches_shards = transform_matches_files_in_shards(matches_parse_func, data_dir=data_dir, cache_dir=json_cache_dir,
+                                                                   max_workers=transform_workers)
+            else:
+                matches_shards = transform_matches_collection_in_shards(mongodb_db, parse_func=matches_parse_func,
+                                                                        max_workers=transform_workers)
+            # each shard is extracted and transformed by a worker, so the stage of a shard is the time spent waiting for it
+            matches_shards = measure_each_item(matches_shards, 'extract_and_transform',
+                                               rows_func=lambda shard_tables_dict: len(shard_tables_dict['df_matches']),
+                                               collection='matches', function=matches_parse_func.__name__, workers=transform_workers)
+            matches_lookup_dframes_dicts = upload_fact_tables_of_parsed_batches(matches_shards,
+                                                                                fact_tables=matches_fact_tables,
+                                                                                mysql_connection=mysql_connection,
+                                                                                upload_chunksize=upload_chunksize,
+                                                                                upload_strategy=upload_strategy,
+                                                                                tables_sort_columns=tables_primary_keys,
+                                                                                sql_tables_suffix=sql_tables_suffix)
+        else:
+            matches_lookup_dframes_dicts = parse_and_upload_docs_batches(stream_docs_batches('matches'),
+                                                                         collection_name='matches',
+                                                                         parse_func=matches_parse_func,
+                                                                         fact_tables=matches_fact_tables,
+                                                                         mysql_connection=mysql_connection,
+                                                                         upload_chunksize=upload_chunksize,
+                                                                         upload_strategy=upload_strategy,
+                                                                         pipeline_queue_size=pipeline_queue_size,
+                                                                         tables_sort_columns=tables_primary_keys,
+                                                                         sql_tables_suffix=sql_tables_suffix)
+        events_lookup_dframes_dicts = []
+        if include_events:
+            events_lookup_dframes_dicts = parse_and_upload_docs_batches(stream_docs_batches('events'),
+                                                                        collection_name='events',
+                                                                        parse_func=parse_and_process_events,
+                                                                        fact_tables=EVENTS_FACT_TABLES if load_mode != 'fk_ordered' else [],
+                                                                        mysql_connection=mysql_connection,
+                                                                        upload_chunksize=upload_chunksize,
+                                                                        upload_strategy=upload_strategy,
+                                                                        pipeline_queue_size=pipeline_queue_size,
+                                                                        tables_sort_columns=tables_primary_keys,
+                                                                        sql_tables_suffix=sql_tables_suffix)
+        lineups_lookup_dframes_dicts = []
+        if include_lineups:
+            lineups_lookup_dframes_dicts = parse_and_upload_docs_batches(stream_docs_batches('lineups'),
+                                                                         collection_name='lineups',
+                                                                         parse_func=parse_and_process_lineups,
+                                                                         fact_tables=LINEUPS_FACT_TABLES if load_mode != 'fk_ordered' else [],
+                                                                         mysql_connection=mysql_connection,
+                                                                         upload_chunksize=upload_chunksize,
+                                                                         upload_strategy=upload_strategy,
+                                                                         pipeline_queue_size=pipeline_queue_size,
+                                                                         tables_sort_columns=tables_primary_keys,
+                                                                         sql_tables_suffix=sql_tables_suffix)
+        if mongodb_db is not None:
+            print('closing mongodb connection')
+            mongodb_db.client.close()
+
+        # the lookup tables shared between the collections (e.g. countries, positions) are combined into a single table
+        # (the arrow tables of the matches are small at this point, as the fact tables were already uploaded batch by batch)
+        matches_lookup_dframes_dicts = [arrow_tables_dict_to_dframes_dict(tables_dict) for tables_dict in matches_lookup_dframes_dicts]
+        lookup_dframes_dict = concat_and_deduplicate_dframes_dicts(matches_lookup_dframes_dicts + events_lookup_dframes_dicts + lineups_lookup_dframes_dicts,
+                                                                   tables_key_columns=LINEUPS_LOOKUP_TABLES_KEYS)
+        competitions_dframes_dict['df_competitions'] = normalize_countries_field_df_competitions(competitions_dframes_dict['df_competitions'],
+                                                                                                 lookup_dframes_dict['df_countries'])
+
+        if defer_indexes:
+            competitions_dframes_dict = {table_name: sort_table_by_columns(dframe, tables_primary_keys.get(table_name.replace('df_', '') + sql_tables_suffix))
+                                         for table_name, dframe in competitions_dframes_dict.items()}
+            lookup_dframes_dict = {table_name: sort_table_by_columns(dframe, tables_primary_keys.get(table_name.replace('df_', '') + sql_tables_suffix))
+                                   for table_name, dframe in lookup_dframes_dict.items()}
+
+        if load_mode == 'sequential':
+            for table_name, dframe in competitions_dframes_dict.items():
+                print(f'uploading table {table_name}')
+                sql_table_name = table_name.replace('df_', '') + sql_tables_suffix
+                upload_table_with_checkpoints(dframe, sql_table_name, mysql_connection, checkpoint_key=f'load:{sql_table_name}',
+                                              chunksize=upload_chunksize, strategy=upload_strategy)
+                print(f'done uploading table {table_name}')
+
+            for table_name, dframe in lookup_dframes_dict.items():
+                print(f'uploading table {table_name}')
+                sql_table_name = table_name.replace('df_', '') + sql_tables_suffix
+                upload_table_with_checkpoints(dframe, sql_table_name, mysql_connection, checkpoint_key=f'load:{sql_table_name}',
+                                              chunksize=upload_chunksize, strategy=upload_strategy)
+                print(f'done uploading table {table_name}')
+        else:
+            # the batches uploaded so far are committed, so they're visible to the other connections of the pool
+            mysql_connection.commit()
+            sql_dframes_dict = {table_name.replace('df_', '') + sql_tables_suffix: dframe
+                                for table_name, dframe in {**competitions_dframes_dict, **lookup_dframes_dict}.items()}
+            dependencies = parse_foreign_keys_dependencies_of_sql_commands(sql_foreign_key_constraints_commands) if load_mode == 'fk_ordered' else None
+            upload_tables_concurrently(sql_dframes_dict,
+                                       engine=mysql_engine,
+                                       max_workers=load_workers,
+                                       dependencies=dependencies,
+                                       chunksize=upload_chunksize,
+                                       strategy=upload_strategy)
+
+        if is_checkpoint_done('foreign_keys'):
+            print('the foreign key constraints were already created by the resumed run')
+        elif defer_indexes:
+            print('building the deferred indexes and foreign key constraints')
+            # the batches uploaded so far are committed first, as an `ALTER TABLE` commits the transaction anyway
+            mysql_connection.commit()
+            build_deferred_indexes_and_foreign_keys(mysql_connection,
+                                                    tables_index_clauses=tables_index_clauses,
+                                                    tables_foreign_keys_clauses=parse_foreign_keys_clauses(sql_foreign_key_constraints_commands),
+                                                    dependencies=parse_foreign_keys_dependencies_of_sql_commands(sql_foreign_key_constraints_commands))
+        elif load_mode != 'fk_ordered':
+            print('creating foreign key constraints')
+            run_sql_commands(sql_foreign_key_constraints_commands, mysql_connection)
+        mysql_connection.commit()
+        record_checkpoint('foreign_keys')
+        if shadow_load and not(is_checkpoint_done('swap_tables')):
+            # the staging tables are loaded, indexed and constrained, so they replace the live tables all at once
+            swap_staging_tables(mysql_connection, tables_names)
+            record_checkpoint('swap_tables')
+    mysql_engine.dispose()
+
+    # all the tables were recreated, so the dimension key index is rebuilt from the uploaded dimension tables,
+    # the next incremental syncs then only sync the dimension rows that aren't in the database yet
+    print('rebuilding the dimension key index')
+    index_connection = open_dimension_key_index(dimension_key_index_path)
+    rebuild_dimension_key_index(index_connection, {table_name.replace('df_', ''): dframe
+                                                   for table_name, dframe in {**competitions_dframes_dict, **lookup_dframes_dict}.items()})
+    index_connection.close()
+    # the content hashes of the previous change detection syncs don't describe the reloaded tables anymore
+    clear_content_hashes(content_hashes_path)
+    finish_run_checkpoints()
+    report_stages_metrics()
     print('done all ETL steps')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    args_parser = argparse.ArgumentParser(description='ETL script from the mongodb database to the mysql database')
+    args_parser.add_argument('--docs-per-batch', type=int, default=5_000,
+                             help='number of matches documents processed and uploaded at a time')
+    args_parser.add_argument('--cursor-batch-size', type=int, default=1_000,
+                             help='number of documents the mongodb cursor fetches per round trip')
+    args_parser.add_argument('--upload-strategy', choices=list(UPLOAD_STRATEGIES.keys()), default='to_sql',
+                             help='how the dataframes are uploaded to the mysql database')
+    args_parser.add_argument('--upload-chunksize', type=int, default=None,
+                             help='rows per insert statement (default is estimated from max_allowed_packet)')
+    args_parser.add_argument('--load-mode', choices=LOAD_MODES, default='sequential',
+                             help='how the tables are scheduled while uploading them to the mysql database')
+    args_parser.add_argument('--load-workers', type=int, default=4,
+                             help='number of tables uploaded concurrently (parallel and fk_ordered load modes)')
+    args_parser.add_argument('--sync-mode', choices=SYNC_MODES, default='full',
+                             help='reload all the tables, only sync the matches updated since the previous sync, or only the partitions whose content changed')
+    args_parser.add_argument('--include-events', action='store_true',
+                             help='also extract, transform and load the events collection')
+    args_parser.add_argument('--include-lineups', action='store_true',
+                             help='also extract, transform and load the lineups collection')
+    args_parser.add_argument('--transform-backend', choices=TRANSFORM_BACKENDS, default='pandas',
+                             help='transform the matches into pandas dataframes or into typed arrow tables')
+    args_parser.add_argument('--transform-workers', type=int, default=1,
+                             help='number of processes transforming the matches, sharded by (competition, season), 1 streams them in batches')
+    args_parser.add_argument('--source', choices=SOURCES, default='mongodb',
+                             help='extract the documents from the mongodb database, or from the local json files (no network needed)')
+    args_parser.add_argument('--data-dir', type=Path, default=None,
+                             help='directory of the json files of the files source (default is the data directory of the repo)')
+    args_parser.add_argument('--json-cache-dir', type=Path, default=DEFAULT_CACHE_DIR,
+                             help='directory of the cache of the decoded json files of the files source')
+    args_parser.add_argument('--no-json-cache', action='store_true',
+                             help='decode all the json files of the files source, without reading or writing the cache')
+    args_parser.add_argument('--read-workers', type=int, default=4,
+                             help='number of json files read concurrently by the files source')
+    args_parser.add_argument('--stream-json-files', action='store_true',
+                             help='stream the json files of the files source one document at a time, so the memory depends on the batch size, not on the files size')
+    args_parser.add_argument('--metrics-file', type=Path, default=None,
+                             help='write the time, memory and rows/sec of each stage (extract, transform, load) to this file')
+    args_parser.add_argument('--metrics-format', choices=METRICS_FORMATS, default='jsonl',
+                             help='a json line per stage, or the prometheus text format (summed per stage)')
+    args_parser.add_argument('--trace-memory', action='store_true',
+                             help='also record the peak python memory of each stage with tracemalloc (slows the run down)')
+    args_parser.add_argument('--profile-stages', nargs='+', default=None,
+                             help='profile these stages (e.g. transform load, or * for all), with pyinstrument if installed or cProfile')
+    args_parser.add_argument('--profile-dir', type=Path, default=None,
+                             help='directory of the stages profiles (default is profiles in the current directory)')
+    args_parser.add_argument('--pipeline-queue-size', type=int, default=0,
+                             help='run the extract, transform and load of the batches concurrently, with queues of this many batches between them (0 runs them one after the other)')
+    args_parser.add_argument('--defer-indexes', action='store_true',
+                             help='load the tables without their secondary indexes and with the unique and foreign key checks disabled, then build the indexes and foreign keys with an ALTER TABLE per table')
+    args_parser.add_argument('--shadow-load', action='store_true',
+                             help='load into staging tables, and only replace the live tables (with an atomic RENAME TABLE) once the load succeeded')
+    args_parser.add_argument('--run-dir', type=Path, default=None,
+                             help='checkpoint the run in this directory (extracted batches, transformed tables and a manifest), rerun with the same directory to resume a failed run')
+    args_parser.add_argument('--checkpoint-rows', type=int, default=100_000,
+                             help='rows of a table uploaded between two commits of a checkpointed run, a resumed load restarts after the last commit')
+    args_parser.add_argument('--async-io', action='store_true',
+                             help='run the full load on an asyncio event loop, with motor cursors and an async mysql driver (needs motor, greenlet and the driver)')
+    args_parser.add_argument('--async-cursors', type=int, default=4,
+                             help='number of collections streamed at once by the async runner')
+    args_parser.add_argument('--async-inserts', type=int, default=4,
+                             help='number of tables (or batches of a fact table) uploaded at once by the async runner')
+    args_parser.add_argument('--async-mysql-driver', choices=ASYNC_MYSQL_DRIVERS, default='aiomysql',
+                             help='the async mysql driver of the async runner')
+    args = args_parser.parse_args()
+    main(docs_per_batch=args.docs_per_batch,
+         cursor_batch_size=args.cursor_batch_size,
+         upload_strategy=args.upload_strategy,
+         upload_chunksize=args.upload_chunksize,
+         load_mode=args.load_mode,
+         load_workers=args.load_workers,
+         sync_mode=args.sync_mode,
+         include_events=args.include_events,
+         include_lineups=args.include_lineups,
+         transform_backend=args.transform_backend,
+         transform_workers=args.transform_workers,
+         source=args.source,
+         data_dir=args.data_dir,
+         json_cache_dir=None if args.no_json_cache else args.json_cache_dir,
+         read_workers=args.read_workers,
+         stream_json_files=args.stream_json_files,
+         metrics_file_path=args.metrics_file,
+         metrics_format=args.metrics_format,
+         trace_memory=args.trace_memory,
+         profile_stages=args.profile_stages,
+         profile_dir=args.profile_dir,
+         pipeline_queue_size=args.pipeline_queue_size,
+         defer_indexes=args.defer_indexes,
+         shadow_load=args.shadow_load,
+         run_dir=args.run_dir,
+         checkpoint_rows=args.checkpoint_rows,
+         async_io=args.async_io,
+         async_cursors=args.async_cursors,
+         async_inserts=args.async_inserts,
+         async_mysql_driver=args.async_mysql_driver)
@@ -0,0 +1,278 @@
+# This module (re)seeds the mongodb database from the statsbomb json files in the data directory, e.g.:
+#   python mongodb_bootstrap.py --collections competitions matches lineups events --workers 8 --unacknowledged
+# it's the bulk counterpart of porting_json_to_mongodb.py: the files are read and inserted by a pool of threads,
+# each file is streamed in batches (see `stream_json_array_file`), and each batch is sent in a single unordered `bulk_write`.
+# every file is recorded in a manifest (a json lines file) when it starts and when it's done, so an interrupted bootstrap can be resumed:
+# the files that are done are skipped, and the documents of the other files are deleted before inserting them again
+# (when the collection isn't empty, e.g. the manifest was lost), so a file's documents are never inserted twice.
+# `--reset` empties the collections first, and records it in the manifest, to reload all their files.
+
+
+import argparse
+import json
+import threading
+import pymongo.collection
+import pymongo.database
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from pymongo import InsertOne
+from pymongo.write_concern import WriteConcern
+from tabulate import tabulate
+from time import perf_counter
+from typing import Dict, List
+
+from local_file_source import DEFAULT_DATA_DIR
+from local_file_source import LOCAL_COLLECTIONS_FILES_PATTERNS
+from local_file_source import MATCH_ID_FROM_FILE_NAME_COLLECTIONS
+from local_file_source import get_local_collection_file_paths
+from local_file_source import stream_collection_file_documents
+from mongodb_downloader import connect_to_mongo_database
+
+DEFAULT_MANIFEST_PATH = Path().cwd().parent / '.bootstrap_manifest.jsonl'
+
+# appending to the manifest from the worker threads
+MANIFEST_LOCK = threading.Lock()
+
+
+def read_manifest(manifest_path:Path) -> Dict[str, str]:
+    """
+    Reads the status of each file in the manifest of a previous bootstrap (`started` or `done`, the last one recorded wins),
+    the files of a collection that was reset afterwards (see `reset_collection`) have no status.
+
+    ## Parameters
+    manifest_path: Path
+        Path to the manifest, a missing manifest means nothing was loaded yet
+
+    ## Returns
+    Dict[str, str]
+        Dictionary mapping the key of each file (see `get_manifest_file_key`) to its status
+    """
+    files_statuses = {}
+    if not(manifest_path.exists()):
+        return files_statuses
+    with open(manifest_path, 'r') as manifest_file:
+        for line in manifest_file:
+            # the last line can be cut if the previous bootstrap was killed while writing it
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry['status'] == 'reset':
+                files_statuses = {file_key: status for file_key, status in files_statuses.items()
+                                  if not(file_key.startswith(f"{entry['collection']}:"))}
+            else:
+                files_statuses[entry['file']] = entry['status']
+    return files_statuses
+
+
+def append_to_manifest(manifest_path:Path, entry:dict) -> None:
+    """
+    Appends an entry (a file and its status) to the manifest, it's flushed right away, so it survives the bootstrap being killed.
+    """
+    with MANIFEST_LOCK, open(manifest_path, 'a') as manifest_file:
+        manifest_file.write(json.dumps(entry) + '\n')
+        manifest_file.flush()
+
+
+def get_manifest_file_key(collection_name:str, file_path:Path, data_dir:Path) -> str:
+    """
+    Gets the key of a file in the manifest, its path relative to the data directory (which also names its collection).
+    """
+    return f'{collection_name}:{file_path.relative_to(data_dir).as_posix()}'
+
+
+def reset_collection(collection:pymongo.collection.Collection, manifest_path:Path) -> None:
+    """
+    Empties a collection (keeping its indexes), and records it in the manifest, so all its files are loaded again.
+    The reset is recorded once the collection is empty, so an interrupted reset is just done again by the next one.
+    """
+    print(f'emptying the {collection.name} collection')
+    collection.delete_many({})
+    append_to_manifest(manifest_path, {'collection': collection.name, 'status': 'reset'})
+
+
+def get_file_documents_query(collection_name:str, file_path:Path) -> dict:
+    """
+    Builds the query that selects the documents of a single json file in its collection,
+    used to delete the documents of a file that isn't recorded as done (e.g. partially inserted) before inserting it again.
+    - the events and lineups files hold the documents of one match (`<match_id>.json`)
+    - the matches files hold the matches of one season of one competition (`<competition_id>/<season_id>.json`)
+    - the competitions file is the whole collection
+    """
+    if collection_name in MATCH_ID_FROM_FILE_NAME_COLLECTIONS:
+        return {'match_id': int(file_path.stem)}
+    if collection_name == 'matches':
+        return {'competition.competition_id': int(file_path.parent.name), 'season.season_id': int(file_path.stem)}
+    return {}
+
+
+def bulk_insert_file(collection:pymongo.collection.Collection,
+                     collection_name:str,
+                     file_path:Path,
+                     docs_per_batch:int) -> int:
+    """
+    Streams the documents of a json file in batches, and inserts each batch with a single unordered `bulk_write`.
+
+    ## Parameters
+    collection: pymongo.collection.Collection
+        The collection to insert the documents into (with the write concern of the bootstrap)
+    collection_name: str
+        The name of the collection the file belongs to (see `LOCAL_COLLECTIONS_FILES_PATTERNS`)
+    file_path: Path
+        Path to the json file
+    docs_per_batch: int
+        Number of documents sent in each `bulk_write`
+
+    ## Returns
+    int
+        The number of documents inserted
+    """
+    docs_count = 0
+    insert_requests = []
+    for doc in stream_collection_file_documents(collection_name, file_path):
+        insert_requests.append(InsertOne(doc))
+        if len(insert_requests) == docs_per_batch:
+            collection.bulk_write(insert_requests, ordered=False)
+            docs_count += len(insert_requests)
+            insert_requests = []
+    if insert_requests:
+        collection.bulk_write(insert_requests, ordered=False)
+        docs_count += len(insert_requests)
+    return docs_count
+
+
+def bootstrap_collection(mongodb_db:pymongo.database.Database,
+                         collection_name:str,
+                         data_dir:Path=None,
+                         manifest_path:Path=DEFAULT_MANIFEST_PATH,
+                         max_workers:int=8,
+                         docs_per_batch:int=5_000,
+                         unacknowledged:bool=False,
+                         reset:bool=False) -> dict:
+    """
+    Loads the json files of a collection into the mongodb database with a pool of threads (see `bulk_insert_file`),
+    skipping the files that the manifest records as done, and recording each file in it.
+    The documents of the other files are deleted before inserting them, unless the collection was empty.
+
+    ## Parameters
+    mongodb_db: pymongo.database.Database
+        The mongodb database
+    collection_name: str
+        One of the collections in `LOCAL_COLLECTIONS_FILES_PATTERNS`
+    data_dir: Path, default=None
+        The data directory (default is the data directory of the repo)
+    manifest_path: Path, default=DEFAULT_MANIFEST_PATH
+        Path to the manifest of the bootstrap
+    max_workers: int, default=8
+        Number of files loaded concurrently
+    docs_per_batch: int, default=5_000
+        Number of documents sent in each `bulk_write`
+    unacknowledged: bool, default=False
+        Insert the documents without waiting for the server to acknowledge them (write concern `w=0`),
+        this is a lot faster for the initial load, but a file can be recorded as done while some of its documents failed,
+        so the documents count should be checked afterwards
+    reset: bool, default=False
+        Empty the collection first, and load all its files again (see `reset_collection`)
+
+    ## Returns
+    dict
+        Summary of the load: the number of files loaded, skipped and failed, the number of documents, the seconds and the docs/sec
+    """
+    if data_dir is None:
+        data_dir = DEFAULT_DATA_DIR
+    collection = mongodb_db.get_collection(collection_name)
+    insert_collection = collection.with_options(write_concern=WriteConcern(w=0)) if unacknowledged else collection
+    if reset:
+        reset_collection(collection, manifest_path)
+    files_statuses = read_manifest(manifest_path)
+    # the files missing from the manifest may still have documents in the collection (e.g. the manifest was deleted),
+    # a collection that starts empty has nothing to delete, which saves a delete per file of the initial load
+    is_collection_empty = collection.estimated_document_count() == 0
+    file_paths = get_local_collection_file_paths(collection_name, data_dir)
+    pending_file_paths = [file_path for file_path in file_paths
+                          if files_statuses.get(get_manifest_file_key(collection_name, file_path, data_dir)) != 'done']
+    print(f'loading {len(pending_file_paths)} files into the {collection_name} collection '
+          f'({len(file_paths) - len(pending_file_paths)} files already done)')
+
+    def load_file(file_path:Path) -> int:
+        """
+        Loads a single file, and records it in the manifest when it starts and when it's done.
+        """
+        file_key = get_manifest_file_key(collection_name, file_path, data_dir)
+        if files_statuses.get(file_key) == 'started' or not(is_collection_empty):
+            # the previous bootstrap was interrupted while loading this file (or it isn't in the manifest),
+            # its documents are deleted before inserting them again
+            collection.delete_many(get_file_documents_query(collection_name, file_path))
+        append_to_manifest(manifest_path, {'file': file_key, 'status': 'started'})
+        docs_count = bulk_insert_file(insert_collection, collection_name, file_path, docs_per_batch)
+        append_to_manifest(manifest_path, {'file': file_key, 'status': 'done', 'documents': docs_count})
+        return docs_count
+
+    start_time = perf_counter()
+    docs_count = 0
+    failed_files_count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures_file_paths = {executor.submit(load_file, file_path): file_path for file_path in pending_file_paths}
+        for i, future in enumerate(as_completed(futures_file_paths), start=1):
+            file_path = futures_file_paths[future]
+            try:
+                file_docs_count = future.result()
+            except Exception as e:
+                # the file stays `started` in the manifest, so it's loaded again by the next bootstrap
+                failed_files_count += 1
+                print(f'***** ERROR ***** - [{i}/{len(pending_file_paths)}] - {file_path}')
+                print(e)
+                continue
+            docs_count += file_docs_count
+            print(f'[{i}/{len(pending_file_paths)}] - {file_docs_count} documents of {file_path.name} were inserted into the {collection_name} collection.')
+    elapsed_time = perf_counter() - start_time
+    return {'collection': collection_name,
+            'files loaded': len(pending_file_paths) - failed_files_count,
+            'files skipped': len(file_paths) - len(pending_file_paths),
+            'files failed': failed_files_count,
+            'documents': docs_count,
+            'seconds': round(elapsed_time, 3),
+            'docs/sec': round(docs_count / elapsed_time) if elapsed_time > 0 else 0}
+
+
+def bootstrap_mongodb_database(mongodb_db:pymongo.database.Database,
+                               collections_names:List[str],
+                               **bootstrap_kwargs) -> List[dict]:
+    """
+    Loads the json files of mutiple collections into the mongodb database, one collection after the other (see `bootstrap_collection`).
+
+    ## Returns
+    List[dict]
+        The summary of the load of each collection
+    """
+    return [bootstrap_collection(mongodb_db, collection_name, **bootstrap_kwargs) for collection_name in collections_names]
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='seed the mongodb database from the statsbomb json files')
+    args_parser.add_argument('--collections', nargs='+', choices=list(LOCAL_COLLECTIONS_FILES_PATTERNS.keys()),
+                             default=list(LOCAL_COLLECTIONS_FILES_PATTERNS.keys()))
+    args_parser.add_argument('--data-dir', type=Path, default=DEFAULT_DATA_DIR)
+    args_parser.add_argument('--manifest', type=Path, default=DEFAULT_MANIFEST_PATH,
+                             help='manifest of the files already loaded, the other files are loaded (again) by the next bootstrap')
+    args_parser.add_argument('--reset', action='store_true',
+                             help='empty the collections first, and load all their files again')
+    args_parser.add_argument('--workers', type=int, default=8,
+                             help='number of files loaded concurrently')
+    args_parser.add_argument('--docs-per-batch', type=int, default=5_000,
+                             help='number of documents sent in each bulk write')
+    args_parser.add_argument('--unacknowledged', action='store_true',
+                             help="don't wait for the server to acknowledge the writes (w=0), for the initial load")
+    args = args_parser.parse_args()
+
+    db = connect_to_mongo_database()
+    results = bootstrap_mongodb_database(db, args.collections,
+                                         data_dir=args.data_dir,
+                                         manifest_path=args.manifest,
+                                         max_workers=args.workers,
+                                         docs_per_batch=args.docs_per_batch,
+                                         unacknowledged=args.unacknowledged,
+                                         reset=args.reset)
+    db.client.close()
+    print(tabulate(results, headers='keys', tablefmt='psql'))
@@ -5,11 +5,12 @@ import pymongo.collection
 import pymongo.results
 import pymongo.server_api
 
+from concurrent.futures import ThreadPoolExecutor
 from json import loads as json_loads
 from pathlib import Path
 from helpful_funcs import read_json_file_to_dict
 from tabulate import tabulate
-from typing import List
+from typing import Iterator, List
 
 def connect_to_mongo_database(creds_json_file_path:Path=None) -> pymongo.database.Database:
     """
@@ -50,6 +51,212 @@ def download_collection_to_list_of_dicts(collection:pymongo.collection.Collectio
     docs_cursor = collection.find({}, {'_id': False})       
     return list(docs_cursor)
 
+def stream_collection_in_batches(collection:pymongo.collection.Collection,
+                                 docs_per_batch:int=5_000,
+                                 cursor_batch_size:int=1_000,
+                                 projection:dict=None,
+                                 query:dict=None) -> Iterator[List[dict]]:
+    """
+    This function streams a collection from the mongodb database in batches of documents,
+    so the documents can be processed (and uploaded) while the rest of the collection is still being downloaded,
+    and only one batch is held in memory at a time.
+    
+    ## Parameters
+    collection: pymongo.collection.Collection
+        Collection to download from the mongodb database
+    docs_per_batch: int, default=5_000
+        Number of documents in each yielded batch
+    cursor_batch_size: int, default=1_000
+        Number of documents the cursor fetches from the server per round trip
+    projection: dict, default=None
+        Projection to apply to the documents (default is all the fields except `_id`)
+    query: dict, default=None
+        Filter to apply to the documents (default is all the documents)
+    
+    ## Yields
+    List[dict]
+        Batch of (at most `docs_per_batch`) dictionaries with the contents of the collection
+    """
+    if docs_per_batch < 1:
+        raise ValueError('docs_per_batch should be a positive integer')
+    if projection is None:
+        projection = {'_id': False}
+    if query is None:
+        query = {}
+    docs_cursor = collection.find(query, projection, batch_size=cursor_batch_size)
+    try:
+        docs_batch = []
+        for doc in docs_cursor:
+            docs_batch.append(doc)
+            if len(docs_batch) == docs_per_batch:
+                yield docs_batch
+                docs_batch = []
+        if docs_batch:
+            yield docs_batch
+    finally:
+        docs_cursor.close()
+
+def build_id_range_partition_queries(collection:pymongo.collection.Collection,
+                                     partitions_count:int) -> List[dict]:
+    """
+    Splits a collection into (roughly) equally sized `_id` ranges, and returns a query for each range.
+    The range boundaries are found in a single walk of the `_id` index (only the `_id`s are read, the documents aren't fetched),
+    instead of a `skip` per boundary, which would walk the index again from the start for each one.
+    
+    ## Parameters
+    collection: pymongo.collection.Collection
+        Collection to split
+    partitions_count: int
+        Number of ranges to split the collection into
+    
+    ## Returns
+    List[dict]
+        List of queries, one per `_id` range, together they cover the whole collection without overlapping
+    """
+    docs_count = collection.estimated_document_count()
+    # the position (in `_id` order) of the first document of each range, except the first range
+    boundaries_positions = {i * docs_count // partitions_count for i in range(1, partitions_count)} - {0}
+    boundaries = []
+    if boundaries_positions:
+        last_boundary_position = max(boundaries_positions)
+        ids_cursor = collection.find({}, {'_id': True}, batch_size=10_000).sort('_id', pymongo.ASCENDING)
+        try:
+            for position, doc in enumerate(ids_cursor):
+                if position in boundaries_positions and (not(boundaries) or doc['_id'] != boundaries[-1]):
+                    boundaries.append(doc['_id'])
+                if position >= last_boundary_position:
+                    break
+        finally:
+            ids_cursor.close()
+    queries = []
+    lower_boundary = None
+    for boundary in boundaries + [None]:
+        id_range = {}
+        if lower_boundary is not None:
+            id_range['$gte'] = lower_boundary
+        if boundary is not None:
+            id_range['$lt'] = boundary
+        queries.append({'_id': id_range} if id_range else {})
+        lower_boundary = boundary
+    return queries
+
+def build_field_bucket_partition_queries(collection:pymongo.collection.Collection,
+                                         partition_field:str,
+                                         partitions_count:int) -> List[dict]:
+    """
+    Splits a collection into buckets of distinct values of a field (e.g. `match_id` or `competition.competition_id`),
+    and returns a query for each bucket. The distinct values are sorted and split into contiguous buckets.
+    Documents where the field is missing or null get a bucket of their own.
+    
+    ## Parameters
+    collection: pymongo.collection.Collection
+        Collection to split
+    partition_field: str
+        Name of the field to split the collection by (dot notation for nested fields)
+    partitions_count: int
+        Number of buckets to split the distinct values into
+    
+    ## Returns
+    List[dict]
+        List of queries, one per bucket, together they cover the whole collection without overlapping
+    """
+    distinct_values = sorted(value for value in collection.distinct(partition_field) if value is not None)
+    bucket_size = max(1, -(-len(distinct_values) // partitions_count))
+    queries = []
+    for i in range(0, len(distinct_values), bucket_size):
+        queries.append({partition_field: {'$in': distinct_values[i:i + bucket_size]}})
+    queries.append({partition_field: None})
+    return queries
+
+def download_partition_to_list_of_dicts(collection:pymongo.collection.Collection,
+                                        query:dict,
+                                        sort_fields:List[str],
+                                        projection:dict=None,
+                                        cursor_batch_size:int=1_000) -> List[dict]:
+    """
+    Downloads the documents of a single partition of a collection, sorted so the output order is deterministic.
+    
+    ## Parameters
+    collection: pymongo.collection.Collection
+        Collection to download from the mongodb database
+    query: dict
+        Filter selecting the documents of the partition
+    sort_fields: List[str]
+        Fields to sort the documents of the partition by (ascending)
+    projection: dict, default=None
+        Projection to apply to the documents (default is all the fields except `_id`)
+    cursor_batch_size: int, default=1_000
+        Number of documents the cursor fetches from the server per round trip
+    
+    ## Returns
+    List[dict]
+        List of dictionaries with the contents of the partition
+    """
+    if projection is None:
+        projection = {'_id': False}
+    docs_cursor = collection.find(query, projection, batch_size=cursor_batch_size)
+    docs_cursor = docs_cursor.sort([(sort_field, pymongo.ASCENDING) for sort_field in sort_fields])
+    return list(docs_cursor)
+
+def download_collection_in_parallel_partitions(collection:pymongo.collection.Collection,
+                                               partition_field:str='_id',
+                                               partitions_count:int=8,
+                                               max_workers:int=None,
+                                               projection:dict=None,
+                                               cursor_batch_size:int=1_000) -> List[dict]:
+    """
+    Downloads a full collection using multiple concurrent cursors, one per partition of the collection,
+    the partitions are either `_id` ranges, or buckets of the distinct values of `partition_field`.
+    All the cursors share the connection pool of the collection's `MongoClient` (which is thread safe),
+    so the BSON decoding of the different partitions is spread over several connections.
+    
+    The documents are returned ordered by (`partition_field`, `_id`), so the output order is the same on every call.
+    The whole collection is returned at once, so the ETL streams the collections in batches instead (see `stream_collection_in_batches`),
+    this is used to benchmark the partitioned download against a single cursor (see benchmark_mongodb_download.py).
+    
+    ## Parameters
+    collection: pymongo.collection.Collection
+        Collection to download from the mongodb database
+    partition_field: str, default='_id'
+        Field to partition the collection by, `_id` splits it into ranges, any other field splits it into buckets of its values
+    partitions_count: int, default=8
+        Number of partitions to split the collection into
+    max_workers: int, default=None
+        Number of threads downloading partitions concurrently (default is one per partition)
+    projection: dict, default=None
+        Projection to apply to the documents (default is all the fields except `_id`)
+    cursor_batch_size: int, default=1_000
+        Number of documents each cursor fetches from the server per round trip
+    
+    ## Returns
+    List[dict]
+        List of dictionaries with the contents of the collection
+    """
+    if partitions_count < 1:
+        raise ValueError('partitions_count should be a positive integer')
+    if partition_field == '_id':
+        partition_queries = build_id_range_partition_queries(collection, partitions_count)
+        sort_fields = ['_id']
+    else:
+        partition_queries = build_field_bucket_partition_queries(collection, partition_field, partitions_count)
+        sort_fields = [partition_field, '_id']
+    if max_workers is None:
+        max_workers = len(partition_queries)
+    
+    def download_partition(query:dict) -> List[dict]:
+        return download_partition_to_list_of_dicts(collection=collection,
+                                                   query=query,
+                                                   sort_fields=sort_fields,
+                                                   projection=projection,
+                                                   cursor_batch_size=cursor_batch_size)
+    
+    docs_list = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map keeps the order of the partitions, which keeps the output order deterministic
+        for partition_docs in executor.map(download_partition, partition_queries):
+            docs_list.extend(partition_docs)
+    return docs_list
+
 if __name__ == '__main__':
     db = connect_to_mongo_database()
     competitions_collection = db.competitions
@@ -1,26 +1,88 @@
+import csv
+import pandas as pd
 import sqlalchemy
 from helpful_funcs import read_json_file_to_dict
+from pipeline_metrics import measure_stage
 from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Dict, List
 
-def create_sql_db_connection(creds_file_path: Path=None) -> sqlalchemy.Connection:
+# pyarrow is only needed to upload the tables of the arrow transform backend (see arrow_parser_funcs.py)
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+# the default value of max_allowed_packet in older MySQL servers, used when the server variable can't be read
+DEFAULT_MAX_ALLOWED_PACKET = 4 * 1024 * 1024
+
+def create_sql_db_engine(creds_file_path: Path=None,
+                         local_infile: bool=False,
+                         pool_size: int=5,
+                         session_variables: Dict[str, int]=None) -> sqlalchemy.Engine:
     """
-    This function creates a connection to a MySQL database using the credentials in the creds_file_path.
+    This function creates an engine (a connection pool) for a MySQL database using the credentials in the creds_file_path.
     
     ## Parameters:
     - creds_file_path: Path
         Path to the json file containing the credentials for the MySQL database.
+    - local_infile: bool, default=False
+        Whether to allow `LOAD DATA LOCAL INFILE` on the connections (needed by the `bulk` upload strategy).
+    - pool_size: int, default=5
+        The number of connections kept open in the pool.
+    - session_variables: Dict[str, int], default=None
+        Session variables set on every connection of the pool as soon as it's opened, e.g. `{'unique_checks': 0}`.
         
     ## Returns:
-    - sqlalchemy.connection
-        A connection to the MySQL database.
+    - sqlalchemy.Engine
+        An engine for the MySQL database.
     """
     if creds_file_path is None:
         creds_file_path = Path().cwd() / 'creds' / 'mysql_creds.json'
     connection_string = read_json_file_to_dict(creds_file_path)
-    connection_engine = sqlalchemy.create_engine(url=connection_string['connection_string'])
+    connect_args = {'local_infile': True} if local_infile else {}
+    engine = sqlalchemy.create_engine(url=connection_string['connection_string'], connect_args=connect_args, pool_size=pool_size)
+    if session_variables:
+        set_session_variables_command = 'SET SESSION ' + ', '.join(f'{name} = {value}' for name, value in session_variables.items())
+
+        @sqlalchemy.event.listens_for(engine, 'connect')
+        def set_session_variables(dbapi_connection, connection_record) -> None:
+            cursor = dbapi_connection.cursor()
+            cursor.execute(set_session_variables_command)
+            cursor.close()
+    return engine
+
+
+def create_sql_db_connection(creds_file_path: Path=None, local_infile: bool=False) -> sqlalchemy.Connection:
+    """
+    This function creates a connection to a MySQL database using the credentials in the creds_file_path.
+    
+    ## Parameters:
+    - creds_file_path: Path
+        Path to the json file containing the credentials for the MySQL database.
+    - local_infile: bool, default=False
+        Whether to allow `LOAD DATA LOCAL INFILE` on the connection (needed by the `bulk` upload strategy).
+        
+    ## Returns:
+    - sqlalchemy.connection
+        A connection to the MySQL database.
+    """
+    connection_engine = create_sql_db_engine(creds_file_path=creds_file_path, local_infile=local_infile)
     return connection_engine.connect()  
 
 
+def read_sql_commands_from_file(sql_commands_file_path: Path) -> List[str]:
+    """
+    This function reads the SQL commands in a file (separated by `;`).
+    """
+    with open(sql_commands_file_path, 'r') as sql_commands_file:
+        sql_commands = sql_commands_file.read().split(';')[:-1]
+    print(f'found {len(sql_commands)} sql commands in {sql_commands_file_path}')
+    return sql_commands
+
+
 def run_sql_commands_from_file(sql_commands_file_path: Path, connection: sqlalchemy.Connection) -> None:
     """
     This function runs a SQL command on a MySQL database.
@@ -34,11 +96,25 @@ def run_sql_commands_from_file(sql_commands_file_path: Path, connection: sqlalch
     ## Returns:
     - None
     """
-    with open(sql_commands_file_path, 'r') as sql_commands_file:
-        sql_commands = sql_commands_file.read().split(';')[:-1]
-    sql_commands_count = len(sql_commands)
-    print(f'found {sql_commands_count} sql commands in {sql_commands_file_path}')
+    run_sql_commands(read_sql_commands_from_file(sql_commands_file_path), connection)
+    return None
+
+
+def run_sql_commands(sql_commands: List[str], connection: sqlalchemy.Connection) -> None:
+    """
+    This function runs SQL commands on a MySQL database in a single transaction, which is rolled back (and the error raised again)
+    if any of them fails.
     
+    ## Parameters:
+    - sql_commands: List[str]
+        The SQL commands to run.
+    - connection: sqlalchemy.Connection
+        The connection to the MySQL database.
+        
+    ## Returns:
+    - None
+    """
+    sql_commands_count = len(sql_commands)
     try:
         for i, sql_command in enumerate(sql_commands):
             print(f'running command {i+1} of {sql_commands_count}')
@@ -49,8 +125,440 @@ def run_sql_commands_from_file(sql_commands_file_path: Path, connection: sqlalch
         print(f'error running sql command: {e}')
         print('rolling back the transaction')
         connection.rollback()
+        raise
+    return None
+
+def get_max_allowed_packet(connection: sqlalchemy.Connection) -> int:
+    """
+    This function reads the `max_allowed_packet` server variable, which caps the size of a single SQL statement.
+    
+    ## Parameters:
+    - connection: sqlalchemy.Connection
+        The connection to the MySQL database.
+        
+    ## Returns:
+    - int
+        The max allowed packet size in bytes (`DEFAULT_MAX_ALLOWED_PACKET` if it can't be read, e.g. on a non MySQL database).
+    """
+    if connection.dialect.name != 'mysql':
+        return DEFAULT_MAX_ALLOWED_PACKET
+    return int(connection.execute(sqlalchemy.text('SELECT @@max_allowed_packet')).scalar())
+
+
+def estimate_chunksize_for_max_allowed_packet(dframe: pd.DataFrame,
+                                              max_allowed_packet: int,
+                                              packet_fill_ratio: float=0.5,
+                                              sample_size: int=1_000) -> int:
+    """
+    This function estimates how many rows of a dataframe fit in a single multi-row INSERT statement,
+    based on the average size of a (text serialized) row in a sample of the dataframe.
+    
+    ## Parameters:
+    - dframe: pd.DataFrame
+        The dataframe that will be uploaded.
+    - max_allowed_packet: int
+        The max allowed packet size of the MySQL server in bytes.
+    - packet_fill_ratio: float, default=0.5
+        The fraction of the packet to fill, leaving room for the statement overhead and escaping.
+    - sample_size: int, default=1_000
+        The number of rows used to estimate the average row size.
+        
+    ## Returns:
+    - int
+        The number of rows to insert per statement.
+    """
+    if dframe.empty:
+        return 1
+    sample_csv = dframe.head(sample_size).to_csv(index=False, header=False)
+    avg_row_bytes = len(sample_csv.encode('utf-8')) / min(len(dframe), sample_size)
+    # each value in an INSERT statement is separated by a comma, and strings are quoted
+    avg_row_bytes += 4 * len(dframe.columns)
+    return max(1, int(max_allowed_packet * packet_fill_ratio / avg_row_bytes))
+
+
+def prepare_dataframe_for_upload(dframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    This function prepares a dataframe for the `bulk` and `executemany` upload strategies:
+    columns that are completely empty are dropped, boolean columns are converted to integers (as they're `tinyint` in the database),
+    and float columns that only hold whole numbers (integer columns with missing values) are converted to nullable integers.
+    
+    ## Parameters:
+    - dframe: pd.DataFrame
+        The dataframe to prepare.
+        
+    ## Returns:
+    - pd.DataFrame
+        The prepared dataframe.
+    """
+    dframe = dframe.dropna(axis=1, how='all')
+    for col in dframe.select_dtypes(include=['bool']).columns:
+        dframe[col] = dframe[col].astype('int8')
+    for col in dframe.select_dtypes(include=['float']).columns:
+        non_null_values = dframe[col].dropna()
+        if (non_null_values == non_null_values.round()).all():
+            dframe[col] = dframe[col].astype('Int64')
+    return dframe
+
+
+def dataframe_to_sql_rows(dframe: pd.DataFrame) -> List[dict]:
+    """
+    This function converts a dataframe to a list of rows (dictionaries of python objects), with missing values as `None`.
+    
+    ## Parameters:
+    - dframe: pd.DataFrame
+        The dataframe to convert.
+        
+    ## Returns:
+    - List[dict]
+        One dictionary per row, mapping the column names to the values.
+    """
+    columns_values = {}
+    for col in dframe.columns:
+        if pd.api.types.is_datetime64_any_dtype(dframe[col]):
+            values = pd.Series(dframe[col].dt.to_pydatetime(), index=dframe.index, dtype=object)
+        else:
+            values = dframe[col].astype(object)
+        columns_values[col] = values.where(dframe[col].notna(), None).tolist()
+    return [dict(zip(columns_values.keys(), row)) for row in zip(*columns_values.values())]
+
+
+def upload_dataframe_with_to_sql(dframe: pd.DataFrame,
+                                 sql_table_name: str,
+                                 connection: sqlalchemy.Connection,
+                                 chunksize: int) -> None:
+    """
+    The `to_sql` upload strategy, it uses pandas' `DataFrame.to_sql` (SQLAlchemy's generic insert path).
+    """
+    dframe = dframe.dropna(axis=1, how='all')
+    dframe.to_sql(name=sql_table_name,
+                  con=connection,
+                  if_exists='append',
+                  index=False,
+                  chunksize=chunksize)
+    return None
+
+
+def upload_dataframe_with_executemany(dframe: pd.DataFrame,
+                                      sql_table_name: str,
+                                      connection: sqlalchemy.Connection,
+                                      chunksize: int) -> None:
+    """
+    The `executemany` upload strategy, it sends the rows in chunks with a single parameterized INSERT statement per chunk,
+    which the MySQL driver rewrites into a multi-row `INSERT ... VALUES (...), (...)` statement.
+    """
+    dframe = prepare_dataframe_for_upload(dframe)
+    if dframe.empty:
+        return None
+    cols = dframe.columns.tolist()
+    sql_command = (f'INSERT INTO `{sql_table_name}` ({", ".join(f"`{col}`" for col in cols)}) '
+                   f'VALUES ({", ".join(f":{col}" for col in cols)})')
+    sql_command = sqlalchemy.text(sql_command)
+    for chunk_start in range(0, len(dframe), chunksize):
+        chunk_rows = dataframe_to_sql_rows(dframe.iloc[chunk_start:chunk_start + chunksize])
+        connection.execute(sql_command, chunk_rows)
+    return None
+
+
+def upload_dataframe_with_load_data_infile(dframe: pd.DataFrame,
+                                           sql_table_name: str,
+                                           connection: sqlalchemy.Connection,
+                                           chunksize: int) -> None:
+    """
+    The `bulk` upload strategy, it writes the dataframe to a temporary tab separated file,
+    and loads it with a single `LOAD DATA LOCAL INFILE` statement, which is the fastest way to load rows into MySQL.
+    The connection has to be created with `local_infile=True`.
+    """
+    dframe = prepare_dataframe_for_upload(dframe)
+    if dframe.empty:
+        return None
+    # escaping the characters that have a special meaning in the file (MySQL's default escape character is the backslash)
+    for col in dframe.select_dtypes(include=['object']).columns:
+        dframe[col] = (dframe[col].str.replace('\\', '\\\\', regex=False)
+                                  .str.replace('\t', '\\t', regex=False)
+                                  .str.replace('\n', '\\n', regex=False)
+                                  .str.replace('\r', '\\r', regex=False))
+    cols = dframe.columns.tolist()
+    with NamedTemporaryFile(mode='w', suffix='.tsv', encoding='utf-8', newline='', delete=False) as tsv_file:
+        dframe.to_csv(tsv_file,
+                      sep='\t',
+                      header=False,
+                      index=False,
+                      na_rep='\\N',
+                      quoting=csv.QUOTE_NONE,
+                      quotechar=None,
+                      lineterminator='\n',
+                      date_format='%Y-%m-%d %H:%M:%S',
+                      chunksize=chunksize)
+    load_tsv_file_into_sql_table(Path(tsv_file.name), sql_table_name, cols, connection)
+    return None
+
+
+def load_tsv_file_into_sql_table(tsv_file_path: Path,
+                                 sql_table_name: str,
+                                 cols: List[str],
+                                 connection: sqlalchemy.Connection) -> None:
+    """
+    Loads a (temporary) tab separated file into a table with `LOAD DATA LOCAL INFILE`, and deletes the file.
+    The values in the file should be escaped with backslashes, with `\\N` for the missing values.
+    """
+    try:
+        sql_command = (f"LOAD DATA LOCAL INFILE '{tsv_file_path.as_posix()}' INTO TABLE `{sql_table_name}` "
+                       "CHARACTER SET utf8mb4 "
+                       "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+                       "LINES TERMINATED BY '\\n' "
+                       f'({", ".join(f"`{col}`" for col in cols)})')
+        connection.exec_driver_sql(sql_command)
+    finally:
+        tsv_file_path.unlink()
     return None
 
+
+def sort_table_by_columns(dframe: pd.DataFrame, sort_columns: List[str]=None) -> pd.DataFrame:
+    """
+    This function sorts the rows of a dataframe (or a `pyarrow.Table`) by some columns, e.g. by the primary key of its table,
+    so InnoDB appends the rows to its clustered index in order instead of splitting its pages.
+    The dataframe is returned as is when there are no sort columns, or when it doesn't have all of them.
+    
+    ## Parameters:
+    - dframe: pd.DataFrame
+        The dataframe (or `pyarrow.Table`) to sort.
+    - sort_columns: List[str], default=None
+        The columns to sort by.
+        
+    ## Returns:
+    - pd.DataFrame
+        The sorted dataframe.
+    """
+    if not(sort_columns):
+        return dframe
+    if pa is not None and isinstance(dframe, pa.Table):
+        if not(set(sort_columns).issubset(dframe.column_names)):
+            return dframe
+        return dframe.sort_by([(col, 'ascending') for col in sort_columns])
+    if not(set(sort_columns).issubset(dframe.columns)):
+        return dframe
+    return dframe.sort_values(sort_columns, ignore_index=True, kind='stable')
+
+
+def prepare_arrow_table_for_upload(table: 'pa.Table') -> 'pa.Table':
+    """
+    The arrow counterpart of `prepare_dataframe_for_upload`: columns that are completely empty are dropped,
+    and boolean columns are converted to integers (as they're `tinyint` in the database).
+    """
+    empty_cols = [col for col in table.column_names if table[col].null_count == table.num_rows]
+    table = table.drop(empty_cols)
+    for col_index, col in enumerate(table.column_names):
+        if pa.types.is_boolean(table[col].type):
+            table = table.set_column(col_index, col, pc.cast(table[col], pa.int8()))
+    return table
+
+
+def upload_arrow_table_with_to_sql(table: 'pa.Table',
+                                   sql_table_name: str,
+                                   connection: sqlalchemy.Connection,
+                                   chunksize: int) -> None:
+    """
+    The `to_sql` upload strategy for arrow tables, it converts the table to a dataframe and uses `upload_dataframe_with_to_sql`.
+    """
+    return upload_dataframe_with_to_sql(table.to_pandas(), sql_table_name, connection, chunksize)
+
+
+def upload_arrow_table_with_executemany(table: 'pa.Table',
+                                        sql_table_name: str,
+                                        connection: sqlalchemy.Connection,
+                                        chunksize: int) -> None:
+    """
+    The `executemany` upload strategy for arrow tables, the rows of each chunk are converted straight from the arrow columns
+    to the parameters of the statement (without going through a dataframe).
+    """
+    table = prepare_arrow_table_for_upload(table)
+    if table.num_rows == 0 or table.num_columns == 0:
+        return None
+    cols = table.column_names
+    sql_command = (f'INSERT INTO `{sql_table_name}` ({", ".join(f"`{col}`" for col in cols)}) '
+                   f'VALUES ({", ".join(f":{col}" for col in cols)})')
+    sql_command = sqlalchemy.text(sql_command)
+    for chunk_start in range(0, table.num_rows, chunksize):
+        connection.execute(sql_command, table.slice(chunk_start, chunksize).to_pylist())
+    return None
+
+
+def upload_arrow_table_with_load_data_infile(table: 'pa.Table',
+                                             sql_table_name: str,
+                                             connection: sqlalchemy.Connection,
+                                             chunksize: int) -> None:
+    """
+    The `bulk` upload strategy for arrow tables, it writes the same tab separated file as `upload_dataframe_with_load_data_infile`,
+    but the lines of the file are built with arrow compute functions, so the values are never converted to python objects.
+    """
+    table = prepare_arrow_table_for_upload(table)
+    if table.num_rows == 0 or table.num_columns == 0:
+        return None
+    cols = table.column_names
+    with NamedTemporaryFile(mode='wb', suffix='.tsv', delete=False) as tsv_file:
+        for chunk_start in range(0, table.num_rows, chunksize):
+            chunk = table.slice(chunk_start, chunksize)
+            cols_values = []
+            for col in cols:
+                # timestamps are formatted as `YYYY-MM-DD HH:MM:SS` and dates as `YYYY-MM-DD`, as expected by MySQL
+                values = pc.cast(chunk[col].combine_chunks() if pa.types.is_dictionary(chunk[col].type) else chunk[col], pa.string())
+                # escaping the characters that have a special meaning in the file (MySQL's default escape character is the backslash)
+                for special_char, escaped_char in [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]:
+                    values = pc.replace_substring(values, special_char, escaped_char)
+                cols_values.append(pc.fill_null(values, '\\N'))
+            # joining each line with an empty string adds the line terminator, so the lines can be written as a single buffer
+            lines = pc.binary_join_element_wise(pc.binary_join_element_wise(*cols_values, '\t'), '', '\n')
+            for lines_chunk in (lines.chunks if isinstance(lines, pa.ChunkedArray) else [lines]):
+                _, offsets_buffer, data_buffer = lines_chunk.buffers()
+                offsets = memoryview(offsets_buffer).cast('i')
+                lines_start, lines_end = offsets[lines_chunk.offset], offsets[lines_chunk.offset + len(lines_chunk)]
+                tsv_file.write(data_buffer.slice(lines_start, lines_end - lines_start))
+    load_tsv_file_into_sql_table(Path(tsv_file.name), sql_table_name, cols, connection)
+    return None
+
+
+# the available upload strategies, (strategy name -> upload function)
+UPLOAD_STRATEGIES = {'to_sql': upload_dataframe_with_to_sql,
+                     'executemany': upload_dataframe_with_executemany,
+                     'bulk': upload_dataframe_with_load_data_infile}
+
+# the upload strategies of the arrow tables, with the same names as `UPLOAD_STRATEGIES`
+ARROW_UPLOAD_STRATEGIES = {'to_sql': upload_arrow_table_with_to_sql,
+                           'executemany': upload_arrow_table_with_executemany,
+                           'bulk': upload_arrow_table_with_load_data_infile}
+
+
+def upload_dataframe_to_sql_table(dframe: pd.DataFrame,
+                                  sql_table_name: str,
+                                  connection: sqlalchemy.Connection,
+                                  chunksize: int=None,
+                                  strategy: str='to_sql') -> int:
+    """
+    This function appends the rows of a dataframe to a table in the MySQL database, using one of the upload strategies,
+    and prints the upload throughput (rows/sec) of the table.
+    Columns that are completely empty are not uploaded, so they fall back to the column default in the table.
+    
+    ## Parameters:
+    - dframe: pd.DataFrame
+        The dataframe to upload, its columns should match the columns of the table.
+        (it can also be a `pyarrow.Table`, e.g. from the arrow transform backend, which is uploaded with `ARROW_UPLOAD_STRATEGIES`)
+    - sql_table_name: str
+        The name of the table in the MySQL database.
+    - connection: sqlalchemy.Connection
+        The connection to the MySQL database.
+    - chunksize: int, default=None
+        The number of rows to insert per statement (or per write to the temporary file for the `bulk` strategy),
+        by default it's estimated from the server's `max_allowed_packet`.
+    - strategy: str, default='to_sql'
+        The upload strategy, one of:
+        - `to_sql` -> pandas' `DataFrame.to_sql`
+        - `executemany` -> multi-row INSERT statements
+        - `bulk` -> `LOAD DATA LOCAL INFILE` from a temporary file
+        
+    ## Returns:
+    - int
+        The number of uploaded rows.
+    """
+    if strategy not in UPLOAD_STRATEGIES:
+        raise ValueError(f'unknown upload strategy {strategy}, should be one of {list(UPLOAD_STRATEGIES.keys())}')
+    is_arrow_table = pa is not None and isinstance(dframe, pa.Table)
+    if chunksize is None:
+        # the chunksize is estimated from a sample of the rows, which is small enough to convert to a dataframe
+        sample_dframe = dframe.slice(0, 1_000).to_pandas() if is_arrow_table else dframe
+        chunksize = estimate_chunksize_for_max_allowed_packet(sample_dframe, get_max_allowed_packet(connection))
+    upload_strategies = ARROW_UPLOAD_STRATEGIES if is_arrow_table else UPLOAD_STRATEGIES
+    with measure_stage('load', table=sql_table_name, strategy=strategy) as stage_metrics:
+        upload_strategies[strategy](dframe, sql_table_name, connection, chunksize)
+        stage_metrics['rows'] = len(dframe)
+    # the throughput is printed from the metrics of the load stage (set once the stage is done)
+    rows_per_sec = stage_metrics['rows_per_sec'] if stage_metrics['rows_per_sec'] is not None else float('inf')
+    print(f"uploaded {stage_metrics['rows']} rows to {sql_table_name} in {stage_metrics['wall_seconds']:.2f} seconds "
+          f"({rows_per_sec:,.0f} rows/sec) using the {strategy} strategy")
+    return stage_metrics['rows']
+
+
+def upsert_dataframe_to_sql_table(dframe: pd.DataFrame,
+                                  sql_table_name: str,
+                                  connection: sqlalchemy.Connection,
+                                  key_columns: List[str],
+                                  chunksize: int=None) -> int:
+    """
+    This function inserts the rows of a dataframe into a table in the MySQL database,
+    and updates the existing rows that have the same primary (or unique) key instead, using `INSERT ... ON DUPLICATE KEY UPDATE`.
+    
+    ## Parameters:
+    - dframe: pd.DataFrame
+        The dataframe to upsert, its columns should match the columns of the table.
+    - sql_table_name: str
+        The name of the table in the MySQL database.
+    - connection: sqlalchemy.Connection
+        The connection to the MySQL database.
+    - key_columns: List[str]
+        The columns of the primary (or unique) key of the table, these are not updated.
+    - chunksize: int, default=None
+        The number of rows to upsert per statement, by default it's estimated from the server's `max_allowed_packet`.
+        
+    ## Returns:
+    - int
+        The number of upserted rows.
+    """
+    dframe = prepare_dataframe_for_upload(dframe)
+    if dframe.empty:
+        return 0
+    if chunksize is None:
+        chunksize = estimate_chunksize_for_max_allowed_packet(dframe, get_max_allowed_packet(connection))
+    cols = dframe.columns.tolist()
+    cols_to_update = [col for col in cols if col not in key_columns] or key_columns
+    sql_command = (f'INSERT INTO `{sql_table_name}` ({", ".join(f"`{col}`" for col in cols)}) '
+                   f'VALUES ({", ".join(f":{col}" for col in cols)}) '
+                   f'ON DUPLICATE KEY UPDATE {", ".join(f"`{col}` = VALUES(`{col}`)" for col in cols_to_update)}')
+    sql_command = sqlalchemy.text(sql_command)
+    with measure_stage('load', table=sql_table_name, strategy='upsert') as stage_metrics:
+        for chunk_start in range(0, len(dframe), chunksize):
+            chunk_rows = dataframe_to_sql_rows(dframe.iloc[chunk_start:chunk_start + chunksize])
+            connection.execute(sql_command, chunk_rows)
+        stage_metrics['rows'] = len(dframe)
+    print(f'upserted {len(dframe)} rows to {sql_table_name}')
+    return len(dframe)
+
+
+def replace_dataframe_rows_in_sql_table(dframe: pd.DataFrame,
+                                        sql_table_name: str,
+                                        connection: sqlalchemy.Connection,
+                                        key_column: str,
+                                        chunksize: int=None,
+                                        strategy: str='executemany') -> int:
+    """
+    This function replaces the rows of a table (that has no primary key) which share a key value with the rows of a dataframe,
+    by deleting all the rows with the key values in the dataframe, and then inserting the rows of the dataframe.
+    e.g. replacing all the rows of `team_managers_matches` of the matches in the dataframe.
+    
+    ## Parameters:
+    - dframe: pd.DataFrame
+        The dataframe with the new rows, its columns should match the columns of the table.
+    - sql_table_name: str
+        The name of the table in the MySQL database.
+    - connection: sqlalchemy.Connection
+        The connection to the MySQL database.
+    - key_column: str
+        The column whose values select the rows to replace.
+    - chunksize: int, default=None
+        Passed to `upload_dataframe_to_sql_table`.
+    - strategy: str, default='executemany'
+        Passed to `upload_dataframe_to_sql_table`.
+        
+    ## Returns:
+    - int
+        The number of inserted rows.
+    """
+    key_values = [value.item() if hasattr(value, 'item') else value for value in dframe[key_column].dropna().unique()]
+    if key_values:
+        sql_command = sqlalchemy.text(f'DELETE FROM `{sql_table_name}` WHERE `{key_column}` IN :key_values')
+        sql_command = sql_command.bindparams(sqlalchemy.bindparam('key_values', expanding=True))
+        connection.execute(sql_command, {'key_values': key_values})
+    return upload_dataframe_to_sql_table(dframe, sql_table_name, connection, chunksize=chunksize, strategy=strategy)
+
+
 if __name__ == '__main__':
     with create_sql_db_connection() as connection:
         sql_commands_file_path = Path().cwd() / 'database_schema_creation_commands.sql'
@@ -0,0 +1,204 @@
+import re
+import sqlalchemy
+
+from time import perf_counter
+from tabulate import tabulate
+from typing import Dict, List, Set, Tuple
+
+from mysql_load_scheduler import sort_tables_by_dependencies
+from pipeline_metrics import measure_stage
+from pipeline_metrics import METRICS_LOCK
+from pipeline_metrics import RECORDED_STAGES_METRICS
+
+# NOTE: the deferred indexes load creates the tables with their primary keys only (InnoDB stores the rows in the primary key,
+# so it can't be deferred, but the rows are sorted by it before they're inserted, so they're appended in order),
+# loads the rows with the unique and foreign key checks disabled, and only then builds the secondary (unique) indexes
+# and the foreign keys of each table, in a single `ALTER TABLE` per table, instead of maintaining them row by row during the load.
+# the checks are enabled again before building them, so the `ALTER TABLE` commands still validate the loaded rows,
+# e.g. a duplicate country name, or a match referencing a missing stadium, fails the load just like it does without this mode.
+
+# the session variables set on every connection of the load (see `create_sql_db_engine`)
+# (`bulk_insert_buffer_size` only speeds up the MyISAM tables, InnoDB tables ignore it)
+FAST_LOAD_SESSION_VARIABLES = {'unique_checks': 0,
+                               'foreign_key_checks': 0,
+                               'bulk_insert_buffer_size': 256 * 1024 * 1024}
+
+# the session variables that are restored before building the indexes and foreign keys, so they validate the loaded rows
+CHECKS_SESSION_VARIABLES = {'unique_checks': 1,
+                            'foreign_key_checks': 1}
+
+CREATE_TABLE_COMMAND_PATTERN = re.compile(r'^\s*CREATE\s+TABLE\s+`?(\w+)`?\s*\((.*)\)\s*$', flags=re.IGNORECASE | re.DOTALL)
+
+# a column definition inside a CREATE TABLE command, e.g. `country_name` varchar(255) UNIQUE NOT NULL
+COLUMN_DEFINITION_PATTERN = re.compile(r'^`?(\w+)`?\s+(.*)$', flags=re.DOTALL)
+
+# a table level index inside a CREATE TABLE command, e.g. PRIMARY KEY (`match_id`, `team_id`) or UNIQUE KEY `name` (`col`)
+TABLE_INDEX_DEFINITION_PATTERN = re.compile(r'^(PRIMARY\s+KEY|UNIQUE|INDEX|KEY)\b.*?\((.*)\)$', flags=re.IGNORECASE | re.DOTALL)
+
+# the foreign key commands in sql_files/database_foreign_keys.sql, the clause after the table name is kept
+FOREIGN_KEY_CLAUSE_PATTERN = re.compile(r'ALTER\s+TABLE\s+`?(\w+)`?\s+(ADD\s+FOREIGN\s+KEY\s*\(.*?\)\s*REFERENCES\s+`?\w+`?\s*\(.*?\))',
+                                        flags=re.IGNORECASE | re.DOTALL)
+
+
+def parse_index_columns(index_columns: str) -> List[str]:
+    """
+    Parses the columns of an index definition, e.g. "`match_id`, `team_id`" -> ['match_id', 'team_id'].
+    """
+    return [col.strip().strip('`') for col in index_columns.split(',')]
+
+
+def defer_secondary_indexes_of_create_table_command(sql_command: str) -> Tuple[str, str, List[str], List[str]]:
+    """
+    This function removes the secondary indexes (the unique columns, and the table level unique keys and indexes)
+    from a CREATE TABLE command, and returns them as `ALTER TABLE` clauses, to be added once the table is loaded.
+    Each column (or index) definition is expected to be on its own line, as in the schema creation commands.
+
+    ## Parameters:
+    - sql_command: str
+        The CREATE TABLE command.
+
+    ## Returns:
+    - Tuple[str, str, List[str], List[str]]
+        The name of the table, the CREATE TABLE command without the secondary indexes,
+        the `ALTER TABLE` clauses of the secondary indexes (e.g. "ADD UNIQUE (`country_name`)"), and the primary key columns.
+    """
+    table_name, table_definitions = CREATE_TABLE_COMMAND_PATTERN.match(sql_command).groups()
+    kept_definitions = []
+    index_clauses = []
+    primary_key_columns = []
+    for definition in table_definitions.splitlines():
+        definition = definition.strip().rstrip(',').strip()
+        if not(definition):
+            continue
+        table_index_match = TABLE_INDEX_DEFINITION_PATTERN.match(definition)
+        if table_index_match is not None:
+            if table_index_match.group(1).upper().startswith('PRIMARY'):
+                primary_key_columns.extend(parse_index_columns(table_index_match.group(2)))
+                kept_definitions.append(definition)
+            else:
+                index_clauses.append(f'ADD {definition}')
+            continue
+        column_name = COLUMN_DEFINITION_PATTERN.match(definition).group(1)
+        if re.search(r'\bPRIMARY\s+KEY\b', definition, flags=re.IGNORECASE):
+            primary_key_columns.append(column_name)
+        elif re.search(r'\bUNIQUE(\s+KEY)?\b', definition, flags=re.IGNORECASE):
+            definition = re.sub(r'\s+UNIQUE(\s+KEY)?\b', '', definition, flags=re.IGNORECASE)
+            index_clauses.append(f'ADD UNIQUE (`{column_name}`)')
+        kept_definitions.append(definition)
+    create_table_command = f'CREATE TABLE `{table_name}` (\n  ' + ',\n  '.join(kept_definitions) + '\n)'
+    return table_name, create_table_command, index_clauses, primary_key_columns
+
+
+def defer_secondary_indexes_of_schema_commands(sql_commands: List[str]) -> Tuple[List[str], Dict[str, List[str]], Dict[str, List[str]]]:
+    """
+    This function removes the secondary indexes from the CREATE TABLE commands of the schema creation commands
+    (see `defer_secondary_indexes_of_create_table_command`), the rest of the commands are kept as is.
+
+    ## Parameters:
+    - sql_commands: List[str]
+        The schema creation commands (as returned by `read_sql_commands_from_file`).
+
+    ## Returns:
+    - Tuple[List[str], Dict[str, List[str]], Dict[str, List[str]]]
+        The schema creation commands without the secondary indexes,
+        a dictionary mapping each table to the `ALTER TABLE` clauses of its secondary indexes,
+        and a dictionary mapping each table to its primary key columns.
+    """
+    deferred_sql_commands = []
+    tables_index_clauses = {}
+    tables_primary_keys = {}
+    for sql_command in sql_commands:
+        # the comments before a command are part of it, as the commands are only split on `;`
+        create_table_command = re.sub(r'/\*.*?\*/', '', re.sub(r'(?m)^\s*--.*$', '', sql_command), flags=re.DOTALL)
+        if not(CREATE_TABLE_COMMAND_PATTERN.match(create_table_command)):
+            deferred_sql_commands.append(sql_command)
+            continue
+        table_name, create_table_command, index_clauses, primary_key_columns = defer_secondary_indexes_of_create_table_command(create_table_command)
+        deferred_sql_commands.append(create_table_command)
+        if index_clauses:
+            tables_index_clauses[table_name] = index_clauses
+        if primary_key_columns:
+            tables_primary_keys[table_name] = primary_key_columns
+    return deferred_sql_commands, tables_index_clauses, tables_primary_keys
+
+
+def parse_foreign_keys_clauses(sql_commands: List[str]) -> Dict[str, List[str]]:
+    """
+    This function parses the foreign key commands, as `ALTER TABLE` clauses per table (e.g. "ADD FOREIGN KEY (`stadium_id`) REFERENCES ...").
+
+    ## Parameters:
+    - sql_commands: List[str]
+        The `ALTER TABLE ... ADD FOREIGN KEY ... REFERENCES ...` commands (as returned by `read_sql_commands_from_file`).
+
+    ## Returns:
+    - Dict[str, List[str]]
+        A dictionary mapping each table with foreign keys to the clauses of its foreign keys.
+    """
+    tables_foreign_keys_clauses = {}
+    for sql_command in sql_commands:
+        for table_name, foreign_key_clause in FOREIGN_KEY_CLAUSE_PATTERN.findall(sql_command):
+            tables_foreign_keys_clauses.setdefault(table_name, []).append(' '.join(foreign_key_clause.split()))
+    return tables_foreign_keys_clauses
+
+
+def sum_tables_load_seconds() -> Dict[str, float]:
+    """
+    Sums the time spent uploading each table so far, from the `load` stages recorded by `upload_dataframe_to_sql_table`.
+    """
+    tables_load_seconds = {}
+    with METRICS_LOCK:
+        for stage_metrics in RECORDED_STAGES_METRICS:
+            if stage_metrics['stage'] == 'load':
+                tables_load_seconds[stage_metrics['table']] = tables_load_seconds.get(stage_metrics['table'], 0.0) + stage_metrics['wall_seconds']
+    return tables_load_seconds
+
+
+def build_deferred_indexes_and_foreign_keys(connection: sqlalchemy.Connection,
+                                            tables_index_clauses: Dict[str, List[str]],
+                                            tables_foreign_keys_clauses: Dict[str, List[str]],
+                                            dependencies: Dict[str, Set[str]]) -> List[dict]:
+    """
+    This function builds the secondary indexes and the foreign keys of each table once it's loaded, with a single `ALTER TABLE` per table
+    (MySQL rebuilds (or scans) the table once for all of them), in the order of the foreign keys dependencies,
+    so the indexes a foreign key references exist before it's created. The unique and foreign key checks are enabled first.
+    The load time of each table (without the indexes) is printed next to the time it took to build its indexes and foreign keys,
+    to compare with the load time of the same table when the indexes exist during the load.
+
+    ## Parameters:
+    - connection: sqlalchemy.Connection
+        The connection to the MySQL database.
+    - tables_index_clauses: Dict[str, List[str]]
+        A dictionary mapping each table to the clauses of its secondary indexes (as returned by `defer_secondary_indexes_of_schema_commands`).
+    - tables_foreign_keys_clauses: Dict[str, List[str]]
+        A dictionary mapping each table to the clauses of its foreign keys (as returned by `parse_foreign_keys_clauses`).
+    - dependencies: Dict[str, Set[str]]
+        A dictionary mapping each table to the set of tables it references (as returned by `parse_foreign_keys_dependencies`).
+
+    ## Returns:
+    - List[dict]
+        The load time, the number of indexes and foreign keys, and the time it took to build them, of each table.
+    """
+    connection.execute(sqlalchemy.text('SET SESSION ' + ', '.join(f'{name} = {value}' for name, value in CHECKS_SESSION_VARIABLES.items())))
+    tables_load_seconds = sum_tables_load_seconds()
+    tables_names = sort_tables_by_dependencies(sorted(set(tables_load_seconds) | set(tables_index_clauses) | set(tables_foreign_keys_clauses)),
+                                               dependencies)
+    tables_timings = []
+    for table_name in tables_names:
+        clauses = tables_index_clauses.get(table_name, []) + tables_foreign_keys_clauses.get(table_name, [])
+        build_seconds = 0.0
+        if clauses:
+            print(f'building {len(clauses)} indexes and foreign keys of table {table_name}')
+            start_time = perf_counter()
+            with measure_stage('build_indexes', table=table_name):
+                connection.execute(sqlalchemy.text(f'ALTER TABLE `{table_name}` ' + ', '.join(clauses)))
+            build_seconds = perf_counter() - start_time
+        load_seconds = tables_load_seconds.get(table_name, 0.0)
+        tables_timings.append({'table': table_name,
+                               'load seconds': round(load_seconds, 3),
+                               'indexes': len(tables_index_clauses.get(table_name, [])),
+                               'foreign keys': len(tables_foreign_keys_clauses.get(table_name, [])),
+                               'build seconds': round(build_seconds, 3),
+                               'total seconds': round(load_seconds + build_seconds, 3)})
+    connection.commit()
+    print(tabulate(tables_timings, headers='keys', tablefmt='psql'))
+    return tables_timings
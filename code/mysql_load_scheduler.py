@@ -0,0 +1,146 @@
+import re
+import pandas as pd
+import sqlalchemy
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from tabulate import tabulate
+from time import perf_counter
+from typing import Dict, List, Set
+
+from mysql_db_funcs import upload_dataframe_to_sql_table
+
+# matches the foreign key commands in sql_files/database_foreign_keys.sql, e.g.
+# ALTER TABLE `matches` ADD FOREIGN KEY (`stadium_id`) REFERENCES `stadiums` (`stadium_id`);
+FOREIGN_KEY_COMMAND_PATTERN = re.compile(r'ALTER\s+TABLE\s+`?(\w+)`?\s+ADD\s+FOREIGN\s+KEY\s*\(.*?\)\s*REFERENCES\s+`?(\w+)`?',
+                                         flags=re.IGNORECASE)
+
+def parse_foreign_keys_dependencies(sql_foreign_keys_file_path: Path) -> Dict[str, Set[str]]:
+    """
+    This function parses the foreign key commands in a SQL file into a dependency graph between the tables.
+
+    ## Parameters:
+    - sql_foreign_keys_file_path: Path
+        The path to the file containing the `ALTER TABLE ... ADD FOREIGN KEY ... REFERENCES ...` commands.
+
+    ## Returns:
+    - Dict[str, Set[str]]
+        A dictionary mapping each table with foreign keys to the set of tables it references.
+    """
+    with open(sql_foreign_keys_file_path, 'r') as sql_commands_file:
+        sql_commands = sql_commands_file.read()
+    return parse_foreign_keys_dependencies_of_sql_commands([sql_commands])
+
+
+def parse_foreign_keys_dependencies_of_sql_commands(sql_commands: List[str]) -> Dict[str, Set[str]]:
+    """
+    The same as `parse_foreign_keys_dependencies`, for foreign key commands that were already read (e.g. renamed to the staging tables).
+    """
+    dependencies = {}
+    for table_name, referenced_table_name in FOREIGN_KEY_COMMAND_PATTERN.findall(';'.join(sql_commands)):
+        if table_name != referenced_table_name:
+            dependencies.setdefault(table_name, set()).add(referenced_table_name)
+    return dependencies
+
+
+def sort_tables_by_dependencies(table_names: List[str], dependencies: Dict[str, Set[str]]) -> List[str]:
+    """
+    This function sorts tables so each table comes after the tables it references (a topological sort),
+    tables that don't depend on each other keep their original order.
+
+    ## Parameters:
+    - table_names: List[str]
+        The names of the tables to sort.
+    - dependencies: Dict[str, Set[str]]
+        A dictionary mapping each table to the set of tables it references (as returned by `parse_foreign_keys_dependencies`).
+
+    ## Returns:
+    - List[str]
+        The sorted table names.
+    """
+    pending_tables = {table_name: dependencies.get(table_name, set()) & set(table_names) for table_name in table_names}
+    sorted_tables = []
+    while pending_tables:
+        ready_tables = [table_name for table_name, referenced_tables in pending_tables.items()
+                        if referenced_tables.issubset(sorted_tables)]
+        if not(ready_tables):
+            raise ValueError(f'circular foreign key dependencies between the tables {list(pending_tables.keys())}')
+        for table_name in ready_tables:
+            pending_tables.pop(table_name)
+            sorted_tables.append(table_name)
+    return sorted_tables
+
+
+def upload_tables_concurrently(dframes_dict: Dict[str, pd.DataFrame],
+                               engine: sqlalchemy.Engine,
+                               max_workers: int=4,
+                               dependencies: Dict[str, Set[str]]=None,
+                               chunksize: int=None,
+                               strategy: str='to_sql') -> List[dict]:
+    """
+    This function uploads mutiple dataframes to their tables in the MySQL database concurrently,
+    each table is uploaded (and committed) in its own transaction, over a connection from the engine's pool.
+
+    When `dependencies` is given, a table only starts uploading after all the tables it references have been uploaded,
+    so the tables can be loaded while the foreign key constraints already exist.
+    Referenced tables that are not part of `dframes_dict` are assumed to be loaded already.
+
+    ## Parameters:
+    - dframes_dict: Dict[str, pd.DataFrame]
+        A dictionary mapping the table names in the MySQL database to the dataframes to upload.
+    - engine: sqlalchemy.Engine
+        The engine of the MySQL database, its pool should hold at least `max_workers` connections.
+    - max_workers: int, default=4
+        The number of tables uploaded at the same time.
+    - dependencies: Dict[str, Set[str]], default=None
+        A dictionary mapping each table to the set of tables it references (as returned by `parse_foreign_keys_dependencies`),
+        by default all the tables are independent.
+    - chunksize: int, default=None
+        Passed to `upload_dataframe_to_sql_table`.
+    - strategy: str, default='to_sql'
+        Passed to `upload_dataframe_to_sql_table`.
+
+    ## Returns:
+    - List[dict]
+        The timing of each table upload (table name, rows, start and end offset from the start of the load, and seconds).
+    """
+    if dependencies is None:
+        dependencies = {}
+    pending_tables = {table_name: dependencies.get(table_name, set()) & set(dframes_dict.keys())
+                      for table_name in dframes_dict.keys()}
+    load_start_time = perf_counter()
+
+    def upload_table(table_name: str) -> dict:
+        table_start_time = perf_counter()
+        with engine.begin() as connection:
+            rows_count = upload_dataframe_to_sql_table(dframes_dict[table_name], table_name, connection,
+                                                       chunksize=chunksize, strategy=strategy)
+        table_end_time = perf_counter()
+        return {'table': table_name,
+                'rows': rows_count,
+                'started at': round(table_start_time - load_start_time, 3),
+                'ended at': round(table_end_time - load_start_time, 3),
+                'seconds': round(table_end_time - table_start_time, 3)}
+
+    uploaded_tables = set()
+    tables_timings = []
+    running_futures: Dict[Future, str] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending_tables or running_futures:
+            ready_tables = [table_name for table_name, referenced_tables in pending_tables.items()
+                            if referenced_tables.issubset(uploaded_tables)]
+            for table_name in ready_tables:
+                print(f'uploading table {table_name}')
+                pending_tables.pop(table_name)
+                running_futures[executor.submit(upload_table, table_name)] = table_name
+            if not(running_futures):
+                raise ValueError(f'circular foreign key dependencies between the tables {list(pending_tables.keys())}')
+            done_futures, _ = wait(running_futures.keys(), return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                table_name = running_futures.pop(future)
+                # re-raises the upload error (if any), the remaining uploads are still waited for by the executor
+                tables_timings.append(future.result())
+                uploaded_tables.add(table_name)
+                print(f'done uploading table {table_name}')
+    print(tabulate(tables_timings, headers='keys', tablefmt='psql'))
+    return tables_timings
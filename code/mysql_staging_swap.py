@@ -0,0 +1,95 @@
+import re
+import sqlalchemy
+
+from typing import List
+
+from pipeline_metrics import measure_stage
+
+# NOTE: the shadow load keeps the live tables readable (and unchanged) for the whole reload:
+# the tables are created, loaded, indexed and constrained as `<table>__staging` tables next to the live ones,
+# and are only published at the end, with a single `RENAME TABLE` command that swaps all the live tables with their staging tables
+# (MySQL renames all of them atomically, the readers see either all the previous tables or all the new ones, never a mix).
+# the previous live tables are renamed to `<table>__retired` in the same command, and dropped once it's done,
+# the foreign keys follow the renamed tables, so the published tables reference each other, and not the retired ones.
+# a run that fails before the swap leaves the live tables untouched, its staging tables are dropped by the next run.
+
+STAGING_TABLE_SUFFIX = '__staging'
+
+RETIRED_TABLE_SUFFIX = '__retired'
+
+# the table names in the schema creation and foreign key commands, e.g. CREATE TABLE `matches` or REFERENCES `stadiums`
+# (the column names are backticked too, so only the names after these keywords are renamed)
+TABLE_NAME_REFERENCE_PATTERN = re.compile(r'\b(DROP\s+TABLE\s+IF\s+EXISTS|CREATE\s+TABLE|ALTER\s+TABLE|REFERENCES)\s+`(\w+)`',
+                                          flags=re.IGNORECASE)
+
+
+def get_staging_table_name(table_name: str) -> str:
+    """
+    Returns the name of the staging table of a table, e.g. matches -> matches__staging.
+    """
+    return f'{table_name}{STAGING_TABLE_SUFFIX}'
+
+
+def rename_tables_to_staging_tables(sql_commands: List[str]) -> List[str]:
+    """
+    This function renames the tables in the schema creation (or foreign key) commands to their staging tables,
+    so running them creates (or drops, or alters) the staging tables, and leaves the live tables untouched.
+
+    ## Parameters:
+    - sql_commands: List[str]
+        The SQL commands (as returned by `read_sql_commands_from_file`).
+
+    ## Returns:
+    - List[str]
+        The SQL commands on the staging tables.
+    """
+    return [TABLE_NAME_REFERENCE_PATTERN.sub(lambda match: f'{match.group(1)} `{get_staging_table_name(match.group(2))}`', sql_command)
+            for sql_command in sql_commands]
+
+
+def parse_created_tables_names(sql_commands: List[str]) -> List[str]:
+    """
+    Returns the names of the tables created by the schema creation commands, in the order they're created.
+    """
+    return [match.group(2) for sql_command in sql_commands for match in TABLE_NAME_REFERENCE_PATTERN.finditer(sql_command)
+            if match.group(1).upper().startswith('CREATE')]
+
+
+def swap_staging_tables(connection: sqlalchemy.Connection, tables_names: List[str]) -> None:
+    """
+    This function publishes the loaded staging tables, with a single `RENAME TABLE` command that renames each live table
+    to its retired table, and each staging table to the live table (see the note at the top of the module),
+    and then drops the retired tables. The tables that don't exist yet (e.g. on the first run) are only renamed from their staging tables.
+
+    ## Parameters:
+    - connection: sqlalchemy.Connection
+        The connection to the MySQL database, everything uploaded on it is committed before the swap.
+    - tables_names: List[str]
+        The names of the live tables (without the staging suffix), e.g. the tables of the schema creation commands.
+
+    ## Returns:
+    - None
+    """
+    connection.commit()
+    existing_tables_names = set(sqlalchemy.inspect(connection).get_table_names())
+    missing_staging_tables = [table_name for table_name in tables_names if get_staging_table_name(table_name) not in existing_tables_names]
+    if missing_staging_tables:
+        raise ValueError(f'the staging tables of {missing_staging_tables} are missing, the live tables are left untouched')
+    live_tables_names = [table_name for table_name in tables_names if table_name in existing_tables_names]
+    retired_tables_names = [f'{table_name}{RETIRED_TABLE_SUFFIX}' for table_name in live_tables_names]
+    # the retired tables of a run that failed after the swap (before dropping them) would make the rename fail
+    connection.execute(sqlalchemy.text('SET SESSION foreign_key_checks = 0'))
+    for table_name in retired_tables_names:
+        connection.execute(sqlalchemy.text(f'DROP TABLE IF EXISTS `{table_name}`'))
+    # the live tables are renamed first, so their names (and the names of their foreign keys) are free for the staging tables
+    renames = [f'`{table_name}` TO `{retired_table_name}`' for table_name, retired_table_name in zip(live_tables_names, retired_tables_names)]
+    renames += [f'`{get_staging_table_name(table_name)}` TO `{table_name}`' for table_name in tables_names]
+    print(f'publishing {len(tables_names)} staging tables ({len(live_tables_names)} live tables retired)')
+    with measure_stage('swap_tables', tables=len(tables_names)):
+        connection.execute(sqlalchemy.text('RENAME TABLE ' + ', '.join(renames)))
+    print(f'dropping {len(retired_tables_names)} retired tables')
+    for table_name in retired_tables_names:
+        connection.execute(sqlalchemy.text(f'DROP TABLE IF EXISTS `{table_name}`'))
+    connection.execute(sqlalchemy.text('SET SESSION foreign_key_checks = 1'))
+    connection.commit()
+    return None
@@ -0,0 +1,321 @@
+import cProfile
+import json
+import sys
+import threading
+import tracemalloc
+
+from contextlib import contextmanager
+from pathlib import Path
+from tabulate import tabulate
+from time import perf_counter, thread_time, time
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+# resource is only available on unix, the peak RSS isn't recorded without it
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# pyinstrument is only needed to profile the stages with it, cProfile is used without it
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# NOTE: every stage of the ETL (the extraction of each batch of a collection, each transform function call, each table load)
+# runs in a `measure_stage` block, which records its wall time, CPU time (of the thread running it), the peak RSS of the process,
+# optionally the peak of the python memory traced during the stage, and the number of rows it handled (and rows/sec).
+# the metrics of each stage are written as a json line as soon as the stage is done, or all of them as prometheus text
+# (see `configure_pipeline_metrics`), and any stage can be profiled with cProfile (or pyinstrument).
+
+METRICS_FORMATS = ['jsonl', 'prometheus']
+
+# the configuration of the metrics, set by `configure_pipeline_metrics`
+METRICS_CONFIG = {'metrics_file_path': None,
+                  'metrics_format': 'jsonl',
+                  'trace_memory': False,
+                  'profile_stages': [],
+                  'profile_dir': None}
+
+# the metrics of all the stages recorded so far, in the order they were done
+RECORDED_STAGES_METRICS = []
+METRICS_LOCK = threading.Lock()
+
+# the stages currently running in each thread (innermost last), to propagate the traced memory peaks of the inner stages
+RUNNING_STAGES = threading.local()
+
+# only one profiler can be active at a time, so the stages that run inside a profiled stage (or concurrently with it) aren't profiled
+PROFILER_LOCK = threading.Lock()
+
+
+def configure_pipeline_metrics(metrics_file_path:Path=None,
+                               metrics_format:str='jsonl',
+                               trace_memory:bool=False,
+                               profile_stages:List[str]=None,
+                               profile_dir:Path=None) -> None:
+    """
+    Configures how the metrics of the stages are recorded and written, and clears the metrics recorded so far.
+
+    ## Parameters
+    metrics_file_path: Path, default=None
+        The file the metrics are written to, `None` only keeps them in memory (see `summarize_stages_metrics`)
+    metrics_format: str, default='jsonl'
+        - `jsonl` -> a json line per stage, appended as soon as the stage is done
+        - `prometheus` -> the prometheus text exposition format, written by `write_prometheus_metrics_file` at the end of the run
+    trace_memory: bool, default=False
+        Also record the peak of the python memory allocated during each stage (with tracemalloc, which slows the run down),
+        the peaks are only meaningful for the stages that don't run concurrently with other stages
+    profile_stages: List[str], default=None
+        The names of the stages to profile (e.g. `transform`), `*` profiles all of them
+    profile_dir: Path, default=None
+        The directory of the profiles (default is `profiles` in the current directory), a file per profiled stage
+    """
+    if metrics_format not in METRICS_FORMATS:
+        raise ValueError(f'unknown metrics format {metrics_format}, should be one of {METRICS_FORMATS}')
+    METRICS_CONFIG.update({'metrics_file_path': metrics_file_path,
+                           'metrics_format': metrics_format,
+                           'trace_memory': trace_memory,
+                           'profile_stages': profile_stages or [],
+                           'profile_dir': profile_dir if profile_dir is not None else Path().cwd() / 'profiles'})
+    with METRICS_LOCK:
+        RECORDED_STAGES_METRICS.clear()
+    if trace_memory and not(tracemalloc.is_tracing()):
+        tracemalloc.start()
+    if metrics_file_path is not None:
+        metrics_file_path.parent.mkdir(parents=True, exist_ok=True)
+        # the metrics of a run replace the ones of the previous run
+        metrics_file_path.write_text('')
+    return None
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Gets the peak resident set size of the process so far (in MB), or None if it can't be read on this platform.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # the peak RSS is in bytes on macOS, and in kilobytes on linux
+    return max_rss / 1024 ** 2 if sys.platform == 'darwin' else max_rss / 1024
+
+
+def is_stage_profiled(stage_name:str) -> bool:
+    return '*' in METRICS_CONFIG['profile_stages'] or stage_name in METRICS_CONFIG['profile_stages']
+
+
+@contextmanager
+def profile_stage(stage_name:str, labels:Dict[str, Any]) -> Iterator[None]:
+    """
+    Profiles the block with pyinstrument if it's installed, or with cProfile, and saves the profile in the profiles directory
+    (named after the stage, its labels and the time it started). The block isn't profiled if another stage is being profiled.
+    """
+    if not(PROFILER_LOCK.acquire(blocking=False)):
+        yield
+        return
+    try:
+        profile_name = '_'.join([stage_name] + [str(label_value) for label_value in labels.values()] + [str(int(time() * 1000))])
+        METRICS_CONFIG['profile_dir'].mkdir(parents=True, exist_ok=True)
+        if pyinstrument is not None:
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                (METRICS_CONFIG['profile_dir'] / f'{profile_name}.html').write_text(profiler.output_html())
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(METRICS_CONFIG['profile_dir'] / f'{profile_name}.prof')
+    finally:
+        PROFILER_LOCK.release()
+
+
+@contextmanager
+def measure_stage(stage_name:str, **labels) -> Iterator[Dict[str, Any]]:
+    """
+    Measures a stage of the ETL, and records its metrics (see the note at the top of the module).
+    The block gets the metrics dictionary of the stage, where it sets the number of rows it handled (`rows`),
+    e.g.:
+        with measure_stage('transform', collection='matches', function='parse_and_process_matches_dict') as stage_metrics:
+            dframes_dict = parse_and_process_matches_dict(matches_dicts)
+            stage_metrics['rows'] = len(matches_dicts)
+
+    ## Parameters
+    stage_name: str
+        The name of the stage, e.g. `extract`, `transform` or `load`
+    **labels
+        What the stage is working on, e.g. `collection='matches'` or `table='matches'`
+
+    ## Yields
+    Dict[str, Any]
+        The metrics of the stage, recorded when the block is done (a stage with `discard` set to True isn't recorded)
+    """
+    stage_metrics = {'stage': stage_name, **labels, 'rows': None}
+    running_stages = RUNNING_STAGES.__dict__.setdefault('stack', [])
+    trace_memory = METRICS_CONFIG['trace_memory'] and tracemalloc.is_tracing()
+    if trace_memory:
+        # the peak of the outer stage so far is kept before resetting the peak for this stage
+        if running_stages:
+            running_stages[-1]['traced_peak'] = max(running_stages[-1]['traced_peak'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    running_stage = {'traced_peak': 0}
+    running_stages.append(running_stage)
+    start_time = perf_counter()
+    start_cpu_time = thread_time()
+    try:
+        if is_stage_profiled(stage_name):
+            with profile_stage(stage_name, labels):
+                yield stage_metrics
+        else:
+            yield stage_metrics
+    finally:
+        wall_seconds = perf_counter() - start_time
+        cpu_seconds = thread_time() - start_cpu_time
+        running_stages.pop()
+        if trace_memory:
+            traced_peak = max(running_stage['traced_peak'], tracemalloc.get_traced_memory()[1])
+            if running_stages:
+                running_stages[-1]['traced_peak'] = max(running_stages[-1]['traced_peak'], traced_peak)
+            stage_metrics['traced_peak_mb'] = round(traced_peak / 1024 ** 2, 3)
+        stage_metrics['wall_seconds'] = round(wall_seconds, 6)
+        stage_metrics['cpu_seconds'] = round(cpu_seconds, 6)
+        stage_metrics['peak_rss_mb'] = get_peak_rss_mb()
+        if stage_metrics['rows'] is not None:
+            stage_metrics['rows_per_sec'] = round(stage_metrics['rows'] / wall_seconds, 1) if wall_seconds > 0 else None
+        if not(stage_metrics.pop('discard', False)):
+            record_stage_metrics(stage_metrics)
+
+
+def record_stage_metrics(stage_metrics:Dict[str, Any]) -> None:
+    """
+    Records the metrics of a stage, and appends them to the metrics file (for the `jsonl` format).
+    """
+    with METRICS_LOCK:
+        RECORDED_STAGES_METRICS.append(stage_metrics)
+        if METRICS_CONFIG['metrics_file_path'] is not None and METRICS_CONFIG['metrics_format'] == 'jsonl':
+            with open(METRICS_CONFIG['metrics_file_path'], 'a') as metrics_file:
+                metrics_file.write(json.dumps(stage_metrics, default=str) + '\n')
+    return None
+
+
+def measure_each_item(items:Iterable[Any],
+                      stage_name:str,
+                      rows_func:Callable[[Any], int]=None,
+                      **labels) -> Iterator[Any]:
+    """
+    Measures the stage that produces each item of an iterator (e.g. each batch of documents of a cursor, or each parsed shard),
+    as the time between asking for the item and getting it.
+
+    ## Parameters
+    items: Iterable[Any]
+        The items, they're yielded as is
+    stage_name: str
+        The name of the stage (see `measure_stage`)
+    rows_func: Callable[[Any], int], default=None
+        Function that counts the rows of an item (e.g. `len`)
+    **labels
+        The labels of the stage (see `measure_stage`)
+
+    ## Yields
+    Any
+        Each item
+    """
+    items_iterator = iter(items)
+    no_more_items = object()
+    while True:
+        with measure_stage(stage_name, **labels) as stage_metrics:
+            item = next(items_iterator, no_more_items)
+            if item is no_more_items:
+                stage_metrics['discard'] = True
+            elif rows_func is not None:
+                stage_metrics['rows'] = rows_func(item)
+        if item is no_more_items:
+            return
+        yield item
+
+
+def summarize_stages_metrics() -> List[Dict[str, Any]]:
+    """
+    Sums the metrics recorded so far per stage and labels (e.g. all the `load` stages of the `matches` table),
+    with the total rows/sec, and the highest peak RSS.
+
+    ## Returns
+    List[Dict[str, Any]]
+        A row per stage and labels, in the order they were first recorded
+    """
+    summary = {}
+    with METRICS_LOCK:
+        stages_metrics = list(RECORDED_STAGES_METRICS)
+    for stage_metrics in stages_metrics:
+        labels = {name: value for name, value in stage_metrics.items()
+                  if name not in ['rows', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'traced_peak_mb', 'rows_per_sec']}
+        summary_key = json.dumps(labels, sort_keys=True, default=str)
+        stage_summary = summary.setdefault(summary_key, {'stage': labels.pop('stage'),
+                                                         'labels': ', '.join(f'{name}={value}' for name, value in labels.items()),
+                                                         'calls': 0, 'rows': None, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                         'peak_rss_mb': None})
+        stage_summary['calls'] += 1
+        if stage_metrics['rows'] is not None:
+            stage_summary['rows'] = (stage_summary['rows'] or 0) + stage_metrics['rows']
+        stage_summary['wall_seconds'] += stage_metrics['wall_seconds']
+        stage_summary['cpu_seconds'] += stage_metrics['cpu_seconds']
+        if stage_metrics['peak_rss_mb'] is not None:
+            stage_summary['peak_rss_mb'] = max(stage_summary['peak_rss_mb'] or 0, stage_metrics['peak_rss_mb'])
+    for stage_summary in summary.values():
+        has_rows = stage_summary['rows'] is not None and stage_summary['wall_seconds'] > 0
+        stage_summary['rows_per_sec'] = round(stage_summary['rows'] / stage_summary['wall_seconds']) if has_rows else None
+        stage_summary['wall_seconds'] = round(stage_summary['wall_seconds'], 3)
+        stage_summary['cpu_seconds'] = round(stage_summary['cpu_seconds'], 3)
+    return list(summary.values())
+
+
+def format_prometheus_metrics(stages_summary:List[Dict[str, Any]]) -> str:
+    """
+    Formats the summed metrics of the stages (see `summarize_stages_metrics`) in the prometheus text exposition format,
+    a sample per stage and metric, labelled by the stage name and labels, e.g. `etl_stage_wall_seconds{stage="load",table="matches"} 0.52`
+    """
+    metrics_descriptions = {'calls': ('counter', 'Number of times the stage ran'),
+                            'rows': ('counter', 'Rows handled by the stage'),
+                            'wall_seconds': ('counter', 'Wall time spent in the stage'),
+                            'cpu_seconds': ('counter', 'CPU time spent in the stage (by the thread running it)'),
+                            'peak_rss_mb': ('gauge', 'Peak RSS of the process by the end of the stage'),
+                            'rows_per_sec': ('gauge', 'Rows handled by the stage per second of wall time')}
+    lines = []
+    for metric_name, (metric_type, metric_description) in metrics_descriptions.items():
+        lines.append(f'# HELP etl_stage_{metric_name} {metric_description}')
+        lines.append(f'# TYPE etl_stage_{metric_name} {metric_type}')
+        for stage_summary in stages_summary:
+            if stage_summary.get(metric_name) is None:
+                continue
+            labels = [('stage', stage_summary['stage'])] + [tuple(label.split('=', 1)) for label in stage_summary['labels'].split(', ') if label]
+            labels_text = ','.join(f'{name}="{value}"' for name, value in labels)
+            lines.append(f'etl_stage_{metric_name}{{{labels_text}}} {stage_summary[metric_name]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus_metrics_file() -> None:
+    """
+    Writes the metrics recorded so far to the metrics file (for the `prometheus` format), e.g. at the end of the run.
+    """
+    if METRICS_CONFIG['metrics_file_path'] is None or METRICS_CONFIG['metrics_format'] != 'prometheus':
+        return None
+    METRICS_CONFIG['metrics_file_path'].write_text(format_prometheus_metrics(summarize_stages_metrics()))
+    return None
+
+
+def report_stages_metrics() -> None:
+    """
+    Prints the summed metrics of the stages of the run (see `summarize_stages_metrics`), when there's a metrics file,
+    and writes them to it for the `prometheus` format (the `jsonl` file is already written stage by stage).
+    """
+    if METRICS_CONFIG['metrics_file_path'] is None:
+        return None
+    print(tabulate(summarize_stages_metrics(), headers='keys', tablefmt='psql'))
+    write_prometheus_metrics_file()
+    print(f'stages metrics written to {METRICS_CONFIG["metrics_file_path"]}')
+    return None
@@ -0,0 +1,95 @@
+import threading
+
+from queue import Empty, Full, Queue
+from typing import Any, Iterable, Iterator
+
+# NOTE: a pipeline stage runs an iterator (e.g. the batches of a cursor, or the parsed batches of a transform) in its own thread,
+# and hands its items over to the next stage through a bounded queue, so the stages of the ETL run concurrently:
+# the next batch is extracted while the previous one is transformed, and the one before it is loaded.
+# the queue is the backpressure, a stage blocks once the next stage is `max_queued_items` items behind,
+# so at most `max_queued_items + 1` items of each stage are in memory at a time, whatever the size of the collection.
+# the stages are chained by passing the iterator of one stage as the items of the next one (the last stage is the caller's loop),
+# the network and database drivers, and most of the json decoding and pandas work, release the GIL, so the threads overlap.
+# an error in a stage is raised again in the next stage (and so on, up to the caller), and a stage that stops consuming
+# (an error, or the caller breaking out of its loop) stops the stages before it.
+
+# the item a stage puts in its queue after its last item
+END_OF_STAGE = object()
+
+# how long a stage waits for room in its queue before checking whether the next stage stopped (in seconds)
+QUEUE_PUT_TIMEOUT = 0.1
+
+
+class StageError:
+    """
+    Wraps the exception raised by the iterator of a stage, to raise it again in the thread consuming the stage.
+    """
+    def __init__(self, exception:BaseException):
+        self.exception = exception
+
+
+def run_stage_in_thread(items:Iterable[Any], max_queued_items:int=2, stage_name:str='stage') -> Iterator[Any]:
+    """
+    Runs an iterator in a thread (see the note at the top of the module), and yields its items as they're produced.
+
+    ## Parameters
+    items: Iterable[Any]
+        The items of the stage, e.g. a generator that extracts (or transforms) batches, it's only iterated by the thread of the stage
+    max_queued_items: int, default=2
+        Number of items the stage can produce ahead of the consumer before it blocks (the size of the queue)
+    stage_name: str, default='stage'
+        The name of the stage, the name of its thread
+
+    ## Yields
+    Any
+        The items of the stage, in order
+    """
+    if max_queued_items < 1:
+        raise ValueError('max_queued_items should be a positive integer')
+    queue = Queue(maxsize=max_queued_items)
+    consumer_stopped = threading.Event()
+
+    def put(item:Any) -> bool:
+        """
+        Puts an item in the queue once there's room for it, unless the consumer stopped (returns whether it was put).
+        """
+        while not(consumer_stopped.is_set()):
+            try:
+                queue.put(item, timeout=QUEUE_PUT_TIMEOUT)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce() -> None:
+        items_iterator = iter(items)
+        try:
+            for item in items_iterator:
+                if not(put(item)):
+                    return
+            put(END_OF_STAGE)
+        except BaseException as e:
+            put(StageError(e))
+        finally:
+            # stops the stages before this one as well (a stage's iterator is the generator of the previous stage)
+            if hasattr(items_iterator, 'close'):
+                items_iterator.close()
+
+    producer_thread = threading.Thread(target=produce, name=f'{stage_name}-stage', daemon=True)
+    producer_thread.start()
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=QUEUE_PUT_TIMEOUT)
+            except Empty:
+                if not(producer_thread.is_alive()) and queue.empty():
+                    raise RuntimeError(f'the {stage_name} stage stopped without finishing')
+                continue
+            if item is END_OF_STAGE:
+                return
+            if isinstance(item, StageError):
+                raise item.exception
+            yield item
+    finally:
+        consumer_stopped.set()
+        producer_thread.join()
@@ -7,6 +7,7 @@
 
 
 from helpful_funcs import read_json_file_to_dict
+from helpful_funcs import stream_json_array_file_in_batches
 from pathlib import Path
 from typing import List
 import pymongo
@@ -63,37 +64,41 @@ def create_and_populate_matches_collection(matches_dir:Path,
             continue
 
 
+# the events and lineups json files are streamed in batches (see `stream_json_array_file_in_batches`),
+# so the memory used while porting them depends on the batch size, not on the size of the files.
 def create_and_populate_lineups_collection(lineups_dir:Path,
-                                           lineups_collection: pymongo.collection.Collection
+                                           lineups_collection: pymongo.collection.Collection,
+                                           docs_per_batch:int=1_000
                                            ) -> None:
     json_files = list(lineups_dir.glob('**/*.json'))
     json_files_count = len(json_files)
     for i, lineup_json_path in enumerate(json_files):
         try:
-            lineup_dict = read_json_file_to_dict(lineup_json_path)
-            for doc in lineup_dict:
-                doc['match_id'] = int(lineup_json_path.stem)
-            insert_many_result = lineups_collection.insert_many(documents=lineup_dict)
-            if insert_many_result.acknowledged:
-                print(f'[{i}/{json_files_count}] - documents for match {lineup_dict[0]["match_id"]} were successfully inserted into the lineups collection.')
+            for lineup_dict in stream_json_array_file_in_batches(lineup_json_path, docs_per_batch=docs_per_batch):
+                for doc in lineup_dict:
+                    doc['match_id'] = int(lineup_json_path.stem)
+                insert_many_result = lineups_collection.insert_many(documents=lineup_dict)
+                if insert_many_result.acknowledged:
+                    print(f'[{i}/{json_files_count}] - {len(lineup_dict)} documents for match {lineup_dict[0]["match_id"]} were successfully inserted into the lineups collection.')
         except Exception as e:
             print(f'***** ERROR ***** - {i}/{json_files_count} - {lineup_json_path}')
             continue
       
         
 def create_and_populate_events_collection(events_dir:Path,
-                                           events_collection: pymongo.collection.Collection
+                                           events_collection: pymongo.collection.Collection,
+                                           docs_per_batch:int=1_000
                                            ) -> None:
     json_files = list(events_dir.glob('**/*.json'))
     json_files_count = len(json_files)
     for i, event_json_path in enumerate(json_files):
         try:
-            event_dict = read_json_file_to_dict(event_json_path)
-            for doc in event_dict:
-                doc['match_id'] = int(event_json_path.stem)
-            insert_many_result = events_collection.insert_many(documents=event_dict)
-            if insert_many_result.acknowledged:
-                print(f'[{i}/{json_files_count}] - documents for match {event_dict[0]["match_id"]} were successfully inserted into the events collection.')
+            for event_dict in stream_json_array_file_in_batches(event_json_path, docs_per_batch=docs_per_batch):
+                for doc in event_dict:
+                    doc['match_id'] = int(event_json_path.stem)
+                insert_many_result = events_collection.insert_many(documents=event_dict)
+                if insert_many_result.acknowledged:
+                    print(f'[{i}/{json_files_count}] - {len(event_dict)} documents for match {event_dict[0]["match_id"]} were successfully inserted into the events collection.')
         except Exception as e:
             print(f'***** ERROR ***** - {i}/{json_files_count} - {event_json_path}')
             continue
@@ -0,0 +1,312 @@
+import json
+import pickle
+import threading
+import uuid
+import pandas as pd
+import sqlalchemy
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+from mysql_db_funcs import upload_dataframe_to_sql_table
+
+# pyarrow is needed to persist the transformed tables as parquet files (only when the run is checkpointed)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# NOTE: a checkpointed run (see `configure_run_checkpoints`) keeps everything it needs to resume in a run directory:
+# - the documents of each extracted batch (pickled, like the json cache of the files source), so a rerun doesn't download them again
+# - the tables of each transformed batch (as parquet files), so a rerun doesn't transform them again
+# - a manifest (a json lines file, the last entry of a checkpoint wins) recording the stages that are done, e.g. `extract:matches`
+# the loads are checkpointed in the MySQL database itself: the rows are committed every `checkpoint_rows` rows,
+# together with the number of rows of the table committed so far (in `LOAD_CHECKPOINTS_TABLE`, in the same transaction),
+# so a rerun resumes the load of a table right after its last committed chunk, without uploading (or skipping) a row twice.
+# a rerun with the same run directory skips the stages that are done, a new run directory starts a new run from scratch.
+
+# the configuration of the checkpoints of the current run, set by `configure_run_checkpoints`
+CHECKPOINTS_CONFIG = {'run_dir': None,
+                      'run_id': None,
+                      'checkpoint_rows': 100_000}
+
+# the last manifest entry of each checkpoint of the current run (checkpoint key -> entry)
+RUN_CHECKPOINTS = {}
+# the checkpoints are recorded from the threads of the pipeline stages as well
+CHECKPOINTS_LOCK = threading.Lock()
+
+# the table of the committed rows of each load, it isn't part of the schema, so it isn't dropped when the tables are recreated
+LOAD_CHECKPOINTS_TABLE = 'etl_load_checkpoints'
+
+MANIFEST_FILE_NAME = 'manifest.jsonl'
+
+
+def configure_run_checkpoints(run_dir:Path=None, run_parameters:Dict[str, Any]=None, checkpoint_rows:int=100_000) -> bool:
+    """
+    Configures the checkpoints of the run, and reads the checkpoints of the previous (failed) run with the same run directory.
+
+    ## Parameters
+    run_dir: Path, default=None
+        The directory of the run (its manifest, extracted batches and transformed tables), `None` disables the checkpoints
+    run_parameters: Dict[str, Any], default=None
+        The parameters that change the batches (or the tables) of the run, a run can only be resumed with the same parameters
+    checkpoint_rows: int, default=100_000
+        Number of rows of a table uploaded between two commits (and load checkpoints)
+
+    ## Returns
+    bool
+        Whether the run resumes a previous run
+    """
+    if checkpoint_rows < 1:
+        raise ValueError('checkpoint_rows should be a positive integer')
+    with CHECKPOINTS_LOCK:
+        RUN_CHECKPOINTS.clear()
+    CHECKPOINTS_CONFIG.update({'run_dir': run_dir, 'run_id': None, 'checkpoint_rows': checkpoint_rows})
+    if run_dir is None:
+        return False
+    if pa is None:
+        raise ImportError('the checkpointed runs need pyarrow, to persist the transformed tables as parquet files')
+    run_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = run_dir / MANIFEST_FILE_NAME
+    if manifest_path.exists():
+        with open(manifest_path, 'r') as manifest_file:
+            for line in manifest_file:
+                # the last line can be cut if the previous run was killed while writing it
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                RUN_CHECKPOINTS[entry['checkpoint']] = entry
+    run_parameters = json.loads(json.dumps(run_parameters or {}, default=str))
+    run_entry = RUN_CHECKPOINTS.get('run')
+    if run_entry is not None:
+        if run_entry['parameters'] != run_parameters:
+            raise ValueError(f"the run in {run_dir} was started with other parameters ({run_entry['parameters']}), "
+                             'resume it with the same parameters, or start a new run in another directory')
+        CHECKPOINTS_CONFIG['run_id'] = run_entry['run_id']
+        done_checkpoints_count = sum(entry['status'] == 'done' for entry in RUN_CHECKPOINTS.values())
+        print(f'resuming the run {run_entry["run_id"]} from {run_dir} ({done_checkpoints_count} checkpoints done)')
+        return True
+    CHECKPOINTS_CONFIG['run_id'] = uuid.uuid4().hex
+    record_checkpoint('run', status='started', run_id=CHECKPOINTS_CONFIG['run_id'], parameters=run_parameters)
+    print(f'starting the run {CHECKPOINTS_CONFIG["run_id"]} in {run_dir}')
+    return False
+
+
+def is_run_checkpointed() -> bool:
+    return CHECKPOINTS_CONFIG['run_dir'] is not None
+
+
+def is_checkpoint_done(checkpoint_key:str) -> bool:
+    """
+    Whether a stage of the run (e.g. `extract:matches`) was done by a previous run, always False when the run isn't checkpointed.
+    """
+    with CHECKPOINTS_LOCK:
+        return RUN_CHECKPOINTS.get(checkpoint_key, {}).get('status') == 'done'
+
+
+def record_checkpoint(checkpoint_key:str, status:str='done', **details) -> None:
+    """
+    Appends a checkpoint (a stage and its status, and any details, e.g. the number of batches) to the manifest of the run,
+    it's flushed right away, so it survives the run being killed. Nothing is recorded when the run isn't checkpointed.
+    """
+    if not(is_run_checkpointed()):
+        return None
+    entry = {'checkpoint': checkpoint_key, 'status': status, **details}
+    with CHECKPOINTS_LOCK, open(CHECKPOINTS_CONFIG['run_dir'] / MANIFEST_FILE_NAME, 'a') as manifest_file:
+        manifest_file.write(json.dumps(entry) + '\n')
+        manifest_file.flush()
+        RUN_CHECKPOINTS[checkpoint_key] = entry
+    return None
+
+
+def get_checkpoint_path(*path_parts:str) -> Path:
+    """
+    Gets the path of a file (or directory) of the run directory, e.g. `transform/matches/batch_00001`.
+    """
+    return CHECKPOINTS_CONFIG['run_dir'].joinpath(*path_parts)
+
+
+def checkpoint_extracted_batches(collection_name:str, get_docs_batches:Callable[[], Iterator[List[dict]]]) -> Iterator[List[dict]]:
+    """
+    Persists the extracted batches of a collection in the run directory as they're yielded,
+    or yields the persisted batches instead when a previous run extracted the whole collection.
+    The batches are yielded as is when the run isn't checkpointed.
+
+    ## Parameters
+    collection_name: str
+        The name of the collection, its checkpoint is `extract:<collection_name>`
+    get_docs_batches: Callable[[], Iterator[List[dict]]]
+        Function that starts the extraction of the batches (it isn't called when the batches are read from the run directory)
+
+    ## Yields
+    List[dict]
+        The batches of documents of the collection
+    """
+    if not(is_run_checkpointed()):
+        yield from get_docs_batches()
+        return
+    checkpoint_key = f'extract:{collection_name}'
+    if is_checkpoint_done(checkpoint_key):
+        print(f'reading the extracted {collection_name} batches from the run directory')
+        for batch_number in range(1, RUN_CHECKPOINTS[checkpoint_key]['batches'] + 1):
+            with open(get_checkpoint_path('extract', collection_name, f'batch_{batch_number:05d}.pickle'), 'rb') as batch_file:
+                yield pickle.load(batch_file)
+        return
+    get_checkpoint_path('extract', collection_name).mkdir(parents=True, exist_ok=True)
+    batches_count = 0
+    for batches_count, docs_batch in enumerate(get_docs_batches(), start=1):
+        batch_file_path = get_checkpoint_path('extract', collection_name, f'batch_{batches_count:05d}.pickle')
+        batch_file_path.with_suffix('.tmp').write_bytes(pickle.dumps(docs_batch, protocol=pickle.HIGHEST_PROTOCOL))
+        batch_file_path.with_suffix('.tmp').replace(batch_file_path)
+        yield docs_batch
+    record_checkpoint(checkpoint_key, batches=batches_count)
+
+
+def write_checkpoint_tables(checkpoint_key:str, tables_dict:Dict[str, Any], *path_parts:str) -> None:
+    """
+    Persists the tables of a transformed batch (dataframes or `pyarrow.Table`s) as parquet files in the run directory,
+    and records its checkpoint. Nothing is written when the run isn't checkpointed.
+
+    ## Parameters
+    checkpoint_key: str
+        The checkpoint of the batch, e.g. `transform:matches:1`
+    tables_dict: Dict[str, Any]
+        The tables of the batch (table name -> dataframe or `pyarrow.Table`)
+    path_parts: str
+        The directory of the batch in the run directory, e.g. `transform`, `matches`, `batch_00001`
+    """
+    if not(is_run_checkpointed()):
+        return None
+    tables_dir = get_checkpoint_path(*path_parts)
+    tables_dir.mkdir(parents=True, exist_ok=True)
+    tables_formats = {}
+    for table_name, table in tables_dict.items():
+        table_file_path = tables_dir / f'{table_name}.parquet'
+        if isinstance(table, pa.Table):
+            pq.write_table(table, table_file_path.with_suffix('.tmp'))
+            tables_formats[table_name] = 'arrow'
+        else:
+            table.to_parquet(table_file_path.with_suffix('.tmp'))
+            tables_formats[table_name] = 'pandas'
+        table_file_path.with_suffix('.tmp').replace(table_file_path)
+    record_checkpoint(checkpoint_key, tables=tables_formats)
+    return None
+
+
+def read_checkpoint_tables(checkpoint_key:str, *path_parts:str) -> Dict[str, Any]:
+    """
+    Reads the tables persisted by `write_checkpoint_tables`, as dataframes or `pyarrow.Table`s (as they were written).
+    """
+    tables_dir = get_checkpoint_path(*path_parts)
+    tables_dict = {}
+    for table_name, table_format in RUN_CHECKPOINTS[checkpoint_key]['tables'].items():
+        table_file_path = tables_dir / f'{table_name}.parquet'
+        tables_dict[table_name] = pq.read_table(table_file_path) if table_format == 'arrow' else pd.read_parquet(table_file_path)
+    return tables_dict
+
+
+def read_checkpoint_batches(collection_name:str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the tables of all the transformed batches of a collection, persisted by a previous run (see `write_checkpoint_tables`).
+    """
+    print(f'reading the transformed {collection_name} batches from the run directory')
+    for batch_number in range(1, RUN_CHECKPOINTS[f'transform:{collection_name}']['batches'] + 1):
+        yield read_checkpoint_tables(f'transform:{collection_name}:{batch_number}', 'transform', collection_name, f'batch_{batch_number:05d}')
+
+
+def finish_run_checkpoints() -> None:
+    """
+    Records the run as done in its manifest, a rerun with the same run directory then skips all its stages.
+    """
+    if not(is_run_checkpointed()):
+        return None
+    run_entry = RUN_CHECKPOINTS['run']
+    record_checkpoint('run', status='done', run_id=run_entry['run_id'], parameters=run_entry['parameters'])
+    print(f'the run {run_entry["run_id"]} is done, its checkpoints are in {CHECKPOINTS_CONFIG["run_dir"]}')
+    return None
+
+
+def create_load_checkpoints_table(connection:sqlalchemy.Connection) -> None:
+    """
+    Creates the table of the load checkpoints in the database, if it doesn't exist yet.
+    """
+    connection.execute(sqlalchemy.text(f'CREATE TABLE IF NOT EXISTS {LOAD_CHECKPOINTS_TABLE} ('
+                                       'run_id varchar(32) NOT NULL, '
+                                       'checkpoint_key varchar(255) NOT NULL, '
+                                       'committed_rows bigint NOT NULL, '
+                                       'PRIMARY KEY (run_id, checkpoint_key))'))
+    connection.commit()
+    return None
+
+
+def read_committed_rows(connection:sqlalchemy.Connection, checkpoint_key:str) -> int:
+    """
+    Reads the number of rows of a load committed by the previous runs (0 if none were).
+    """
+    committed_rows = connection.execute(sqlalchemy.text(f'SELECT committed_rows FROM {LOAD_CHECKPOINTS_TABLE} '
+                                                        'WHERE run_id = :run_id AND checkpoint_key = :checkpoint_key'),
+                                        {'run_id': CHECKPOINTS_CONFIG['run_id'], 'checkpoint_key': checkpoint_key}).scalar()
+    return committed_rows or 0
+
+
+def save_committed_rows(connection:sqlalchemy.Connection, checkpoint_key:str, committed_rows:int) -> None:
+    """
+    Saves the number of rows of a load committed so far, in the transaction of the rows (it's committed with them).
+    """
+    checkpoint_params = {'run_id': CHECKPOINTS_CONFIG['run_id'], 'checkpoint_key': checkpoint_key}
+    connection.execute(sqlalchemy.text(f'DELETE FROM {LOAD_CHECKPOINTS_TABLE} WHERE run_id = :run_id AND checkpoint_key = :checkpoint_key'),
+                       checkpoint_params)
+    connection.execute(sqlalchemy.text(f'INSERT INTO {LOAD_CHECKPOINTS_TABLE} (run_id, checkpoint_key, committed_rows) '
+                                       'VALUES (:run_id, :checkpoint_key, :committed_rows)'),
+                       {**checkpoint_params, 'committed_rows': committed_rows})
+    return None
+
+
+def upload_table_with_checkpoints(dframe:Any,
+                                  sql_table_name:str,
+                                  connection:sqlalchemy.Connection,
+                                  checkpoint_key:str,
+                                  chunksize:int=None,
+                                  strategy:str='to_sql') -> int:
+    """
+    Uploads a table (see `upload_dataframe_to_sql_table`), committing it every `checkpoint_rows` rows together with its load checkpoint,
+    and resuming it after the rows committed by the previous runs. The table is uploaded as is when the run isn't checkpointed.
+
+    ## Parameters
+    dframe: Any
+        The dataframe (or `pyarrow.Table`) to upload, it should have the same rows, in the same order, as in the previous runs
+    sql_table_name: str
+        The name of the table in the MySQL database
+    connection: sqlalchemy.Connection
+        The connection to the MySQL database
+    checkpoint_key: str
+        The checkpoint of the load, e.g. `load:matches:1` for the first batch of the matches table
+    chunksize: int, default=None
+        Passed to `upload_dataframe_to_sql_table`
+    strategy: str, default='to_sql'
+        Passed to `upload_dataframe_to_sql_table`
+
+    ## Returns
+    int
+        The number of rows uploaded by this run
+    """
+    if not(is_run_checkpointed()):
+        return upload_dataframe_to_sql_table(dframe, sql_table_name, connection, chunksize=chunksize, strategy=strategy)
+    rows_count = len(dframe)
+    committed_rows = read_committed_rows(connection, checkpoint_key)
+    if committed_rows >= rows_count and rows_count > 0:
+        print(f'skipping the load of {sql_table_name} ({checkpoint_key}), its {rows_count} rows were already committed')
+        return 0
+    if committed_rows > 0:
+        print(f'resuming the load of {sql_table_name} ({checkpoint_key}) after its first {committed_rows} committed rows')
+    uploaded_rows = 0
+    for chunk_start in range(committed_rows, rows_count, CHECKPOINTS_CONFIG['checkpoint_rows']):
+        chunk_end = min(chunk_start + CHECKPOINTS_CONFIG['checkpoint_rows'], rows_count)
+        chunk = dframe.slice(chunk_start, chunk_end - chunk_start) if isinstance(dframe, pa.Table) else dframe.iloc[chunk_start:chunk_end]
+        uploaded_rows += upload_dataframe_to_sql_table(chunk, sql_table_name, connection, chunksize=chunksize, strategy=strategy)
+        save_committed_rows(connection, checkpoint_key, chunk_end)
+        connection.commit()
+    return uploaded_rows
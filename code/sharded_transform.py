@@ -0,0 +1,140 @@
+import os
+import pandas as pd
+import pymongo.collection
+import pymongo.database
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List
+
+from mongodb_downloader import connect_to_mongo_database
+from json_data_parser_funcs import MATCHES_PROJECTION
+
+# NOTE: the matches are naturally sharded by (competition, season), so each shard can be downloaded and parsed
+# in its own process, each process opens its own mongodb connection (a client can't be shared between processes),
+# and only the parsed tables are sent back to the main process, where the lookup tables are merged and deduplicated.
+
+# the mongodb database of the current worker process, it's connected on the first shard the process downloads
+WORKER_MONGODB_DB = None
+
+
+def build_competition_season_shards_queries(collection:pymongo.collection.Collection) -> List[dict]:
+    """
+    Builds a query per (competition, season) pair in the matches collection, each query selects the matches of one shard.
+
+    ## Parameters
+    collection: pymongo.collection.Collection
+        The matches collection
+
+    ## Returns
+    List[dict]
+        The queries of the shards, sorted by competition and season
+    """
+    shards_keys = collection.aggregate([{'$group': {'_id': {'competition_id': '$competition.competition_id',
+                                                            'season_id': '$season.season_id'}}}])
+    shards_keys = sorted((shard_key['_id'].get('competition_id'), shard_key['_id'].get('season_id')) for shard_key in shards_keys)
+    return [{'competition.competition_id': competition_id, 'season.season_id': season_id}
+            for competition_id, season_id in shards_keys]
+
+
+def download_matches_shard(query:dict) -> List[dict]:
+    """
+    Downloads the matches of a shard in a worker process, over the mongodb connection of the process
+    (only the fields of the matches tables, see `MATCHES_PROJECTION`).
+    """
+    global WORKER_MONGODB_DB
+    if WORKER_MONGODB_DB is None:
+        WORKER_MONGODB_DB = connect_to_mongo_database()
+    return list(WORKER_MONGODB_DB.get_collection('matches').find(query, MATCHES_PROJECTION))
+
+
+def pack_dframes_dict(dframes_dict:Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Packs the dataframes of a dictionary into their columns values (numpy arrays), which are a lot cheaper to send between
+    processes than the dataframes themselves (no index or block manager to pickle), the other values are left as is.
+    """
+    return {table_name: ({'columns_values': {col: dframe[col].to_numpy() for col in dframe.columns}}
+                         if isinstance(dframe, pd.DataFrame) else dframe)
+            for table_name, dframe in dframes_dict.items()}
+
+
+def unpack_dframes_dict(packed_dframes_dict:Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rebuilds the dataframes packed by `pack_dframes_dict`.
+    """
+    return {table_name: (pd.DataFrame(packed_dframe['columns_values'])
+                         if isinstance(packed_dframe, dict) and 'columns_values' in packed_dframe else packed_dframe)
+            for table_name, packed_dframe in packed_dframes_dict.items()}
+
+
+def transform_shard(load_shard_func:Callable[[Any], List[dict]],
+                    parse_func:Callable[[List[dict]], Dict[str, Any]],
+                    shard:Any) -> Dict[str, Any]:
+    """
+    Loads and parses a single shard (in a worker process), and packs the parsed tables to send them back to the main process.
+    """
+    return pack_dframes_dict(parse_func(load_shard_func(shard)))
+
+
+def transform_shards_in_process_pool(shards:List[Any],
+                                     load_shard_func:Callable[[Any], List[dict]],
+                                     parse_func:Callable[[List[dict]], Dict[str, Any]],
+                                     max_workers:int=None) -> Iterator[Dict[str, Any]]:
+    """
+    This function loads and parses mutiple shards of documents in a pool of processes, one shard per task,
+    and yields the parsed tables of each shard (in the order of the shards) as soon as they're ready,
+    so they can be uploaded while the next shards are still being parsed.
+    At most `2 * max_workers` shards are parsed ahead of the one being consumed, so only a few of them are held in memory at a time.
+    The lookup tables of the shards can then be merged and deduplicated with `concat_and_deduplicate_dframes_dicts`.
+
+    ## Parameters
+    shards: List[Any]
+        The shards to transform, e.g. the queries from `build_competition_season_shards_queries`
+    load_shard_func: Callable[[Any], List[dict]]
+        Function that loads the documents of a shard in the worker process (e.g. `download_matches_shard`),
+        it has to be a module level function, so it can be sent to the worker processes
+    parse_func: Callable[[List[dict]], Dict[str, Any]]
+        Function that parses the documents of a shard into a dictionary of tables (e.g. `parse_and_process_matches_dict`),
+        it has to be a module level function as well
+    max_workers: int, default=None
+        The number of worker processes (default is the number of cores)
+
+    ## Yields
+    Dict[str, Any]
+        The parsed tables of each shard
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # at most `2 * max_workers` shards are submitted ahead of the one being consumed, so when the uploads lag behind,
+        # the workers wait instead of piling up parsed shards in memory (as in `read_files_concurrently`)
+        pending_shards = deque()
+        for shard in shards:
+            pending_shards.append(executor.submit(transform_shard, load_shard_func, parse_func, shard))
+            if len(pending_shards) >= 2 * max_workers:
+                yield unpack_dframes_dict(pending_shards.popleft().result())
+        while pending_shards:
+            yield unpack_dframes_dict(pending_shards.popleft().result())
+
+
+def transform_matches_collection_in_shards(mongodb_db:pymongo.database.Database,
+                                           parse_func:Callable[[List[dict]], Dict[str, Any]],
+                                           max_workers:int=None) -> Iterator[Dict[str, Any]]:
+    """
+    Transforms the matches collection sharded by (competition, season), with `transform_shards_in_process_pool`.
+
+    ## Parameters
+    mongodb_db: pymongo.database.Database
+        The mongodb database, only used to find the shards (the worker processes open their own connections)
+    parse_func: Callable[[List[dict]], Dict[str, Any]]
+        Function that parses the matches of a shard (e.g. `parse_and_process_matches_dict`)
+    max_workers: int, default=None
+        The number of worker processes (default is the number of cores)
+
+    ## Yields
+    Dict[str, Any]
+        The parsed tables of each shard
+    """
+    shards_queries = build_competition_season_shards_queries(mongodb_db.get_collection('matches'))
+    print(f'transforming the matches collection in {len(shards_queries)} (competition, season) shards')
+    return transform_shards_in_process_pool(shards_queries, download_matches_shard, parse_func, max_workers)
@@ -31,3 +31,51 @@ ALTER TABLE `team_managers_matches` ADD FOREIGN KEY (`team_id`) REFERENCES `team
 ALTER TABLE `team_managers_matches` ADD FOREIGN KEY (`manager_id`) REFERENCES `managers_base_data` (`manager_id`);
 
 ALTER TABLE `team_managers_matches` ADD FOREIGN KEY (`match_id`) REFERENCES `matches` (`match_id`);
+
+ALTER TABLE `events` ADD FOREIGN KEY (`match_id`) REFERENCES `matches` (`match_id`);
+
+ALTER TABLE `events` ADD FOREIGN KEY (`event_type_id`) REFERENCES `event_types` (`event_type_id`);
+
+ALTER TABLE `events` ADD FOREIGN KEY (`play_pattern_id`) REFERENCES `play_patterns` (`play_pattern_id`);
+
+ALTER TABLE `events` ADD FOREIGN KEY (`team_id`) REFERENCES `team_base_info` (`team_id`);
+
+ALTER TABLE `events` ADD FOREIGN KEY (`possession_team_id`) REFERENCES `team_base_info` (`team_id`);
+
+ALTER TABLE `events` ADD FOREIGN KEY (`position_id`) REFERENCES `positions` (`position_id`);
+
+ALTER TABLE `passes` ADD FOREIGN KEY (`event_id`) REFERENCES `events` (`event_id`);
+
+ALTER TABLE `passes` ADD FOREIGN KEY (`pass_height_id`) REFERENCES `pass_heights` (`pass_height_id`);
+
+ALTER TABLE `passes` ADD FOREIGN KEY (`pass_type_id`) REFERENCES `pass_types` (`pass_type_id`);
+
+ALTER TABLE `passes` ADD FOREIGN KEY (`body_part_id`) REFERENCES `body_parts` (`body_part_id`);
+
+ALTER TABLE `passes` ADD FOREIGN KEY (`outcome_id`) REFERENCES `event_outcomes` (`outcome_id`);
+
+ALTER TABLE `passes` ADD FOREIGN KEY (`technique_id`) REFERENCES `techniques` (`technique_id`);
+
+ALTER TABLE `shots` ADD FOREIGN KEY (`event_id`) REFERENCES `events` (`event_id`);
+
+ALTER TABLE `shots` ADD FOREIGN KEY (`shot_type_id`) REFERENCES `shot_types` (`shot_type_id`);
+
+ALTER TABLE `shots` ADD FOREIGN KEY (`body_part_id`) REFERENCES `body_parts` (`body_part_id`);
+
+ALTER TABLE `shots` ADD FOREIGN KEY (`outcome_id`) REFERENCES `event_outcomes` (`outcome_id`);
+
+ALTER TABLE `shots` ADD FOREIGN KEY (`technique_id`) REFERENCES `techniques` (`technique_id`);
+
+ALTER TABLE `carries` ADD FOREIGN KEY (`event_id`) REFERENCES `events` (`event_id`);
+
+ALTER TABLE `related_events` ADD FOREIGN KEY (`event_id`) REFERENCES `events` (`event_id`);
+
+ALTER TABLE `players` ADD FOREIGN KEY (`country_id`) REFERENCES `countries` (`country_id`);
+
+ALTER TABLE `match_lineups` ADD FOREIGN KEY (`player_id`) REFERENCES `players` (`player_id`);
+
+ALTER TABLE `player_positions` ADD FOREIGN KEY (`player_id`) REFERENCES `players` (`player_id`);
+
+ALTER TABLE `player_positions` ADD FOREIGN KEY (`position_id`) REFERENCES `positions` (`position_id`);
+
+ALTER TABLE `player_cards` ADD FOREIGN KEY (`player_id`) REFERENCES `players` (`player_id`);
@@ -10,6 +10,24 @@ DROP TABLE IF EXISTS `referees`;
 DROP TABLE IF EXISTS `competition_stages`;
 DROP TABLE IF EXISTS `matches`;
 DROP TABLE IF EXISTS `team_managers_matches`;
+DROP TABLE IF EXISTS `events`;
+DROP TABLE IF EXISTS `passes`;
+DROP TABLE IF EXISTS `shots`;
+DROP TABLE IF EXISTS `carries`;
+DROP TABLE IF EXISTS `related_events`;
+DROP TABLE IF EXISTS `event_types`;
+DROP TABLE IF EXISTS `play_patterns`;
+DROP TABLE IF EXISTS `positions`;
+DROP TABLE IF EXISTS `pass_heights`;
+DROP TABLE IF EXISTS `pass_types`;
+DROP TABLE IF EXISTS `shot_types`;
+DROP TABLE IF EXISTS `body_parts`;
+DROP TABLE IF EXISTS `event_outcomes`;
+DROP TABLE IF EXISTS `techniques`;
+DROP TABLE IF EXISTS `players`;
+DROP TABLE IF EXISTS `match_lineups`;
+DROP TABLE IF EXISTS `player_positions`;
+DROP TABLE IF EXISTS `player_cards`;
 SET foreign_key_checks = 1;
 
 -- creation of the database schema
@@ -88,6 +106,161 @@ CREATE TABLE `team_managers_matches` (
   `match_id` int
 );
 
+CREATE TABLE `events` (
+  `event_id` varchar(36) PRIMARY KEY,
+  `match_id` int NOT NULL,
+  `event_index` int NOT NULL,
+  `period` tinyint,
+  `event_timestamp` time(3),
+  `minute` int,
+  `second` int,
+  `event_type_id` int NOT NULL,
+  `possession` int,
+  `possession_team_id` int,
+  `play_pattern_id` int,
+  `team_id` int,
+  `player_id` int,
+  `position_id` int,
+  `location_x` float,
+  `location_y` float,
+  `duration` float,
+  `is_under_pressure` tinyint,
+  `is_counterpress` tinyint,
+  `is_off_camera` tinyint,
+  `is_out` tinyint
+);
+
+CREATE TABLE `passes` (
+  `event_id` varchar(36) PRIMARY KEY,
+  `recipient_player_id` int,
+  `pass_length` float,
+  `pass_angle` float,
+  `pass_height_id` int,
+  `end_location_x` float,
+  `end_location_y` float,
+  `body_part_id` int,
+  `pass_type_id` int,
+  `outcome_id` int,
+  `technique_id` int,
+  `assisted_shot_id` varchar(36),
+  `is_cross` tinyint,
+  `is_switch` tinyint,
+  `is_through_ball` tinyint,
+  `is_cut_back` tinyint,
+  `is_aerial_won` tinyint,
+  `is_shot_assist` tinyint,
+  `is_goal_assist` tinyint
+);
+
+CREATE TABLE `shots` (
+  `event_id` varchar(36) PRIMARY KEY,
+  `statsbomb_xg` float,
+  `end_location_x` float,
+  `end_location_y` float,
+  `end_location_z` float,
+  `key_pass_id` varchar(36),
+  `body_part_id` int,
+  `shot_type_id` int,
+  `outcome_id` int,
+  `technique_id` int,
+  `is_first_time` tinyint,
+  `is_one_on_one` tinyint,
+  `is_aerial_won` tinyint,
+  `is_open_goal` tinyint,
+  `is_deflected` tinyint
+);
+
+CREATE TABLE `carries` (
+  `event_id` varchar(36) PRIMARY KEY,
+  `end_location_x` float,
+  `end_location_y` float
+);
+
+CREATE TABLE `related_events` (
+  `event_id` varchar(36) NOT NULL,
+  `related_event_id` varchar(36) NOT NULL
+);
+
+CREATE TABLE `event_types` (
+  `event_type_id` int PRIMARY KEY,
+  `event_type_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `play_patterns` (
+  `play_pattern_id` int PRIMARY KEY,
+  `play_pattern_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `positions` (
+  `position_id` int PRIMARY KEY,
+  `position_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `pass_heights` (
+  `pass_height_id` int PRIMARY KEY,
+  `pass_height_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `pass_types` (
+  `pass_type_id` int PRIMARY KEY,
+  `pass_type_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `shot_types` (
+  `shot_type_id` int PRIMARY KEY,
+  `shot_type_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `body_parts` (
+  `body_part_id` int PRIMARY KEY,
+  `body_part_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `event_outcomes` (
+  `outcome_id` int PRIMARY KEY,
+  `outcome_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `techniques` (
+  `technique_id` int PRIMARY KEY,
+  `technique_name` varchar(255) NOT NULL
+);
+
+CREATE TABLE `players` (
+  `player_id` int PRIMARY KEY,
+  `player_name` varchar(255) NOT NULL,
+  `player_nickname` varchar(255),
+  `country_id` int
+);
+
+CREATE TABLE `match_lineups` (
+  `match_id` int NOT NULL,
+  `team_id` int NOT NULL,
+  `player_id` int NOT NULL,
+  `jersey_number` int
+);
+
+CREATE TABLE `player_positions` (
+  `match_id` int NOT NULL,
+  `player_id` int NOT NULL,
+  `position_id` int NOT NULL,
+  `from_time` varchar(8),
+  `to_time` varchar(8),
+  `from_period` tinyint,
+  `to_period` tinyint,
+  `start_reason` varchar(255),
+  `end_reason` varchar(255)
+);
+
+CREATE TABLE `player_cards` (
+  `match_id` int NOT NULL,
+  `player_id` int NOT NULL,
+  `card_time` varchar(8),
+  `card_type` varchar(255) NOT NULL,
+  `card_reason` varchar(255),
+  `period` tinyint
+);
+
 /*------------------------------------------------------------------------*/
 
 -- Adding comments to the tables
@@ -109,4 +282,40 @@ ALTER TABLE `competition_stages` COMMENT = 'this table is a lookup table for the
 
 ALTER TABLE `matches` COMMENT = 'this table contains data about all the matches in the database';
 
-ALTER TABLE `team_managers_matches` COMMENT = 'this is a lookup table to show which managers managed which teams in which matches';
\ No newline at end of file
+ALTER TABLE `team_managers_matches` COMMENT = 'this is a lookup table to show which managers managed which teams in which matches';
+
+ALTER TABLE `events` COMMENT = 'this table contains data about all the events (passes, shots, carries, pressures, etc.) in each match';
+
+ALTER TABLE `passes` COMMENT = 'this table contains the details of the pass events';
+
+ALTER TABLE `shots` COMMENT = 'this table contains the details of the shot events';
+
+ALTER TABLE `carries` COMMENT = 'this table contains the end location of the carry events';
+
+ALTER TABLE `related_events` COMMENT = 'this is a lookup table to show which events are related to each other, e.g. a pass and its ball receipt';
+
+ALTER TABLE `event_types` COMMENT = 'this is a lookup table for the different types of events, e.g. pass, shot, carry, etc.';
+
+ALTER TABLE `play_patterns` COMMENT = 'this is a lookup table for the play pattern an event is part of, e.g. regular play, from corner, etc.';
+
+ALTER TABLE `positions` COMMENT = 'this is a lookup table for the positions a player can play in';
+
+ALTER TABLE `pass_heights` COMMENT = 'this is a lookup table for the height of a pass, e.g. ground pass, high pass, etc.';
+
+ALTER TABLE `pass_types` COMMENT = 'this is a lookup table for the types of passes, e.g. corner, free kick, throw-in, etc.';
+
+ALTER TABLE `shot_types` COMMENT = 'this is a lookup table for the types of shots, e.g. open play, penalty, etc.';
+
+ALTER TABLE `body_parts` COMMENT = 'this is a lookup table for the body part used in a pass or a shot';
+
+ALTER TABLE `event_outcomes` COMMENT = 'this is a lookup table for the outcomes of passes and shots, e.g. incomplete, goal, saved, etc.';
+
+ALTER TABLE `techniques` COMMENT = 'this is a lookup table for the technique used in a pass or a shot, e.g. through ball, volley, etc.';
+
+ALTER TABLE `players` COMMENT = 'this table contains basic data about all the players that appeared in a lineup';
+
+ALTER TABLE `match_lineups` COMMENT = 'this is a lookup table to show which players were in the lineup of which teams in which matches';
+
+ALTER TABLE `player_positions` COMMENT = 'this table contains the positions each player played in each match, and when they started and stopped playing in them';
+
+ALTER TABLE `player_cards` COMMENT = 'this table contains the cards (yellow, red, etc.) each player received in each match';
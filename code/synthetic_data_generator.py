@@ -0,0 +1,295 @@
+# This module generates synthetic statsbomb-shaped documents at any scale of the sample data (1x is the sample itself),
+# for benchmarking the ETL on volumes the sample doesn't have (see benchmark_etl.py), or writes them in the layout of the data directory,
+# so they can be read by the files source, or ported to mongodb with mongodb_bootstrap.py, e.g.:
+#   python synthetic_data_generator.py --scale 100 --output-dir ../synthetic_data
+# each copy of the sample is made from the sample documents themselves, so it has exactly the same nested shape (and the same
+# optional and missing fields), only the ids are remapped (new seasons, matches and events), and the scores are drawn at random.
+# the documents only depend on the seed and the scale (the random draws of each file of each copy are seeded by both),
+# so two runs with the same parameters generate the same documents.
+
+
+import argparse
+import json
+import pickle
+import random
+import uuid
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from local_file_source import DEFAULT_DATA_DIR
+from local_file_source import LOCAL_COLLECTIONS_FILES_PATTERNS
+from local_file_source import MATCH_ID_FROM_FILE_NAME_COLLECTIONS
+from local_file_source import garbage_collector_paused
+from local_file_source import get_local_collection_file_paths
+from local_file_source import read_collection_file_documents
+
+SYNTHETIC_COLLECTIONS = list(LOCAL_COLLECTIONS_FILES_PATTERNS.keys())
+
+# the years of the seasons of each copy of the sample are shifted by this many years from the previous copy,
+# (every copy already has its own seasons through the remapped season ids), a year per copy keeps the season names
+# parsed as 4 digits years even at 1000x the sample (the last sample season 2022 ends up as 3021)
+SEASONS_YEARS_SHIFT_PER_COPY = 1
+
+# the fields of the events that hold the ids of other events of the same match, remapped with the ids of the events
+EVENTS_IDS_REFERENCES_PATHS = [('pass', 'assisted_shot_id'), ('shot', 'key_pass_id')]
+
+
+def read_template_files(collection_name:str, data_dir:Path=None) -> List[Tuple[Path, bytes]]:
+    """
+    Reads the json files of a collection in the sample data, the templates of the synthetic documents,
+    the documents of each file are kept pickled, so every copy unpickles its own fresh documents (a lot faster than deep copies).
+
+    ## Returns
+    List[Tuple[Path, bytes]]
+        The path of each file and its pickled documents
+    """
+    return [(file_path, pickle.dumps(read_collection_file_documents(collection_name, file_path), protocol=pickle.HIGHEST_PROTOCOL))
+            for file_path in get_local_collection_file_paths(collection_name, data_dir)]
+
+
+def get_template_ids(data_dir:Path=None) -> Dict[str, List[int]]:
+    """
+    Gets the (sorted) match ids and season ids of the sample data, the synthetic ids of each copy are numbered after the largest ones
+    (see `build_synthetic_ids_map`), the match ids of the events and lineups files are included, as some of them have no match document.
+    """
+    match_ids = set(int(file_path.stem) for collection_name in MATCH_ID_FROM_FILE_NAME_COLLECTIONS
+                    for file_path in get_local_collection_file_paths(collection_name, data_dir))
+    season_ids = set()
+    for file_path in get_local_collection_file_paths('matches', data_dir):
+        season_ids.add(int(file_path.stem))
+        match_ids.update(match_dict['match_id'] for match_dict in read_collection_file_documents('matches', file_path))
+    for competition_dict in read_collection_file_documents('competitions', get_local_collection_file_paths('competitions', data_dir)[0]):
+        season_ids.add(competition_dict['season_id'])
+    return {'match_ids': sorted(match_ids), 'season_ids': sorted(season_ids)}
+
+
+def build_synthetic_ids_map(template_ids:List[int], copy_number:int) -> Dict[int, int]:
+    """
+    Maps the ids of the matches (or seasons) of the sample to their ids in a copy of the sample, the first copy (0) is the sample itself,
+    the ids of the next copies are numbered right after the largest id of the sample, in the order of the sample ids,
+    so they're dense (they fit in the `int` columns of the database even at 1000x the sample).
+
+    ## Parameters
+    template_ids: List[int]
+        The (sorted) ids of the sample
+    copy_number: int
+        The number of the copy of the sample, starting from 0
+
+    ## Returns
+    Dict[int, int]
+        Dictionary mapping each id of the sample to its id in the copy
+    """
+    if copy_number == 0:
+        return {template_id: template_id for template_id in template_ids}
+    first_id = template_ids[-1] + (copy_number - 1) * len(template_ids) + 1
+    return {template_id: first_id + rank for rank, template_id in enumerate(template_ids)}
+
+
+def shift_season_name(season_name:str, years:int) -> str:
+    """
+    Shifts the years of a season name, e.g. `2017/2018` -> `2018/2019` (or `2022` -> `2023`).
+    """
+    return '/'.join(str(int(year) + years) for year in season_name.split('/'))
+
+
+def generate_synthetic_competitions(template_competitions:List[dict],
+                                    copy_number:int,
+                                    seasons_ids_map:Dict[int, int]) -> List[dict]:
+    """
+    Generates the competitions documents of a copy of the sample, every (competition, season) gets a new season.
+    """
+    if copy_number == 0:
+        return template_competitions
+    for competition_dict in template_competitions:
+        competition_dict['season_id'] = seasons_ids_map[competition_dict['season_id']]
+        competition_dict['season_name'] = shift_season_name(competition_dict['season_name'], copy_number * SEASONS_YEARS_SHIFT_PER_COPY)
+    return template_competitions
+
+
+def generate_synthetic_matches(template_matches:List[dict],
+                               copy_number:int,
+                               matches_ids_map:Dict[int, int],
+                               seasons_ids_map:Dict[int, int],
+                               rng:random.Random) -> List[dict]:
+    """
+    Generates the matches documents of a (competition, season) file of a copy of the sample,
+    they're the matches of the new season of the copy (see `generate_synthetic_competitions`), with new scores.
+    """
+    if copy_number == 0:
+        return template_matches
+    for match_dict in template_matches:
+        match_dict['match_id'] = matches_ids_map[match_dict['match_id']]
+        match_dict['season']['season_id'] = seasons_ids_map[match_dict['season']['season_id']]
+        match_dict['season']['season_name'] = shift_season_name(match_dict['season']['season_name'], copy_number * SEASONS_YEARS_SHIFT_PER_COPY)
+        if match_dict.get('home_score') is not None:
+            match_dict['home_score'] = rng.randint(0, 5)
+        if match_dict.get('away_score') is not None:
+            match_dict['away_score'] = rng.randint(0, 5)
+    return template_matches
+
+
+def generate_synthetic_events(template_events:List[dict],
+                              copy_number:int,
+                              match_id:int,
+                              rng:random.Random) -> List[dict]:
+    """
+    Generates the events documents of a match of a copy of the sample, every event gets a new (random) id,
+    and the references to the other events of the match (the related events, the assisted shot and the key pass) are remapped.
+    """
+    if copy_number == 0:
+        return template_events
+    events_ids = {event['id']: str(uuid.UUID(int=rng.getrandbits(128), version=4)) for event in template_events}
+    for event in template_events:
+        event['id'] = events_ids[event['id']]
+        event['match_id'] = match_id
+        if 'related_events' in event:
+            event['related_events'] = [events_ids.get(related_event_id, related_event_id) for related_event_id in event['related_events']]
+        for parent_field, id_field in EVENTS_IDS_REFERENCES_PATHS:
+            if id_field in event.get(parent_field, {}):
+                event[parent_field][id_field] = events_ids.get(event[parent_field][id_field], event[parent_field][id_field])
+    return template_events
+
+
+def generate_synthetic_collection(collection_name:str,
+                                  scale:int=1,
+                                  seed:int=0,
+                                  data_dir:Path=None) -> Iterator[List[dict]]:
+    """
+    Generates the documents of a collection at `scale` times the sample data (one copy of the sample after the other),
+    one file at a time (the documents of one file of the sample in one copy), so the whole collection is never held in memory.
+
+    ## Parameters
+    collection_name: str
+        One of `SYNTHETIC_COLLECTIONS`
+    scale: int, default=1
+        Number of copies of the sample, 1 is the sample itself
+    seed: int, default=0
+        Seed of the random draws (scores and event ids)
+    data_dir: Path, default=None
+        The data directory of the sample (default is the data directory of the repo)
+
+    ## Yields
+    List[dict]
+        The documents of a file of a copy of the sample (with the `match_id` field for the events and lineups)
+    """
+    if collection_name not in SYNTHETIC_COLLECTIONS:
+        raise ValueError(f'unknown collection {collection_name}, should be one of {SYNTHETIC_COLLECTIONS}')
+    if scale < 1:
+        raise ValueError('scale should be a positive integer')
+    template_ids = get_template_ids(data_dir)
+    template_files = read_template_files(collection_name, data_dir)
+    for copy_number in range(scale):
+        matches_ids_map = build_synthetic_ids_map(template_ids['match_ids'], copy_number)
+        seasons_ids_map = build_synthetic_ids_map(template_ids['season_ids'], copy_number)
+        for file_path, template_documents in template_files:
+            # each file of each copy has its own random draws, so they don't depend on the collections (or files) generated before
+            rng = random.Random(f'{seed}:{collection_name}:{file_path.parent.name}/{file_path.name}:{copy_number}')
+            with garbage_collector_paused():
+                documents = pickle.loads(template_documents)
+            if collection_name == 'competitions':
+                yield generate_synthetic_competitions(documents, copy_number, seasons_ids_map)
+            elif collection_name == 'matches':
+                yield generate_synthetic_matches(documents, copy_number, matches_ids_map, seasons_ids_map, rng)
+            else:
+                match_id = matches_ids_map[int(file_path.stem)]
+                if collection_name == 'events':
+                    yield generate_synthetic_events(documents, copy_number, match_id, rng)
+                else:
+                    for lineup_dict in documents:
+                        lineup_dict['match_id'] = match_id
+                    yield documents
+
+
+def stream_synthetic_collection_in_batches(collection_name:str,
+                                           scale:int=1,
+                                           seed:int=0,
+                                           data_dir:Path=None,
+                                           docs_per_batch:int=5_000) -> Iterator[List[dict]]:
+    """
+    Streams the synthetic documents of a collection in batches (see `generate_synthetic_collection`),
+    the synthetic counterpart of `stream_collection_in_batches`.
+
+    ## Yields
+    List[dict]
+        Batch of (at most `docs_per_batch`) documents of the collection
+    """
+    if docs_per_batch < 1:
+        raise ValueError('docs_per_batch should be a positive integer')
+    docs_batch = []
+    for documents in generate_synthetic_collection(collection_name, scale=scale, seed=seed, data_dir=data_dir):
+        for doc in documents:
+            docs_batch.append(doc)
+            if len(docs_batch) == docs_per_batch:
+                yield docs_batch
+                docs_batch = []
+    if docs_batch:
+        yield docs_batch
+
+
+def write_synthetic_data_dir(output_dir:Path,
+                             scale:int=1,
+                             seed:int=0,
+                             collections_names:List[str]=None,
+                             data_dir:Path=None) -> Dict[str, int]:
+    """
+    Writes the synthetic documents of the collections as json files, in the same layout as the data directory
+    (competitions.json, matches/<competition_id>/<season_id>.json, events/<match_id>.json and lineups/<match_id>.json).
+
+    ## Parameters
+    output_dir: Path
+        The directory of the synthetic data, it can then be used as the data directory of the files source
+    scale: int, default=1
+        Number of copies of the sample
+    seed: int, default=0
+        Seed of the random draws
+    collections_names: List[str], default=None
+        The collections to generate (default is all of them)
+    data_dir: Path, default=None
+        The data directory of the sample (default is the data directory of the repo)
+
+    ## Returns
+    Dict[str, int]
+        The number of documents written per collection
+    """
+    docs_counts = {}
+    for collection_name in collections_names or SYNTHETIC_COLLECTIONS:
+        docs_counts[collection_name] = 0
+        competitions_dicts = []
+        for documents in generate_synthetic_collection(collection_name, scale=scale, seed=seed, data_dir=data_dir):
+            docs_counts[collection_name] += len(documents)
+            if collection_name == 'competitions':
+                # the competitions of all the copies are in a single file
+                competitions_dicts.extend(documents)
+                continue
+            if collection_name == 'matches':
+                file_path = output_dir / 'matches' / str(documents[0]['competition']['competition_id']) / f"{documents[0]['season']['season_id']}.json"
+            else:
+                # the match id is in the name of the file, not in its documents (it's added while reading them)
+                match_id = documents[0]['match_id']
+                for doc in documents:
+                    del doc['match_id']
+                file_path = output_dir / collection_name / f'{match_id}.json'
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as json_file:
+                json.dump(documents, json_file, ensure_ascii=False)
+        if collection_name == 'competitions':
+            output_dir.mkdir(parents=True, exist_ok=True)
+            with open(output_dir / 'competitions.json', 'w', encoding='utf-8') as json_file:
+                json.dump(competitions_dicts, json_file, ensure_ascii=False)
+        print(f'wrote {docs_counts[collection_name]} {collection_name} documents to {output_dir}')
+    return docs_counts
+
+
+if __name__ == '__main__':
+    args_parser = argparse.ArgumentParser(description='generate synthetic statsbomb json files at a scale of the sample data')
+    args_parser.add_argument('--output-dir', type=Path, required=True)
+    args_parser.add_argument('--scale', type=int, default=1,
+                             help='number of copies of the sample data, 1 is the sample itself')
+    args_parser.add_argument('--seed', type=int, default=0)
+    args_parser.add_argument('--collections', nargs='+', choices=SYNTHETIC_COLLECTIONS, default=SYNTHETIC_COLLECTIONS)
+    args_parser.add_argument('--data-dir', type=Path, default=DEFAULT_DATA_DIR,
+                             help='data directory of the sample data')
+    args = args_parser.parse_args()
+    write_synthetic_data_dir(args.output_dir, scale=args.scale, seed=args.seed,
+                             collections_names=args.collections, data_dir=args.data_dir)
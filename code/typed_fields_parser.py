@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+from typing import Callable, Tuple
+
+# NOTE: the typed fields of the documents (dates, times, season names) are strings that repeat a lot within a batch,
+# e.g. a few hundred distinct match dates for thousands of matches, or the same kick off times and dates of birth over and over.
+# so each distinct string is parsed once (see `parse_repeated_strings`) and the parsed values are broadcast back to the rows,
+# and the parsing itself is vectorized (the pandas str accessor, `pd.to_datetime` and `pd.to_timedelta` on whole columns),
+# instead of splitting, concatenating or converting the values one row at a time with `apply`.
+
+# a season name is either a single year (e.g. `2020`, for the competitions played in a calendar year) or two years (e.g. `2020/2021`)
+SEASON_NAME_PATTERN = r'^\s*(\d+)\s*(?:/\s*(\d+))?\s*$'
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def parse_repeated_strings(values:pd.Series, parse_func:Callable[[pd.Series], pd.Series]) -> pd.Series:
+    """
+    Parses a column of repeated strings by parsing each distinct (non missing) value once, and broadcasting the parsed values back to the rows.
+
+    ## Parameters
+    values: pd.Series
+        The strings to parse (missing values stay missing)
+    parse_func: Callable[[pd.Series], pd.Series]
+        A vectorized function that parses a series of strings (e.g. `pd.to_timedelta`)
+
+    ## Returns
+    pd.Series
+        The parsed values, with the same index as `values`
+    """
+    codes, distinct_values = pd.factorize(values)
+    parsed_distinct_values = parse_func(pd.Series(distinct_values, dtype=object))
+    # the missing values get the code -1, an extra missing value is appended so they're taken from it
+    parsed_distinct_values = pd.concat([parsed_distinct_values, parsed_distinct_values.iloc[:0].reindex([len(distinct_values)])],
+                                       ignore_index=True)
+    codes = np.where(codes == -1, len(distinct_values), codes)
+    return pd.Series(parsed_distinct_values.to_numpy()[codes], index=values.index, name=values.name)
+
+
+def parse_dates(values:pd.Series, date_format:str=DATE_FORMAT) -> pd.Series:
+    """
+    Parses a column of date strings (e.g. `1972-06-23`) into a `datetime64[ns]` column.
+    """
+    return parse_repeated_strings(values, lambda distinct_values: pd.to_datetime(distinct_values, format=date_format))
+
+
+def parse_distinct_clock_times(clock_times:pd.Series) -> pd.Series:
+    """
+    Parses clock times with `pd.to_timedelta`, the `mm:ss` ones are prefixed with zero hours first,
+    so both the times of the day and the times since the start of a match (e.g. `92:30`, whose minutes go past 59) are parsed.
+    """
+    is_minutes_and_seconds = clock_times.str.count(':') == 1
+    if is_minutes_and_seconds.any():
+        clock_times = clock_times.where(~is_minutes_and_seconds, '00:' + clock_times)
+    return pd.to_timedelta(clock_times)
+
+
+def parse_clock_times(values:pd.Series) -> pd.Series:
+    """
+    Parses a column of clock times (e.g. `20:00:00`, `20:00:00.000`, `00:12:34.567` or `92:30`) into a `timedelta64[ns]` column.
+    """
+    return parse_repeated_strings(values, parse_distinct_clock_times)
+
+
+def combine_dates_and_times(dates:pd.Series, times:pd.Series) -> pd.Series:
+    """
+    Combines a column of date strings and a column of time strings (e.g. `match_date` and `kick_off`) into a `datetime64[ns]` column,
+    by adding the parsed times to the parsed dates, instead of parsing the concatenated strings.
+    The fractions of a second are dropped (e.g. `20:00:00.000`), as the datetime columns of the database don't have them.
+    The rows missing the date or the time are missing.
+
+    ## Parameters
+    dates: pd.Series
+        The date strings (e.g. `2018-04-14`)
+    times: pd.Series
+        The time strings (e.g. `16:15:00`)
+
+    ## Returns
+    pd.Series
+        The combined datetimes
+    """
+    return (parse_dates(dates) + parse_clock_times(times)).dt.floor('s')
+
+
+def parse_season_years(season_names:pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Extracts the start and end years of the seasons from their names, e.g. `2020/2021` -> (2020, 2021), or `2020` -> (2020, 2020).
+
+    ## Parameters
+    season_names: pd.Series
+        The season names
+
+    ## Returns
+    Tuple[pd.Series, pd.Series]
+        The start years and the end years of the seasons (integers)
+    """
+    # the seasons repeat a lot, so only the distinct names are parsed
+    codes, distinct_season_names = pd.factorize(season_names)
+    season_years = pd.Series(distinct_season_names, dtype=object).str.extract(SEASON_NAME_PATTERN)
+    if (codes == -1).any() or season_years[0].isna().any():
+        raise ValueError(f'unexpected season names {season_names[~season_names.isin(distinct_season_names[season_years[0].notna()])].unique().tolist()}')
+    start_years = season_years[0].astype(int).to_numpy()[codes]
+    end_years = season_years[1].fillna(season_years[0]).astype(int).to_numpy()[codes]
+    return pd.Series(start_years, index=season_names.index), pd.Series(end_years, index=season_names.index)